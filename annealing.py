@@ -0,0 +1,270 @@
+import math
+import time
+import random
+
+from game_logic import Equation, EquationCatalogue, BitboardGrid, equation_profile, compile_expression
+from csp_generator import SlotTemplate, matching_equations
+
+
+class AnnealingGenerator:
+    # Стохастический локальный поиск для очень больших сеток (31x31, 51x51 и больше).
+    # Шаблон слотов фиксирован, переменные - числа в клетках и операторы в слотах.
+    # Функция ошибки - число неверных уравнений. Мутация заменяет одно неверное
+    # уравнение (min-conflicts) и затрагивает только его и уравнения, пересекающие
+    # изменённые клетки, поэтому пересчитываются только они. Ухудшения принимаются
+    # с вероятностью exp(-delta / T). При застое окрестность неверных уравнений
+    # встряхивается, а после исчерпания встрясок поиск перезапускается с новым шаблоном.
+    def __init__(self, difficulty, size, density=1.0, steps_per_slot=200, stall_steps_per_slot=5,
+                 min_stall_steps=500, kicks=50, time_budget=None, restarts=3, start_temperature=0.5,
+                 min_temperature=0.05, cooling=0.999, drop_rate=0.1, sample_tries=50, rng=random):
+        self.difficulty = difficulty
+        self.size = size
+        self.density = density
+        self.steps_per_slot = steps_per_slot
+        self.stall_steps_per_slot = stall_steps_per_slot
+        self.min_stall_steps = min_stall_steps
+        self.kicks = kicks
+        self.time_budget = time_budget
+        self.restarts = restarts
+        self.start_temperature = start_temperature
+        self.min_temperature = min_temperature
+        self.cooling = cooling
+        self.drop_rate = drop_rate
+        self.sample_tries = sample_tries
+        self.rng = rng
+
+        self.catalogue = EquationCatalogue.for_difficulty(difficulty)
+        self.allowed_ops, op_counts, self.max_val = equation_profile(difficulty)
+        self.lengths = sorted(2 * n + 3 for n in op_counts if 2 * n + 3 <= size)
+        self.steps = 0
+        self.attempts = 0
+        self.kicked = 0
+
+    def generate(self):
+        # Возвращает BitboardGrid, в которой верны все уравнения, или None
+        deadline = time.perf_counter() + self.time_budget if self.time_budget else None
+        self.steps = 0
+        self.attempts = 0
+        self.kicked = 0
+        if not self.lengths:
+            return None
+        for _ in range(self.restarts + 1):
+            self.attempts += 1
+            template = SlotTemplate.lattice(self.size, self.lengths, self.rng)
+            count = max(1, int(len(template.slots) * self.density))
+            template = template.connected_subset(count, self.rng)
+            if self._anneal(template, deadline):
+                return self._build_grid(template)
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+        return None
+
+    def _build_grid(self, template):
+        grid = BitboardGrid(self.size)
+        for index, slot in enumerate(template.slots):
+            nums = [self.values[cell] for cell in slot.cells[0:slot.length - 1:2]]
+            parts = [nums[0]]
+            for op, n in zip(self.ops[index], nums[1:]):
+                parts += [op, n]
+            eq = Equation(parts, self.values[slot.cells[-1]])
+            if not grid.can_place(eq, slot.r, slot.c, slot.direction):
+                return None
+            grid.place_equation(eq, slot.r, slot.c, slot.direction)
+        return grid
+
+    def _lhs(self, index):
+        # Значение левой части слота или None, если операнд вне диапазона
+        # или деление не нацело (как в Equation.generate)
+        slot = self._slots[index]
+        values = self.values
+        max_val = self.max_val
+        nums = [values[cell] for cell in slot.cells[0:slot.length - 1:2]]
+        term = nums[0]
+        if not 1 <= term <= max_val:
+            return None
+        for op, n in zip(self.ops[index], nums[1:]):
+            if not 1 <= n <= max_val:
+                return None
+            if op == '*':
+                term *= n
+            elif op == '/':
+                if term % n:
+                    return None
+                term //= n
+            else:
+                term = n
+        return compile_expression(tuple(self.ops[index]))(nums)
+
+    def _is_valid(self, index):
+        lhs = self._lhs(index)
+        return lhs is not None and lhs > 0 and lhs == self.values[self._slots[index].cells[-1]]
+
+    def _set_valid(self, index, valid):
+        # Множество неверных слотов: список + позиции для случайного выбора за O(1)
+        pos = self._invalid_pos.get(index)
+        if valid and pos is not None:
+            last = self._invalid[-1]
+            self._invalid[pos] = last
+            self._invalid_pos[last] = pos
+            self._invalid.pop()
+            del self._invalid_pos[index]
+        elif not valid and pos is None:
+            self._invalid_pos[index] = len(self._invalid)
+            self._invalid.append(index)
+
+    def _resample(self, index, keep):
+        # Новое уравнение для слота из каталога: совпадает с текущими значениями
+        # в keep случайно выбранных общих клетках, остальные клетки меняются.
+        # Если клетка результата служит операндом другого слота, результат не больше max_val.
+        # Вместо полного отбора по индексу пробуем случайные строки самой маленькой корзины.
+        rng = self.rng
+        slot = self._slots[index]
+        length = slot.length
+        shared = self._shared[index]
+        if keep < len(shared):
+            shared = rng.sample(shared, keep)
+        constraints = sorted((k, self.values[slot.cells[k]]) for k in shared)
+        limit = self.max_val if self._bounded[index] else None
+        table = self.catalogue.tables[length]
+
+        if sum(1 for k, _ in constraints if k != length - 1) == (length - 1) // 2:
+            found = [eq for eq in matching_equations(self.catalogue, constraints, length)
+                     if limit is None or eq.result <= limit]
+            return rng.choice(found) if found else None
+
+        if constraints:
+            rows = min((self.catalogue.find(value, k, length) for k, value in constraints), key=len)
+            if not len(rows):
+                return None
+        else:
+            rows = range(len(table))
+        checks = [(table.column(k), value) for k, value in constraints]
+        results = table.results
+        if len(rows) <= self.sample_tries * 4:
+            # Маленькая корзина - точный отбор дешевле случайных попыток
+            rows = [row for row in rows if all(column[row] == value for column, value in checks)
+                    and (limit is None or results[row] <= limit)]
+            return table.equation(rng.choice(rows)) if rows else None
+        draw = rng.random
+        for _ in range(self.sample_tries):
+            row = rows[int(draw() * len(rows))]
+            if all(column[row] == value for column, value in checks) and (limit is None or results[row] <= limit):
+                return table.equation(row)
+        return None
+
+    def _apply(self, index, eq):
+        # Записать уравнение в слот и обновить верность затронутых уравнений
+        slot = self._slots[index]
+        parts = eq.parts + ['=', eq.result]
+        self.ops[index] = eq.parts[1::2]
+        affected = {index}
+        for k in range(0, slot.length, 2):
+            cell = slot.cells[k]
+            if self.values[cell] != parts[k]:
+                self.values[cell] = parts[k]
+                affected.update(i for i, _ in self._template.cell_slots[cell])
+        for i in affected:
+            self._set_valid(i, self._is_valid(i))
+
+    def _kick(self):
+        # Встряска: неверные уравнения и их соседи получают новые уравнения,
+        # сохраняющие лишь часть пересечений
+        region = set(self._invalid)
+        for index in list(region):
+            region.update(self._slots[index].neighbours)
+        for index in region:
+            shared = len(self._shared[index])
+            keep = self.rng.randrange(shared + 1)
+            eq = None
+            while eq is None and keep >= 0:
+                eq = self._resample(index, keep)
+                keep -= 1
+            if eq is not None:
+                self._apply(index, eq)
+
+    def _anneal(self, template, deadline):
+        rng = self.rng
+        self._template = template
+        self._slots = template.slots
+        cell_slots = template.cell_slots
+        # Позиции чисел слота, общие с другими слотами
+        self._shared = [[k for k in range(0, slot.length, 2) if len(cell_slots[slot.cells[k]]) > 1]
+                        for slot in template.slots]
+        # Результат слота ограничен max_val, если его клетка - операнд другого слота
+        self._bounded = [any(k != self._slots[i].length - 1 for i, k in cell_slots[slot.cells[-1]])
+                         for slot in template.slots]
+        self.values = {cell: rng.randint(1, self.max_val) for cell in cell_slots}
+        self.ops = [[rng.choice(self.allowed_ops) for _ in range((slot.length - 3) // 2)]
+                    for slot in template.slots]
+        self._invalid = []
+        self._invalid_pos = {}
+        for index in range(len(template.slots)):
+            self._set_valid(index, self._is_valid(index))
+
+        max_steps = self.steps_per_slot * len(template.slots)
+        stall_steps = max(self.min_stall_steps, self.stall_steps_per_slot * len(template.slots))
+        temperature = self.start_temperature
+        best = len(self._invalid)
+        best_step = 0
+        kicks = 0
+        for step in range(max_steps):
+            if len(self._invalid) < best:
+                best, best_step = len(self._invalid), step
+            if not self._invalid:
+                self.steps += step
+                return True
+            if step - best_step > stall_steps:
+                # Застряли в локальном минимуме: вместо перезапуска всей сетки
+                # встряхиваем окрестность неверных уравнений и снова повышаем температуру,
+                # чтобы не терять уже найденные верные участки
+                if kicks >= self.kicks:
+                    self.steps += step
+                    return False
+                kicks += 1
+                self.kicked += 1
+                self._kick()
+                temperature = self.start_temperature
+                best, best_step = len(self._invalid), step
+                continue
+            if deadline is not None and step % 256 == 0 and time.perf_counter() > deadline:
+                break
+
+            # Мутация: неверное уравнение заменяется уравнением из каталога, которое
+            # сохраняет как можно больше пересечений (сначала все, затем без одного и т.д.)
+            index = self._invalid[rng.randrange(len(self._invalid))]
+            slot = self._slots[index]
+            shared = len(self._shared[index])
+            keep = shared if rng.random() >= self.drop_rate else rng.randrange(shared + 1)
+            eq = None
+            while eq is None and keep >= 0:
+                eq = self._resample(index, keep)
+                keep -= 1
+            if eq is None:
+                continue
+
+            parts = eq.parts + ['=', eq.result]
+            changed = [(slot.cells[k], parts[k]) for k in range(0, slot.length, 2)
+                       if self.values[slot.cells[k]] != parts[k]]
+            affected = {index}
+            for cell, _ in changed:
+                affected.update(i for i, _ in cell_slots[cell])
+            before = sum(1 for i in affected if i in self._invalid_pos)
+
+            old_ops = self.ops[index]
+            old_values = [(cell, self.values[cell]) for cell, _ in changed]
+            self.ops[index] = eq.parts[1::2]
+            for cell, value in changed:
+                self.values[cell] = value
+            after = {i: self._is_valid(i) for i in affected}
+            delta = sum(1 for valid in after.values() if not valid) - before
+
+            if delta <= 0 or rng.random() < math.exp(-delta / temperature):
+                for i, valid in after.items():
+                    self._set_valid(i, valid)
+            else:
+                self.ops[index] = old_ops
+                for cell, value in old_values:
+                    self.values[cell] = value
+            temperature = max(self.min_temperature, temperature * self.cooling)
+        self.steps += max_steps
+        return False
@@ -0,0 +1,212 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from game_logic import CrossMathGrid, Equation, PuzzleGenerator, EquationCatalogue, GenerationStats
+from puzzle_format import LibraryWriter, encode_puzzle
+from puzzle_id import PuzzleId
+from dedup import BloomFilter, Deduplicator, canonical_hash
+
+# Пакетная генерация библиотек головоломок без GUI (PyQt6 не импортируется).
+# Работа делится на порции; у каждой порции своё зерно, поэтому результат
+# не зависит от числа процессов и порядка их завершения.
+
+DIFFICULTIES = ('easy', 'medium', 'hard', 'expert')
+
+
+def puzzle_record(grid, playable_grid, removed_numbers, difficulty, puzzle_id):
+    # Головоломка в виде словаря для JSON: уравнения решения, пустые клетки и банк
+    holes = [[r, c] for r, row in enumerate(playable_grid) for c, cell in enumerate(row)
+             if cell and cell[1] == 'empty_number']
+    return {
+        'difficulty': difficulty,
+        'id': puzzle_id,
+        'size': grid.size,
+        'equations': [[eq.parts, eq.result, r, c, d[0], d[1]] for eq, r, c, d in grid.equations],
+        'holes': holes,
+        'bank': removed_numbers,
+    }
+
+
+def grid_from_record(record):
+    # Восстановить (сетка решения, игровая сетка, банк) из словаря puzzle_record
+    grid = CrossMathGrid(record['size'])
+    for parts, result, r, c, dr, dc in record['equations']:
+        grid.place_equation(Equation(parts, result), r, c, (dr, dc))
+    playable_grid = [list(row) for row in grid.grid]
+    for r, c in record['holes']:
+        playable_grid[r][c] = (None, 'empty_number')
+    return grid, playable_grid, list(record['bank'])
+
+
+def chunk_seed(base_seed, difficulty, chunk):
+    # Своё зерно для каждой пары (сложность, порция)
+    return (base_seed * len(DIFFICULTIES) + DIFFICULTIES.index(difficulty)) * 1000003 + chunk
+
+
+def generate_chunk(difficulty, count, seed, method, unique, fmt='jsonl', collect_stats=False, dedup=False):
+    # Выполняется в рабочем процессе: порция головоломок с собственным зерном.
+    # У каждой головоломки своё зерно из генератора порции, поэтому конструктивную
+    # головоломку можно сгенерировать заново по её PuzzleId.
+    # Возвращает записи (строки JSONL или двоичные записи puzzle_format),
+    # процессорное время процесса на порцию (time.process_time: "на ядро" без ожидания
+    # и вытеснения другими процессами), телеметрию (словарь GenerationStats или None)
+    # и канонические хэши записей для отсева повторов (None без dedup).
+    start = time.process_time()
+    chunk_rng = random.Random(seed)
+    stats = GenerationStats() if collect_stats else None
+    records = []
+    hashes = [] if dedup else None
+    for i in range(count):
+        puzzle_id = PuzzleId.new(difficulty, chunk_rng, unique)
+        grid, playable_grid, removed_numbers, _ = PuzzleGenerator.generate_playable(
+            difficulty, method, unique, stats, rng=random.Random(puzzle_id.seed))
+        if grid is None:
+            continue
+        if dedup:
+            hashes.append(canonical_hash(grid))
+        if fmt == 'library':
+            records.append(encode_puzzle(grid, playable_grid, difficulty))
+        else:
+            # id воспроизводит головоломку только для конструктивного метода
+            record = puzzle_record(grid, playable_grid, removed_numbers, difficulty,
+                                   puzzle_id.hex() if method == 'constructive' else None)
+            records.append(json.dumps(record, separators=(',', ':')))
+    return records, time.process_time() - start, stats.as_dict() if stats is not None else None, hashes
+
+
+def warm_up(difficulty):
+    # Каталог уравнений строится (или читается с диска) один раз до запуска пула
+    EquationCatalogue.for_difficulty(difficulty)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетная генерация головоломок CrossMath в JSONL")
+    parser.add_argument("--difficulty", nargs="+", default=list(DIFFICULTIES), choices=DIFFICULTIES)
+    parser.add_argument("--count", type=int, default=1000, help="головоломок на сложность")
+    parser.add_argument("--chunk", type=int, default=100, help="головоломок в порции")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--method", choices=PuzzleGenerator.METHODS, default="constructive")
+    parser.add_argument("--no-unique", action="store_true", help="не проверять единственность решения")
+    parser.add_argument("--format", choices=["jsonl", "library"], default="jsonl",
+                        help="JSONL или двоичная библиотека puzzle_format")
+    parser.add_argument("--out", default=None, help="по умолчанию puzzles.jsonl или puzzles.cml")
+    parser.add_argument("--stats", default=None, metavar="PATH",
+                        help="собрать телеметрию генерации и записать её в JSON (по сложностям)")
+    parser.add_argument("--dedup", default=None, metavar="PATH",
+                        help="отсеивать повторы (с точностью до симметрии) через фильтр Блума в файле; "
+                             "файл можно использовать в следующих запусках")
+    parser.add_argument("--dedup-capacity", type=int, default=10_000_000,
+                        help="ожидаемое число головоломок в новом файле фильтра")
+    parser.add_argument("--max-duplicates", type=float, default=0.9,
+                        help="доля повторов в последних 1000 головоломках, при которой сложность "
+                             "считается исчерпанной")
+    args = parser.parse_args()
+
+    for difficulty in args.difficulty:
+        warm_up(difficulty)
+
+    # Порции создаются по мере надобности: при отсеве повторов сложность получает
+    # новые порции, пока не наберётся count уникальных головоломок
+    wanted = dict.fromkeys(args.difficulty, args.count)
+    next_chunk = dict.fromkeys(args.difficulty, 0)
+    exhausted = set()
+    total = args.count * len(args.difficulty)
+
+    def next_job():
+        for difficulty in args.difficulty:
+            if wanted[difficulty] > 0 and difficulty not in exhausted:
+                count = min(args.chunk, wanted[difficulty])
+                wanted[difficulty] -= count
+                next_chunk[difficulty] += 1
+                return difficulty, count, chunk_seed(args.seed, difficulty, next_chunk[difficulty] - 1)
+        return None
+
+    if args.out is None:
+        args.out = "puzzles.cml" if args.format == "library" else "puzzles.jsonl"
+
+    stats = {difficulty: GenerationStats() for difficulty in args.difficulty}
+    seen = BloomFilter(args.dedup, args.dedup_capacity) if args.dedup is not None else None
+    dedup = {difficulty: Deduplicator(seen) for difficulty in args.difficulty} if seen is not None else None
+    written = 0
+    worker_seconds = 0.0  # процессорное время рабочих процессов
+    started = time.perf_counter()
+    if args.format == "library":
+        out = LibraryWriter(args.out)
+    else:
+        out = open(args.out, "w", encoding="utf-8")
+    with out, ProcessPoolExecutor(args.workers) as executor:
+        # Не больше двух порций на процесс в работе одновременно: результаты сразу
+        # пишутся на диск и не копятся в памяти
+        running = set()
+        job = next_job()
+        while job is not None or running:
+            while job is not None and len(running) < 2 * args.workers:
+                difficulty, count, seed = job
+                future = executor.submit(generate_chunk, difficulty, count, seed, args.method,
+                                         not args.no_unique, args.format, args.stats is not None,
+                                         dedup is not None)
+                future.difficulty = difficulty
+                running.add(future)
+                job = next_job()
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                records, seconds, chunk_stats, hashes = future.result()
+                difficulty = future.difficulty
+                if chunk_stats is not None:
+                    stats[difficulty].merge(GenerationStats.from_dict(chunk_stats))
+                if hashes is not None:
+                    kept = [record for record, key in zip(records, hashes) if dedup[difficulty].is_new(key)]
+                    # Отсеянные повторы заменяются новыми порциями, пока доля повторов
+                    # не покажет, что головоломки сложности почти все уже получены
+                    wanted[difficulty] += len(records) - len(kept)
+                    recent = dedup[difficulty].recent
+                    if len(recent) == recent.maxlen and dedup[difficulty].recent_hit_rate >= args.max_duplicates:
+                        exhausted.add(difficulty)
+                    records = kept
+                for record in records:
+                    if args.format == "library":
+                        out.add(record, difficulty)
+                    else:
+                        out.write(record + "\n")
+                written += len(records)
+                worker_seconds += seconds
+            if job is None:
+                job = next_job()
+            elapsed = time.perf_counter() - started
+            line = (f"\r{written}/{total} головоломок | {written / elapsed:8.1f} гол/с | "
+                    f"{written / max(worker_seconds, 1e-9):7.1f} гол/с на ядро")
+            if dedup is not None:
+                duplicates = sum(d.duplicates for d in dedup.values())
+                checked = sum(d.checked for d in dedup.values())
+                line += f" | повторов {duplicates} ({duplicates / max(checked, 1):.1%})"
+            print(line, end="", file=sys.stderr, flush=True)
+
+    elapsed = time.perf_counter() - started
+    print(file=sys.stderr)
+    if dedup is not None:
+        for difficulty, difficulty_dedup in dedup.items():
+            note = " - пространство головоломок исчерпано" if difficulty in exhausted else ""
+            print(f"{difficulty}: проверено {difficulty_dedup.checked}, повторов {difficulty_dedup.duplicates} "
+                  f"({difficulty_dedup.hit_rate:.1%}, в последних {len(difficulty_dedup.recent)}: "
+                  f"{difficulty_dedup.recent_hit_rate:.1%}){note}", file=sys.stderr)
+        print(f"Фильтр {args.dedup}: {seen.count} головоломок, "
+              f"ложные срабатывания ~{seen.false_positive_rate():.2e}", file=sys.stderr)
+        seen.close()
+    print(f"Записано {written} головоломок в {args.out} за {elapsed:.1f} с "
+          f"({written / elapsed:.1f} гол/с, {args.workers} процессов, "
+          f"{written / max(worker_seconds, 1e-9):.1f} гол/с на ядро)")
+    if args.stats is not None:
+        for difficulty, difficulty_stats in stats.items():
+            print(f"{difficulty}: {difficulty_stats.report()}", file=sys.stderr)
+        with open(args.stats, "w", encoding="utf-8") as f:
+            json.dump({d: s.as_dict() for d, s in stats.items()}, f, ensure_ascii=False, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,586 @@
+import argparse
+import random
+import time
+
+from game_logic import (Equation, EquationSpace, EquationCatalogue, PuzzleGenerator, SolutionChecker,
+                        GameSession, BatchValidator, GenerationStats, BoardProfile, CrossMathGrid,
+                        evaluate_parts, evaluate_many, equation_profile)
+from hints import HintEngine
+
+
+def eval_parts(parts):
+    # Прежний способ вычисления: строка выражения + eval
+    expr = "".join(str(p) for p in parts).replace('/', '//')
+    try:
+        return eval(expr)
+    except ZeroDivisionError:
+        return None
+    except Exception:
+        return None
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def bench_evaluator(args):
+    random.seed(args.seed)
+    parts_list = []
+    for difficulty in ('easy', 'medium', 'hard', 'expert'):
+        for _ in range(args.count // 4):
+            eq = Equation.generate(difficulty)
+            parts_list.append(eq.parts)
+
+    expected, t_eval = timed(lambda: [eval_parts(p) for p in parts_list])
+    single, t_single = timed(lambda: [evaluate_parts(p) for p in parts_list])
+    batch, t_batch = timed(evaluate_many, parts_list)
+
+    if single != expected or batch != expected:
+        raise SystemExit("Результаты вычислителя расходятся с eval")
+
+    n = len(parts_list)
+    print(f"Выражений: {n}")
+    print(f"eval:           {t_eval * 1000:8.1f} мс ({n / t_eval:10.0f} выр/с)")
+    print(f"evaluate_parts: {t_single * 1000:8.1f} мс ({n / t_single:10.0f} выр/с), x{t_eval / t_single:.1f}")
+    print(f"evaluate_many:  {t_batch * 1000:8.1f} мс ({n / t_batch:10.0f} выр/с), x{t_eval / t_batch:.1f}")
+
+
+def bench_space(args):
+    random.seed(args.seed)
+    for difficulty in ('easy', 'medium', 'hard', 'expert'):
+        space = EquationSpace.for_difficulty(difficulty)
+        _, t_generate = timed(lambda: [Equation.generate(difficulty) for _ in range(args.count)])
+        _, t_sample = timed(lambda: [space.sample() for _ in range(args.count)])
+        print(f"{difficulty:7s} {space.report()}")
+        print(f"        Equation.generate {args.count / t_generate:9.0f} ур/с | "
+              f"EquationSpace.sample {args.count / t_sample:9.0f} ур/с")
+
+
+# Целевое число уравнений по сложностям, как в PuzzleGenerator.generate_puzzle
+TARGET_EQUATIONS = {'easy': 4, 'medium': 7, 'hard': 12, 'expert': 18}
+
+
+def bench_generator(args):
+    random.seed(args.seed)
+    for difficulty, target in TARGET_EQUATIONS.items():
+        _, t_build = timed(EquationCatalogue.for_difficulty, difficulty)
+
+        placed = 0
+        under_filled = 0
+        start = time.perf_counter()
+        for _ in range(args.count):
+            grid = PuzzleGenerator.generate_puzzle(difficulty, args.method)
+            placed += len(grid.equations)
+            if len(grid.equations) < target:
+                under_filled += 1
+        elapsed = time.perf_counter() - start
+
+        print(f"{difficulty:7s} каталог {t_build * 1000:6.0f} мс | "
+              f"{elapsed / args.count * 1000:6.2f} мс/сетка | {placed / elapsed:7.0f} ур/с | "
+              f"в среднем {placed / args.count:5.2f}/{target} | недозаполнено {under_filled / args.count:4.0%}")
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+def bench_deadline(args):
+    # Хвостовая задержка generate_playable с бюджетом (сетка и единственность):
+    # p50/p90/p99 времени, доля сеток с нужным числом уравнений, доля головоломок,
+    # проверка которых прервана сроком, и какой стратегией получена лучшая сетка
+    random.seed(args.seed)
+    for difficulty, target in TARGET_EQUATIONS.items():
+        EquationCatalogue.for_difficulty(difficulty)
+        stats = GenerationStats()
+        times = []
+        met = 0
+        placed = 0
+        for _ in range(args.count):
+            (grid, _, _, _), elapsed = timed(PuzzleGenerator.generate_playable, difficulty, 'constructive',
+                                             True, stats, args.budget)
+            times.append(elapsed)
+            count = len(grid.equations) if grid is not None else 0
+            met += count >= target
+            placed += count
+        times.sort()
+        strategies = ", ".join(f"{name.split('.', 1)[1]} {count}" for name, count in sorted(stats.counters.items())
+                               if name.startswith('strategy.'))
+        print(f"{difficulty:7s} бюджет {args.budget * 1000:.0f} мс | p50 {percentile(times, 0.5) * 1000:7.1f} мс | "
+              f"p90 {percentile(times, 0.9) * 1000:7.1f} мс | p99 {percentile(times, 0.99) * 1000:7.1f} мс | "
+              f"цель {met / args.count:4.0%} | в среднем {placed / args.count:5.2f}/{target} | "
+              f"срок {stats.counters['deadline'] / args.count:4.0%} | {strategies}")
+
+
+def scan_growth(profile, rng):
+    # Прежний цикл роста: ячейки с числами собираются обходом всей сетки на каждой
+    # итерации, направление определяется по соседям, пересечённые ячейки тоже выбираются.
+    # Возвращает (сетка, время роста)
+    grid = CrossMathGrid(profile.size)
+    catalogue = EquationCatalogue.for_difficulty(profile)
+    eq = catalogue.space.sample(rng=rng)
+    grid.place_equation(eq, profile.size // 2, (profile.size - len(eq.parts) - 2) // 2, (0, 1))
+    start = time.perf_counter()
+    failures = 0
+    while len(grid.equations) < profile.equations and failures < max(50, 2 * profile.equations):
+        r, c = rng.choice(grid.number_cells())
+        has_h = any(0 <= c + k < grid.size and grid.grid[r][c + k] for k in (-1, 1))
+        has_v = any(0 <= r + k < grid.size and grid.grid[r + k][c] for k in (-1, 1))
+        if has_h and has_v:
+            failures += 1
+            continue
+        dr, dc = (1, 0) if has_h else (0, 1)
+        new_eq, idx = catalogue.choose(grid.grid[r][c][0], r * dr + c * dc, grid.size, rng)
+        if new_eq is not None and grid.can_place(new_eq, r - idx * dr, c - idx * dc, (dr, dc)):
+            grid.place_equation(new_eq, r - idx * dr, c - idx * dc, (dr, dc))
+        else:
+            failures += 1
+    return grid, time.perf_counter() - start
+
+
+def bench_growth(args):
+    # Рост сетки на профилях BoardProfile разного размера: время на поставленное
+    # уравнение с frontier (generate_puzzle) и прежним обходом сетки (scan_growth)
+    rng = random.Random(args.seed)
+    ops, op_counts, max_value = equation_profile(args.difficulty)
+    for size in args.sizes:
+        profile = BoardProfile(size, size * size // args.density, ops, op_counts, max_value)
+        EquationCatalogue.for_difficulty(profile)
+        stats = GenerationStats()
+        for _ in range(args.count):
+            PuzzleGenerator.generate_puzzle(profile, stats=stats, rng=rng)
+        placed = stats.counters['placements'] - args.count
+        frontier = stats.seconds['growth'] / max(placed, 1) * 1e6
+
+        placed_scan = 0
+        seconds_scan = 0.0
+        for _ in range(args.count):
+            grid, elapsed = scan_growth(profile, rng)
+            placed_scan += len(grid.equations) - 1
+            seconds_scan += elapsed
+        scan = seconds_scan / max(placed_scan, 1) * 1e6
+        print(f"{size:3d}x{size:<3d} цель {profile.equations:4d} | frontier: в среднем {placed / args.count + 1:6.1f} ур, "
+              f"{frontier:7.1f} мкс/ур | обход: в среднем {placed_scan / args.count + 1:6.1f} ур, {scan:8.1f} мкс/ур")
+
+
+def bench_annealing(args):
+    from annealing import AnnealingGenerator
+
+    random.seed(args.seed)
+    EquationCatalogue.for_difficulty(args.difficulty)
+    base = None
+    for size in args.sizes:
+        times = []
+        solved = 0
+        slots = 0
+        for _ in range(args.count):
+            gen = AnnealingGenerator(args.difficulty, size)
+            grid, elapsed = timed(gen.generate)
+            times.append(elapsed)
+            if grid is not None:
+                solved += 1
+                slots = len(grid.equations)
+        mean = sum(times) / len(times)
+        per_cell = mean / (size * size) * 1e6
+        if base is None:
+            base = per_cell
+        print(f"{size:3d}x{size:<3d} уравнений {slots:4d} | решено {solved}/{args.count} | "
+              f"{mean:7.2f} с | {per_cell:7.1f} мкс/клетка (x{per_cell / base:.1f} к первому размеру)")
+
+
+def bench_solver(args):
+    from solver import PuzzleSolver
+
+    random.seed(args.seed)
+    for difficulty in ('easy', 'medium', 'hard', 'expert'):
+        EquationCatalogue.for_difficulty(difficulty)
+        times = []
+        repairs = []
+        unique = 0
+        undecided = 0
+        holes_before = 0
+        holes_after = 0
+        stats = GenerationStats()
+        for _ in range(args.count):
+            grid = PuzzleGenerator.generate_puzzle(difficulty)
+            playable, bank = PuzzleGenerator.create_playable_state(grid, difficulty)
+            result, elapsed = timed(PuzzleSolver(grid.equations, playable, bank).solve)
+            if result.undecided:
+                undecided += 1
+            elif not result.solvable:
+                raise SystemExit("Решатель не нашёл решение сгенерированной головоломки")
+            times.append(elapsed)
+            unique += result.unique
+            holes_before += len(bank)
+            _, elapsed = timed(PuzzleGenerator.make_unique, grid, playable, bank, 2000, stats)
+            repairs.append(elapsed)
+            holes_after += len(bank)
+        times.sort()
+        repairs.sort()
+        print(f"{difficulty:7s} медиана {percentile(times, 0.5) * 1000:7.2f} мс | "
+              f"p99 {percentile(times, 0.99) * 1000:7.2f} мс | не решено в бюджете {undecided / args.count:4.0%} | "
+              f"единственное решение {unique / args.count:4.0%} | "
+              f"пустых клеток {holes_before / args.count:5.1f} -> {holes_after / args.count:5.1f} "
+              f"после make_unique (медиана {percentile(repairs, 0.5) * 1000:.1f} мс, "
+              f"p99 {percentile(repairs, 0.99) * 1000:.1f} мс, не решено проверок "
+              f"{stats.counters['undecided']}/{stats.counters['unique_checks']})")
+
+
+def bench_punch(args):
+    from solver import HolePuncher
+
+    random.seed(args.seed)
+    for difficulty in ('easy', 'medium', 'hard', 'expert'):
+        EquationCatalogue.for_difficulty(difficulty)
+        holes = 0
+        checks = 0
+        reused = 0
+        variants = 0
+        start = time.perf_counter()
+        for _ in range(args.count):
+            grid = PuzzleGenerator.generate_puzzle(difficulty)
+            puncher = HolePuncher(grid)
+            target = max(2, round(len(puncher.solution) * PuzzleGenerator.removal_rate(difficulty)))
+            for _, bank in puncher.variants(args.variants, target_holes=target):
+                holes += len(bank)
+                variants += 1
+            checks += puncher.checks
+            reused += puncher.reused
+        elapsed = time.perf_counter() - start
+        print(f"{difficulty:7s} {elapsed / variants * 1000:7.2f} мс/вариант | "
+              f"пустых клеток {holes / variants:5.1f} | поисков {checks / variants:5.1f} на вариант | "
+              f"без поиска {reused / variants:4.1f}")
+
+
+def full_scan(equations, values):
+    # Прежняя проверка после каждого хода: все уравнения заново
+    statuses = []
+    for eq, r, c, (dr, dc) in equations:
+        parts = []
+        for i in range(len(eq.parts)):
+            pos = (r + i * dr, c + i * dc)
+            parts.append(values[pos] if i % 2 == 0 else eq.parts[i])
+        result = values[(r + (len(eq.parts) + 1) * dr, c + (len(eq.parts) + 1) * dc)]
+        if None in parts or result is None:
+            statuses.append(None)
+        else:
+            statuses.append(evaluate_parts(parts) == result)
+    return statuses
+
+
+def bench_checker(args):
+    from annealing import AnnealingGenerator
+
+    random.seed(args.seed)
+    for size in args.sizes:
+        grid = AnnealingGenerator(args.difficulty, size).generate()
+        if grid is None:
+            print(f"{size:3d}x{size:<3d} сетка не построена")
+            continue
+        playable, _ = PuzzleGenerator.create_playable_state(grid, args.difficulty)
+        checker = SolutionChecker(grid.equations, playable)
+        holes = sorted(checker.mutable)
+        moves = []
+        for _ in range(args.moves):
+            r, c = random.choice(holes)
+            moves.append(((r, c), random.choice((None, grid.grid[r][c][0]))))
+
+        values = dict(checker.values)
+
+        def run_full():
+            for (r, c), value in moves:
+                values[(r, c)] = value
+                full_scan(grid.equations, values)
+
+        def run_incremental():
+            for (r, c), value in moves:
+                checker.set_value(r, c, value)
+
+        _, t_full = timed(run_full)
+        _, t_inc = timed(run_incremental)
+        print(f"{size:3d}x{size:<3d} уравнений {len(grid.equations):4d} | "
+              f"полная проверка {t_full / len(moves) * 1e6:9.1f} мкс/ход | "
+              f"инкрементальная {t_inc / len(moves) * 1e6:6.1f} мкс/ход")
+
+
+def bench_validator(args):
+    # Проверка пачки решений одной головоломки: SolutionChecker на каждое решение
+    # против BatchValidator по столбцам. Решения заполнены целиком: часть верные,
+    # остальные - перестановки банка.
+    random.seed(args.seed)
+    rng = random.Random(args.seed)
+    for difficulty in args.difficulty:
+        grid, playable_grid, bank, _ = PuzzleGenerator.generate_playable(difficulty, unique=False)
+        validator = BatchValidator(grid.equations, playable_grid)
+        solution = {cell: grid.grid[cell[0]][cell[1]][0] for cell in validator.cells}
+        submissions = []
+        for _ in range(args.count):
+            if rng.random() < 0.3:
+                submissions.append(solution)
+            else:
+                values = [solution[cell] for cell in validator.cells]
+                rng.shuffle(values)
+                submissions.append(dict(zip(validator.cells, values)))
+
+        def run_checker():
+            verdicts = []
+            for submission in submissions:
+                checker = SolutionChecker(grid.equations, playable_grid)
+                for (r, c), value in submission.items():
+                    checker.set_value(r, c, value)
+                verdicts.append(list(checker.status))
+            return verdicts
+
+        expected, t_checker = timed(run_checker)
+        verdicts, t_batch = timed(validator.validate, submissions)
+        assert verdicts == expected
+        print(f"{difficulty:7s} | решений {args.count} | уравнений {len(validator.equations):3d} | "
+              f"по одному {t_checker / args.count * 1e6:7.1f} мкс | "
+              f"пачкой {t_batch / args.count * 1e6:6.1f} мкс | x{t_checker / t_batch:.1f}")
+
+
+def bench_session(args):
+    # Массовая симуляция партий без GUI: случайные ходы с отменами,
+    # затем расстановка решения. Время - только на ходы GameSession.
+    random.seed(args.seed)
+    rng = random.Random(args.seed)
+    for difficulty in args.difficulty:
+        moves = 0
+        seconds = 0.0
+        solved = 0
+        for _ in range(args.count):
+            grid, playable_grid, bank, _ = PuzzleGenerator.generate_playable(difficulty, unique=False)
+            if grid is None:
+                continue
+            session = GameSession(grid.equations, playable_grid, bank)
+            cells = sorted(session.checker.mutable)
+            start = time.perf_counter()
+            for _ in range(args.moves):
+                roll = rng.random()
+                a, b = rng.choice(cells), rng.choice(cells)
+                if roll < 0.4 and session.bank:
+                    session.place(*a, rng.choice(list(session.bank)))
+                elif roll < 0.6 and session.value(*a) is not None:
+                    session.move(a, b)
+                elif roll < 0.75:
+                    session.swap(a, b)
+                elif roll < 0.9:
+                    session.undo()
+                else:
+                    session.clear(*a)
+            for r, c in cells:
+                session.clear(r, c)
+            for r, c in cells:
+                session.place(r, c, grid.grid[r][c][0])
+            seconds += time.perf_counter() - start
+            moves += args.moves + 2 * len(cells)
+            solved += session.solved
+        print(f"{difficulty:7s} | партий {args.count} | решено {solved} | "
+              f"{moves / seconds:9.0f} ходов/с | {seconds / moves * 1e6:5.1f} мкс/ход")
+
+
+def bench_hints(args):
+    # Подсказка после каждого хода: HintEngine, обновляемый ходами, против нового
+    # HintEngine по текущей расстановке (пересчёт всего поля) и решения текущего
+    # состояния PuzzleSolver (прежний способ найти ход). Ходы - числа решения
+    # в случайном порядке и очистки (ошибки не ставятся: с ошибкой подсказка сразу
+    # указывает на неё); время подсказки сравнивается в первой и второй половине партии.
+    # --sizes: большие поля BoardProfile (операторы и числа --difficulty) без проверки
+    # единственности и без сравнения с решателем
+    from solver import PuzzleSolver
+    rng = random.Random(args.seed)
+    if args.sizes:
+        ops, op_counts, max_value = equation_profile(args.difficulty[0])
+        profiles = [BoardProfile(size, size * size // 10, ops, op_counts, max_value) for size in args.sizes]
+    else:
+        profiles = args.difficulty
+    for difficulty in profiles:
+        incremental = [[], []]
+        fresh = []
+        solved = []
+        for _ in range(args.count):
+            grid, playable_grid, bank, _ = PuzzleGenerator.generate_playable(difficulty, unique=not args.sizes,
+                                                                             rng=rng)
+            session = GameSession(grid.equations, playable_grid, bank)
+            hints = HintEngine(grid.equations, playable_grid, bank, grid)
+            cells = sorted(session.checker.mutable)
+            for move in range(args.moves):
+                cell = rng.choice(cells)
+                value = grid.grid[cell[0]][cell[1]][0]
+                if rng.random() < 0.3 or not session.bank[value]:
+                    statuses, _ = session.clear(*cell)
+                else:
+                    statuses, _ = session.place(*cell, value)
+                start = time.perf_counter()
+                for r, c in statuses:
+                    hints.set_value(r, c, session.value(r, c))
+                hints.hint()
+                incremental[2 * move >= args.moves].append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                rebuilt = HintEngine(grid.equations, playable_grid, bank, grid)
+                for r, c in cells:
+                    rebuilt.set_value(r, c, session.value(r, c))
+                rebuilt.hint()
+                fresh.append(time.perf_counter() - start)
+                if args.sizes:
+                    continue
+
+                start = time.perf_counter()
+                current = [list(row) for row in playable_grid]
+                for r, c in cells:
+                    if session.value(r, c) is not None:
+                        current[r][c] = (session.value(r, c), 'number')
+                PuzzleSolver(grid.equations, current, session.bank_numbers()).solve(2)
+                solved.append(time.perf_counter() - start)
+        first, second = (sorted(times) for times in incremental)
+        everything = sorted(first + second)
+        name = f"{difficulty.size}x{difficulty.size}" if args.sizes else difficulty
+        solver_time = f"{sum(solved) / len(solved) * 1e3:7.3f} мс" if solved else "-"
+        print(f"{name:7s} | ходы 1-{args.moves // 2}: {sum(first) / len(first) * 1e3:6.3f} мс | "
+              f"ходы {args.moves // 2 + 1}-{args.moves}: {sum(second) / len(second) * 1e3:6.3f} мс | "
+              f"p99 {percentile(everything, 0.99) * 1e3:6.3f} мс | "
+              f"пересчёт поля {sum(fresh) / len(fresh) * 1e3:7.3f} мс | "
+              f"решатель {solver_time}")
+
+
+def bench_board(args):
+    # Время показа нового поля: новые DropCell на каждую игру (как раньше),
+    # клетки из пула CellGrid и нарисованный BoardWidget. Нужен PyQt6;
+    # без дисплея запускать с QT_QPA_PLATFORM=offscreen.
+    from PyQt6.QtWidgets import QApplication
+    from widgets import CellGrid, BoardWidget
+
+    app = QApplication.instance() or QApplication([])
+    random.seed(args.seed)
+    for difficulty in args.difficulty:
+        puzzles = []
+        while len(puzzles) < args.count:
+            grid, playable_grid, _, _ = PuzzleGenerator.generate_playable(difficulty, unique=False)
+            if grid is not None:
+                puzzles.append(playable_grid)
+
+        def show(board, playable_grid):
+            board.set_board(playable_grid)
+            board.show()
+            board.repaint()
+            app.processEvents()
+
+        def run_fresh():
+            board = None
+            for playable_grid in puzzles:
+                if board is not None:
+                    board.hide()
+                    board.deleteLater()
+                board = CellGrid()
+                show(board, playable_grid)
+            board.deleteLater()
+            app.processEvents()
+
+        def run_pooled(board):
+            for playable_grid in puzzles:
+                show(board, playable_grid)
+
+        _, t_fresh = timed(run_fresh)
+        pooled = CellGrid()
+        _, t_pooled = timed(run_pooled, pooled)
+        painted = BoardWidget()
+        _, t_painted = timed(run_pooled, painted)
+        print(f"{difficulty:7s} | новые клетки {t_fresh / args.count * 1000:7.2f} мс | "
+              f"пул клеток {t_pooled / args.count * 1000:7.2f} мс | "
+              f"BoardWidget {t_painted / args.count * 1000:7.2f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры производительности CrossMath")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("evaluator", help="вычислитель выражений против eval")
+    p.add_argument("--count", type=int, default=100000)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_evaluator)
+
+    p = sub.add_parser("space", help="стоимость перечисления уравнений и скорость выборки")
+    p.add_argument("--count", type=int, default=100000)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_space)
+
+    p = sub.add_parser("generator", help="скорость и заполненность PuzzleGenerator.generate_puzzle")
+    p.add_argument("--count", type=int, default=200)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--method", choices=PuzzleGenerator.METHODS, default="constructive")
+    p.set_defaults(func=bench_generator)
+
+    p = sub.add_parser("deadline", help="p50/p90/p99 generate_playable с ограничением по времени")
+    p.add_argument("--budget", type=float, default=0.5, help="бюджет на головоломку (сетка и единственность), с")
+    p.add_argument("--count", type=int, default=100)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_deadline)
+
+    p = sub.add_parser("growth", help="рост сетки на больших профилях: frontier против обхода сетки")
+    p.add_argument("--difficulty", default="hard", help="операторы и числа профиля")
+    p.add_argument("--sizes", type=int, nargs="+", default=[13, 25, 51, 101])
+    p.add_argument("--density", type=int, default=10, help="клеток сетки на желаемое уравнение")
+    p.add_argument("--count", type=int, default=5)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_growth)
+
+    p = sub.add_parser("annealing", help="время до полностью верной сетки в зависимости от размера")
+    p.add_argument("--difficulty", default="hard")
+    p.add_argument("--sizes", type=int, nargs="+", default=[13, 21, 31, 51])
+    p.add_argument("--count", type=int, default=3)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_annealing)
+
+    p = sub.add_parser("solver", help="время проверки единственности решения")
+    p.add_argument("--count", type=int, default=100)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_solver)
+
+    p = sub.add_parser("punch", help="пошаговое удаление чисел с сохранением единственности")
+    p.add_argument("--count", type=int, default=20)
+    p.add_argument("--variants", type=int, default=3)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_punch)
+
+    p = sub.add_parser("checker", help="задержка проверки хода в зависимости от размера сетки")
+    p.add_argument("--difficulty", default="medium")
+    p.add_argument("--sizes", type=int, nargs="+", default=[7, 13, 21, 31, 51])
+    p.add_argument("--moves", type=int, default=2000)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_checker)
+
+    p = sub.add_parser("validator", help="пакетная проверка решений против SolutionChecker")
+    p.add_argument("--difficulty", nargs="+", default=["easy", "medium", "hard", "expert"])
+    p.add_argument("--count", type=int, default=10000)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_validator)
+
+    p = sub.add_parser("session", help="симуляция партий GameSession без GUI")
+    p.add_argument("--difficulty", nargs="+", default=["easy", "medium", "hard", "expert"])
+    p.add_argument("--count", type=int, default=50)
+    p.add_argument("--moves", type=int, default=500)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_session)
+
+    p = sub.add_parser("hints", help="время подсказки после хода против пересчёта всего поля")
+    p.add_argument("--difficulty", nargs="+", default=["easy", "medium", "hard", "expert"])
+    p.add_argument("--count", type=int, default=10)
+    p.add_argument("--moves", type=int, default=200)
+    p.add_argument("--sizes", type=int, nargs="+", default=None, help="стороны полей BoardProfile")
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_hints)
+
+    p = sub.add_parser("board", help="время показа нового поля (нужен PyQt6)")
+    p.add_argument("--difficulty", nargs="+", default=["easy", "medium", "hard", "expert"])
+    p.add_argument("--count", type=int, default=50)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_board)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+import time
+import random
+import itertools
+
+from game_logic import (Equation, EquationCatalogue, BitboardGrid, board_profile,
+                        equation_profile, compile_expression)
+
+
+class Slot:
+    # Место под уравнение в шаблоне: начало, направление и длина (вместе с '=' и результатом)
+    def __init__(self, r, c, direction, length):
+        self.r = r
+        self.c = c
+        self.direction = direction
+        self.length = length
+        dr, dc = direction
+        self.cells = [(r + i * dr, c + i * dc) for i in range(length)]
+        self.neighbours = set()  # номера слотов, пересекающих этот
+
+
+class SlotTemplate:
+    # Фиксированная структура сетки: набор слотов под уравнения.
+    # Решётка строится так, что числа стоят в клетках (чётная строка, чётный столбец),
+    # горизонтальные уравнения лежат в чётных строках, вертикальные - в чётных столбцах,
+    # а знаки - в клетках с одной нечётной координатой. Поэтому слоты пересекаются
+    # только по числам и никогда не касаются друг друга боком (как требует can_place).
+    def __init__(self, size, slots):
+        self.size = size
+        self.slots = slots
+        self.cell_slots = {}  # клетка с числом -> [(номер слота, позиция в уравнении), ...]
+        for i, slot in enumerate(slots):
+            for k in range(0, slot.length, 2):
+                self.cell_slots.setdefault(slot.cells[k], []).append((i, k))
+        for entries in self.cell_slots.values():
+            for i, _ in entries:
+                for j, _ in entries:
+                    if i != j:
+                        slots[i].neighbours.add(j)
+
+    @classmethod
+    def lattice(cls, size, lengths, rng=random):
+        # Все строки и столбцы с чётным номером нарезаются на отрезки допустимой длины,
+        # разделённые пустой клеткой; отрезки начинаются с чётной позиции.
+        slots = []
+        for line in range(0, size, 2):
+            for direction in ((0, 1), (1, 0)):
+                pos = rng.choice((0, 2)) if size > min(lengths) + 2 else 0
+                while True:
+                    fitting = [length for length in lengths if pos + length <= size]
+                    if not fitting:
+                        break
+                    length = rng.choice(fitting)
+                    if direction == (0, 1):
+                        slots.append(Slot(line, pos, direction, length))
+                    else:
+                        slots.append(Slot(pos, line, direction, length))
+                    pos += length + 1
+        return cls(size, slots)
+
+    def connected_subset(self, count, rng=random):
+        # Связное подмножество из count слотов (случайный рост от одного слота).
+        # Если от выбранного слота связная часть меньше count, пробуем другие начала
+        # и оставляем самое большое подмножество.
+        if count >= len(self.slots):
+            return self
+        best = []
+        starts = list(range(len(self.slots)))
+        rng.shuffle(starts)
+        for start in starts:
+            chosen = [start]
+            chosen_set = {start}
+            frontier = set(self.slots[start].neighbours)
+            while len(chosen) < count and frontier:
+                nxt = rng.choice(sorted(frontier))
+                frontier.discard(nxt)
+                chosen.append(nxt)
+                chosen_set.add(nxt)
+                frontier |= self.slots[nxt].neighbours - chosen_set
+            if len(chosen) > len(best):
+                best = chosen
+            if len(best) == count:
+                break
+        slots = [self.slots[i] for i in sorted(best)]
+        return SlotTemplate(self.size, [Slot(s.r, s.c, s.direction, s.length) for s in slots])
+
+
+def matching_equations(catalogue, constraints, length):
+    # Уравнения длины length, у которых на позициях k стоят значения value
+    # для всех (k, value) из constraints. Возвращает номера строк таблицы каталога
+    # или, если известны все операнды, готовые объекты Equation.
+    operands_known = sum(1 for k, _ in constraints if k != length - 1)
+    if operands_known == (length - 1) // 2:
+        # Все операнды известны - перебираем операторы напрямую
+        return _by_operators(catalogue, constraints, length)
+    buckets = [(catalogue.find(value, k, length), k, value) for k, value in constraints]
+    buckets.sort(key=lambda b: len(b[0]))
+    rows, _, _ = buckets[0]
+    if len(buckets) > 1 and len(rows):
+        table = catalogue.tables[length]
+        checks = [(table.column(k), value) for _, k, value in buckets[1:]]
+        rows = [row for row in rows if all(column[row] == value for column, value in checks)]
+    return rows
+
+
+def _by_operators(catalogue, constraints, length):
+    # Уравнения с заданными операндами: перебор всех шаблонов операторов
+    allowed_ops, _, max_val = catalogue.space.profile
+    known = dict(constraints)
+    num_ops = (length - 3) // 2
+    nums = [known[k] for k in range(0, length - 1, 2)]
+    if any(not 1 <= n <= max_val for n in nums):
+        return []
+    target = known.get(length - 1)
+    found = []
+    for ops in itertools.product(allowed_ops, repeat=num_ops):
+        # Деление должно быть без остатка внутри слагаемого, как в Equation.generate
+        term = nums[0]
+        exact = True
+        for op, n in zip(ops, nums[1:]):
+            if op == '*':
+                term *= n
+            elif op == '/':
+                if term % n:
+                    exact = False
+                    break
+                term //= n
+            else:
+                term = n
+        if not exact:
+            continue
+        res = compile_expression(ops)(nums)
+        if res <= 0 or (target is not None and res != target):
+            continue
+        parts = [nums[0]]
+        for op, n in zip(ops, nums[1:]):
+            parts += [op, n]
+        found.append(Equation(parts, res))
+    return found
+
+
+class SearchBudgetExceeded(Exception):
+    pass
+
+
+class CSPGenerator:
+    # Генератор плотных сеток "как в газете": сначала фиксируется шаблон слотов,
+    # затем уравнения подбираются перебором с возвратом. Переменные - слоты,
+    # значения - уравнения нужной длины. Очередной слот выбирается по принципу
+    # "самый ограниченный первым" (меньше всего подходящих уравнений), после каждого
+    # присваивания выполняется проверка вперёд для пересекающих слотов.
+    def __init__(self, difficulty, size=None, num_equations=None,
+                 node_budget=5000, time_budget=1.0, max_values=20, rng=random):
+        default_size, default_count = board_profile(difficulty)
+        self.difficulty = difficulty
+        self.size = size or default_size
+        self.num_equations = num_equations or default_count
+        self.node_budget = node_budget
+        self.time_budget = time_budget
+        self.max_values = max_values
+        self.rng = rng
+
+        self.catalogue = EquationCatalogue.for_difficulty(difficulty)
+        _, op_counts, _ = equation_profile(difficulty)
+        self.lengths = sorted(2 * n + 3 for n in op_counts if 2 * n + 3 <= self.size)
+        self.nodes = 0
+        self.restarts = 0
+
+    def generate(self):
+        # Возвращает заполненную BitboardGrid или None, если бюджет времени исчерпан
+        deadline = time.perf_counter() + self.time_budget
+        self.nodes = 0
+        self.restarts = 0
+        if not self.lengths:
+            return None
+        while time.perf_counter() < deadline:
+            template = SlotTemplate.lattice(self.size, self.lengths, self.rng)
+            template = template.connected_subset(self.num_equations, self.rng)
+            equations = self._solve(template, deadline)
+            if equations is not None:
+                grid = self._build_grid(template, equations)
+                if grid is not None:
+                    return grid
+            self.restarts += 1
+        return None
+
+    def _build_grid(self, template, equations):
+        grid = BitboardGrid(self.size)
+        for slot, eq in zip(template.slots, equations):
+            if not grid.can_place(eq, slot.r, slot.c, slot.direction):
+                return None
+            grid.place_equation(eq, slot.r, slot.c, slot.direction)
+        return grid
+
+    def _solve(self, template, deadline):
+        self._template = template
+        self._values = {}                     # клетка -> число
+        self._assigned = [None] * len(template.slots)
+        self._memo = {}                       # (слот, ограничения) -> кандидаты
+        self._deadline = deadline
+        self._node_limit = self.nodes + self.node_budget
+        try:
+            if self._search(len(template.slots)):
+                return list(self._assigned)
+        except SearchBudgetExceeded:
+            pass
+        return None
+
+    def _constraints(self, index):
+        slot = self._template.slots[index]
+        values = self._values
+        return tuple((k, values[slot.cells[k]]) for k in range(0, slot.length, 2) if slot.cells[k] in values)
+
+    def _candidates(self, index):
+        # Кандидаты для слота с учётом уже заполненных пересечений.
+        # None - ограничений нет (подходит любое уравнение нужной длины).
+        constraints = self._constraints(index)
+        if not constraints:
+            return None
+        key = (index, constraints)
+        cached = self._memo.get(key)
+        if cached is not None:
+            return cached
+
+        length = self._template.slots[index].length
+        result = matching_equations(self.catalogue, constraints, length)
+        self._memo[key] = result
+        return result
+
+    def _equation(self, length, item):
+        return item if isinstance(item, Equation) else self.catalogue.equation(length, item)
+
+    def _select_slot(self):
+        # Самый ограниченный слот: минимум кандидатов среди слотов с пересечениями,
+        # иначе слот с наибольшим числом соседей
+        best = None
+        best_count = None
+        free = None
+        for index, eq in enumerate(self._assigned):
+            if eq is not None:
+                continue
+            candidates = self._candidates(index)
+            if candidates is None:
+                if free is None or len(self._template.slots[index].neighbours) > \
+                        len(self._template.slots[free].neighbours):
+                    free = index
+                continue
+            if best is None or len(candidates) < best_count:
+                best, best_count = index, len(candidates)
+                if best_count == 0:
+                    break
+        if best is not None:
+            return best, self._candidates(best)
+        return free, None
+
+    def _search(self, remaining):
+        if remaining == 0:
+            return True
+        self.nodes += 1
+        if self.nodes > self._node_limit or time.perf_counter() > self._deadline:
+            raise SearchBudgetExceeded()
+
+        index, candidates = self._select_slot()
+        slot = self._template.slots[index]
+        length = slot.length
+        if candidates is None:
+            table = self.catalogue.tables[length]
+            picks = (self.rng.randrange(len(table)) for _ in range(self.max_values))
+        else:
+            if not len(candidates):
+                return False
+            count = min(self.max_values, len(candidates))
+            picks = (candidates[i] for i in self.rng.sample(range(len(candidates)), count))
+
+        new_cells = [cell for cell in slot.cells[::2] if cell not in self._values]
+        for item in picks:
+            eq = self._equation(length, item)
+            parts = eq.parts + ['=', eq.result]
+            for cell in new_cells:
+                k = slot.cells.index(cell)
+                self._values[cell] = parts[k]
+            self._assigned[index] = eq
+
+            # Проверка вперёд: у каждого незаполненного соседа должен остаться кандидат
+            if all(self._assigned[n] is not None or self._candidates(n) is None or len(self._candidates(n))
+                   for n in slot.neighbours):
+                if self._search(remaining - 1):
+                    return True
+
+            self._assigned[index] = None
+            for cell in new_cells:
+                del self._values[cell]
+        return False
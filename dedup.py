@@ -0,0 +1,153 @@
+import os
+import math
+import mmap
+import struct
+import hashlib
+from collections import deque
+
+# Отсев повторяющихся головоломок при пакетной генерации.
+#
+# canonical_hash - хэш раскладки сетки решения (клетки с числами, операторами и '='),
+# не зависящий от сдвига, транспонирования и отражений: из 8 преобразований квадрата
+# берётся наименьшая сериализация клеток, сдвинутых к началу координат. Набор уравнений
+# раскладкой определяется полностью, поэтому одинаковые хэши - одинаковые головоломки
+# с точностью до симметрии (без учёта того, какие клетки пустые).
+#
+# BloomFilter - множество хэшей в файле через mmap: проверка и добавление за O(1)
+# (k бит), размер файла задаётся ожидаемым числом головоломок и долей ложных срабатываний.
+
+# Преобразования квадрата: (r, c) -> (r', c')
+SYMMETRIES = (
+    lambda r, c: (r, c),
+    lambda r, c: (c, r),
+    lambda r, c: (r, -c),
+    lambda r, c: (-r, c),
+    lambda r, c: (-r, -c),
+    lambda r, c: (c, -r),
+    lambda r, c: (-c, r),
+    lambda r, c: (-c, -r),
+)
+
+
+def canonical_form(grid):
+    # Наименьшая из 8 сериализаций клеток сетки решения
+    cells = [(r, c, str(cell[0])) for r, row in enumerate(grid.grid) for c, cell in enumerate(row) if cell]
+    best = None
+    for transform in SYMMETRIES:
+        moved = [(*transform(r, c), value) for r, c, value in cells]
+        r0 = min(r for r, _, _ in moved)
+        c0 = min(c for _, c, _ in moved)
+        moved = sorted((r - r0, c - c0, value) for r, c, value in moved)
+        form = ';'.join(f"{r},{c},{value}" for r, c, value in moved)
+        if best is None or form < best:
+            best = form
+    return best or ''
+
+
+def canonical_hash(grid):
+    # 16 байт: первые 8 и последние 8 используются как два независимых хэша в BloomFilter
+    return hashlib.blake2b(canonical_form(grid).encode(), digest_size=16).digest()
+
+
+class BloomFilter:
+    # Файл: заголовок <4sQIQ (MAGIC, число бит m, число хэшей k, число добавленных), затем биты
+    MAGIC = b'CMBF'
+    HEADER = struct.Struct('<4sQIQ')
+
+    def __init__(self, path, capacity=1_000_000, error_rate=0.001):
+        # Существующий файл открывается как есть (capacity и error_rate не используются)
+        if not os.path.exists(path):
+            bits = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+            hashes = max(1, round(bits / capacity * math.log(2)))
+            with open(path, 'wb') as f:
+                f.write(self.HEADER.pack(self.MAGIC, bits, hashes, 0))
+                f.truncate(self.HEADER.size + (bits + 7) // 8)
+        self.file = open(path, 'r+b')
+        self.data = mmap.mmap(self.file.fileno(), 0)
+        magic, self.bits, self.hashes, self.count = self.HEADER.unpack_from(self.data, 0)
+        if magic != self.MAGIC:
+            raise ValueError("Не файл фильтра Блума")
+
+    def _positions(self, key):
+        # Двойное хэширование: h1 + i * h2 по модулю m
+        h1 = int.from_bytes(key[:8], 'little')
+        h2 = int.from_bytes(key[8:16], 'little') | 1
+        bits = self.bits
+        return [(h1 + i * h2) % bits for i in range(self.hashes)]
+
+    def __contains__(self, key):
+        data = self.data
+        offset = self.HEADER.size
+        return all(data[offset + (p >> 3)] >> (p & 7) & 1 for p in self._positions(key))
+
+    def add(self, key):
+        # Добавить ключ; True, если его (вероятно) не было
+        data = self.data
+        offset = self.HEADER.size
+        new = False
+        for p in self._positions(key):
+            i = offset + (p >> 3)
+            byte = data[i]
+            mask = 1 << (p & 7)
+            if not byte & mask:
+                data[i] = byte | mask
+                new = True
+        if new:
+            self.count += 1
+        return new
+
+    def false_positive_rate(self):
+        # Оценка при текущем заполнении
+        return (1 - math.exp(-self.hashes * self.count / self.bits)) ** self.hashes
+
+    def close(self):
+        self.HEADER.pack_into(self.data, 0, self.MAGIC, self.bits, self.hashes, self.count)
+        self.data.flush()
+        self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Deduplicator:
+    # Счётчики отсева: общая доля повторов и доля в последних window головоломках.
+    # Рост доли в окне означает, что пространство головоломок сложности исчерпывается.
+    def __init__(self, seen, window=1000):
+        self.seen = seen  # BloomFilter или set
+        self.checked = 0
+        self.duplicates = 0
+        self.recent = deque(maxlen=window)
+
+    def is_new(self, key):
+        self.checked += 1
+        if isinstance(self.seen, set):
+            new = key not in self.seen
+            self.seen.add(key)
+        else:
+            new = self.seen.add(key)
+        if not new:
+            self.duplicates += 1
+        self.recent.append(not new)
+        return new
+
+    def filter(self, puzzles):
+        # Ленивый фильтр потока (сетка, игровая сетка, банк)
+        for puzzle in puzzles:
+            if self.is_new(canonical_hash(puzzle[0])):
+                yield puzzle
+
+    @property
+    def hit_rate(self):
+        return self.duplicates / self.checked if self.checked else 0.0
+
+    @property
+    def recent_hit_rate(self):
+        return sum(self.recent) / len(self.recent) if self.recent else 0.0
+
+    def stats(self):
+        return {'checked': self.checked, 'duplicates': self.duplicates,
+                'hit_rate': self.hit_rate, 'recent_hit_rate': self.recent_hit_rate}
@@ -1,5 +1,97 @@
+import os
+import time
 import random
+import pickle
 import operator
+import functools
+import itertools
+from array import array
+from collections import Counter
+
+# Операции внутри слагаемого (приоритет выше, чем у '+' и '-')
+_TERM_OPS = {
+    '*': operator.mul,
+    '/': operator.floordiv
+}
+
+
+@functools.lru_cache(maxsize=None)
+def compile_expression(ops):
+    # Компилирует шаблон операторов (например, ('+', '*')) в функцию от списка операндов.
+    # Шаблон разбивается на слагаемые: (знак, индекс первого операнда, ((операция, индекс), ...)),
+    # поэтому приоритет '*' и '/' учитывается без построения строки и вызова eval.
+    terms = []
+    sign = 1
+    start = 0
+    factors = []
+    for i, op in enumerate(ops):
+        if op == '+' or op == '-':
+            terms.append((sign, start, tuple(factors)))
+            sign = 1 if op == '+' else -1
+            start = i + 1
+            factors = []
+        elif op in _TERM_OPS:
+            factors.append((_TERM_OPS[op], i + 1))
+        else:
+            raise ValueError(f"Неизвестный оператор: {op!r}")
+    terms.append((sign, start, tuple(factors)))
+    terms = tuple(terms)
+
+    def evaluate(nums):
+        total = 0
+        for term_sign, first, term_factors in terms:
+            term = nums[first]
+            for func, idx in term_factors:
+                term = func(term, nums[idx])
+            if term_sign > 0:
+                total += term
+            else:
+                total -= term
+        return total
+
+    return evaluate
+
+
+def evaluate_parts(parts):
+    # Вычисляет список частей [число, оператор, число, ...] с приоритетом '*'/'/'
+    # и целочисленным делением ('/' ведёт себя как '//').
+    # Возвращает None для некорректного выражения или деления на ноль.
+    if not parts or len(parts) % 2 == 0:
+        return None
+    nums = parts[::2]
+    for n in nums:
+        if not isinstance(n, int):
+            return None
+    try:
+        return compile_expression(tuple(parts[1::2]))(nums)
+    except (ZeroDivisionError, ValueError, TypeError):
+        return None
+
+
+def evaluate_many(parts_list):
+    # Пакетная версия evaluate_parts: вычисляет тысячи списков частей за один вызов.
+    # Скомпилированные шаблоны кэшируются локально, чтобы не обращаться к lru_cache на каждом элементе.
+    compiled = {}
+    results = []
+    append = results.append
+    for parts in parts_list:
+        if not parts or len(parts) % 2 == 0:
+            append(None)
+            continue
+        nums = parts[::2]
+        ops = tuple(parts[1::2])
+        func = compiled.get(ops)
+        try:
+            if func is None:
+                func = compiled[ops] = compile_expression(ops)
+            for n in nums:
+                if not isinstance(n, int):
+                    raise TypeError
+            append(func(nums))
+        except (ZeroDivisionError, ValueError, TypeError):
+            append(None)
+    return results
+
 
 class Equation:
     def __init__(self, parts, result):
@@ -11,76 +103,40 @@ class Equation:
 
     @staticmethod
     def evaluate_parts(parts):
-        # Преобразуем список частей в строку выражения
-        # Заменяем '/' на '//' для целочисленного деления
-        expr = "".join(str(p) for p in parts).replace('/', '//')
-        try:
-            return eval(expr)
-        except ZeroDivisionError:
-            return None
-        except Exception:
-            return None
+        # Вычисление без eval, см. evaluate_parts на уровне модуля
+        return evaluate_parts(parts)
 
     @staticmethod
-    def generate(difficulty):
-        ops_map = {
-            '+': operator.add,
-            '-': operator.sub,
-            '*': operator.mul,
-            '/': operator.truediv
-        }
-        
-        if difficulty == 'easy':
-            allowed_ops = ['+', '-']
-            num_ops = 1
-            max_val = 15
-        elif difficulty == 'medium':
-            allowed_ops = ['+', '-', '*']
-            num_ops = random.choice([1, 2])
-            max_val = 20
-        elif difficulty == 'hard':
-            allowed_ops = ['+', '-', '*', '/']
-            num_ops = 2
-            max_val = 30
-        else:
-            allowed_ops = ['+', '-', '*', '/']
-            num_ops = random.choice([2, 3])
-            max_val = 40
+    def generate(difficulty, max_attempts=1000, stats=None, rng=random):
+        rng = resolve_rng(rng)
+        allowed_ops, op_counts, max_val = equation_profile(difficulty)
+        num_ops = rng.choice(op_counts)
 
-        for _ in range(100):
-            ops = [random.choice(allowed_ops) for _ in range(num_ops)]
+        for _ in range(max_attempts):
+            ops = [rng.choice(allowed_ops) for _ in range(num_ops)]
             nums = []
             
             # Генерируем первое число
-            nums.append(random.randint(1, max_val))
+            nums.append(rng.randint(1, max_val))
             
             current_term_val = nums[0]
-            valid_structure = True
             
             for i in range(num_ops):
                 op = ops[i]
                 
-                if op == '*' or op == '/':
-                    if op == '*':
-                        next_val = random.randint(1, max_val)
-                        current_term_val *= next_val
-                    else: # op == '/'
-                        # Находим делители для целочисленного деления
-                        candidates = [n for n in range(1, max_val + 1) if current_term_val % n == 0]
-                        if not candidates:
-                            valid_structure = False
-                            break
-                        next_val = random.choice(candidates)
-                        current_term_val //= next_val
+                if op == '*':
+                    next_val = rng.randint(1, max_val)
+                    current_term_val *= next_val
+                elif op == '/':
+                    # Делители для целочисленного деления берутся из кэша (1 делит всё, список не пуст)
+                    next_val = rng.choice(divisors(current_term_val, max_val))
+                    current_term_val //= next_val
                 else:
                     # + или -
-                    next_val = random.randint(1, max_val)
+                    next_val = rng.randint(1, max_val)
                     current_term_val = next_val
                 
                 nums.append(next_val)
-            
-            if not valid_structure:
-                continue
                 
             # Собираем уравнение
             parts = [nums[0]]
@@ -89,17 +145,422 @@ class Equation:
                 parts.append(nums[i+1])
             
             # Вычисляем результат с учетом приоритета
-            res = Equation.evaluate_parts(parts)
+            res = evaluate_parts(parts)
+            if stats is not None:
+                stats.count('draws')
             
             if res is None:
+                if stats is not None:
+                    stats.reject('invalid_expression')
                 continue
             if res <= 0: # Результат должен быть положительным
+                if stats is not None:
+                    stats.reject('non_positive')
                 continue
                 
             return Equation(parts, res)
             
-        # Если не удалось сгенерировать, пробуем снова (рекурсия)
-        return Equation.generate(difficulty)
+        # Вместо рекурсии без ограничения глубины берём уравнение из полного перечисления
+        if stats is not None:
+            stats.count('space_fallback')
+        return EquationSpace.for_difficulty(difficulty).sample(rng=rng)
+
+
+class BoardProfile:
+    # Параметры генерации вместо имени сложности: размер сетки, желаемое число уравнений,
+    # операторы, возможное число операторов в уравнении, наибольшее число и доля удаляемых чисел.
+    # Принимается везде, где ожидается difficulty (board_profile, equation_profile,
+    # PuzzleGenerator.removal_rate и всё, что их вызывает).
+    # Головоломки профиля не имеют PuzzleId и не пишутся в библиотеку puzzle_format.
+    # Операнды хранятся в EquationTable как unsigned short (array('H')), поэтому
+    # max_value не больше MAX_VALUE. Результаты ограничены EquationTable.MAX_RESULT.
+    MAX_VALUE = 65535
+
+    def __init__(self, size, equations, ops=('+', '-'), op_counts=(1,), max_value=15, removal_rate=0.5):
+        if not ops or any(op not in ('+', '-', '*', '/') for op in ops):
+            raise ValueError(f"Неизвестные операторы: {ops!r}")
+        if not op_counts or min(op_counts) < 1:
+            raise ValueError(f"Неверное число операторов: {op_counts!r}")
+        if 2 * max(op_counts) + 3 > size:
+            raise ValueError(f"Уравнение с {max(op_counts)} операторами не помещается в сетку {size}x{size}")
+        if equations < 1 or max_value < 1 or not 0 < removal_rate < 1:
+            raise ValueError("Неверные параметры профиля")
+        if max_value > BoardProfile.MAX_VALUE:
+            raise ValueError(f"Наибольшее число {max_value} больше {BoardProfile.MAX_VALUE}")
+        self.size = size
+        self.equations = equations
+        self.ops = tuple(ops)
+        self.op_counts = tuple(op_counts)
+        self.max_value = max_value
+        self.removal_rate = removal_rate
+
+    @staticmethod
+    def for_difficulty(difficulty):
+        # Профиль встроенной сложности
+        size, equations = board_profile(difficulty)
+        ops, op_counts, max_value = equation_profile(difficulty)
+        return BoardProfile(size, equations, ops, op_counts, max_value, PuzzleGenerator.removal_rate(difficulty))
+
+    def __repr__(self):
+        return (f"BoardProfile({self.size}, {self.equations}, {self.ops}, {self.op_counts}, "
+                f"{self.max_value}, {self.removal_rate})")
+
+
+def equation_profile(difficulty):
+    # Профиль уравнений сложности: (допустимые операторы, возможное число операторов, максимальное число)
+    if isinstance(difficulty, BoardProfile):
+        return difficulty.ops, difficulty.op_counts, difficulty.max_value
+    if difficulty == 'easy':
+        return ('+', '-'), (1,), 15
+    elif difficulty == 'medium':
+        return ('+', '-', '*'), (1, 2), 20
+    elif difficulty == 'hard':
+        return ('+', '-', '*', '/'), (2,), 30
+    else:
+        return ('+', '-', '*', '/'), (2, 3), 40
+
+
+def resolve_rng(rng):
+    # Генераторы принимают модуль random (по умолчанию), random.Random или целое зерно
+    if isinstance(rng, int):
+        return random.Random(rng)
+    return rng
+
+
+@functools.lru_cache(maxsize=65536)
+def divisors(n, max_val):
+    # Делители n в диапазоне 1..max_val (для генерации деления без остатка)
+    return tuple(d for d in range(1, min(n, max_val) + 1) if n % d == 0)
+
+
+def cache_dir():
+    # Каталог дискового кэша перечислений (можно переопределить через CROSSMATH_CACHE_DIR)
+    return os.environ.get('CROSSMATH_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'crossmath')
+
+
+def _load_or_build(name, build):
+    # Загрузить объект из дискового кэша или построить и сохранить.
+    # Ошибки чтения/записи кэша не фатальны - просто строим заново.
+    path = os.path.join(cache_dir(), name)
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f), True
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+        pass
+    obj = build()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+    return obj, False
+
+
+# Коды операторов в упакованных массивах
+OP_CODES = ('+', '-', '*', '/')
+_OP_INDEX = {op: i for i, op in enumerate(OP_CODES)}
+
+
+class EquationTable:
+    # Все уравнения с фиксированным числом операторов, упакованные по столбцам:
+    # operands[k][i] - k-й операнд i-го уравнения, ops[k][i] - код k-го оператора, results[i] - результат.
+    # Результаты - знаковые 64 бита (array('q')): с '*' и большим max_value произведение
+    # может не поместиться, такие уравнения при построении отбрасываются.
+    MAX_RESULT = 2 ** 63 - 1
+
+    def __init__(self, num_ops):
+        self.num_ops = num_ops
+        self.length = 2 * num_ops + 3  # клеток на сетке вместе с '=' и результатом
+        self.operands = [array('H') for _ in range(num_ops + 1)]
+        self.ops = [array('B') for _ in range(num_ops)]
+        self.results = array('q')
+
+    def __len__(self):
+        return len(self.results)
+
+    def append(self, nums, op_codes, result):
+        for k, n in enumerate(nums):
+            self.operands[k].append(n)
+        for k, code in enumerate(op_codes):
+            self.ops[k].append(code)
+        self.results.append(result)
+
+    def column(self, slot):
+        # Столбец чисел для позиции slot на сетке (чётные позиции - операнды, последняя - результат)
+        if slot == self.length - 1:
+            return self.results
+        return self.operands[slot // 2]
+
+    def equation(self, row):
+        parts = [self.operands[0][row]]
+        for k in range(self.num_ops):
+            parts.append(OP_CODES[self.ops[k][row]])
+            parts.append(self.operands[k + 1][row])
+        return Equation(parts, self.results[row])
+
+
+class EquationSpace:
+    # Полное перечисление корректных уравнений профиля сложности, один раз на профиль.
+    # Шаблон (набор операторов), у которого вариантов больше доли бюджета max_rows,
+    # не перечисляется целиком, а заполняется случайной выборкой из своих уравнений,
+    # поэтому время построения ограничено. Результат кэшируется на диске.
+    FORMAT_VERSION = 1
+    _cache = {}
+
+    def __init__(self, profile, max_rows=500000, seed=0):
+        self.profile = profile
+        self.max_rows = max_rows
+        self.tables = {}
+        self.templates = {}  # шаблон операторов -> (строк, перечислен полностью)
+        self.build_seconds = 0.0
+        self.from_cache = False
+
+        start = time.perf_counter()
+        allowed_ops, op_counts, max_val = profile
+        templates = [ops for num_ops in op_counts for ops in itertools.product(allowed_ops, repeat=num_ops)]
+        for num_ops in op_counts:
+            self.tables[num_ops] = EquationTable(num_ops)
+
+        # Распределение бюджета: шаблоны от меньших к большим, каждый получает
+        # равную долю оставшегося бюджета; маленькие перечисляются полностью.
+        estimates = sorted((self._estimate(ops, max_val), ops) for ops in templates)
+        rng = random.Random(seed)
+        budget = max_rows
+        for i, (estimate, ops) in enumerate(estimates):
+            share = budget // (len(estimates) - i)
+            table = self.tables[len(ops)]
+            before = len(table)
+            if estimate <= share:
+                self._enumerate(table, ops, max_val)
+                exhaustive = True
+            else:
+                self._sample(table, ops, max_val, share, rng)
+                exhaustive = False
+            rows = len(table) - before
+            self.templates[ops] = (rows, exhaustive)
+            budget -= rows
+        self.build_seconds = time.perf_counter() - start
+
+    @classmethod
+    def for_difficulty(cls, difficulty):
+        profile = equation_profile(difficulty)
+        space = cls._cache.get(profile)
+        if space is None:
+            start = time.perf_counter()
+            name = f"space-v{cls.FORMAT_VERSION}-{profile_key(profile)}.pickle"
+            space, cached = _load_or_build(name, lambda: cls(profile))
+            if cached:
+                space.from_cache = True
+                space.build_seconds = time.perf_counter() - start
+            cls._cache[profile] = space
+        return space
+
+    @staticmethod
+    def _estimate(ops, max_val):
+        # Верхняя оценка числа вариантов шаблона (у делителя в среднем немного вариантов)
+        estimate = max_val
+        for op in ops:
+            estimate *= 4 if op == '/' else max_val
+        return estimate
+
+    @staticmethod
+    def _enumerate(table, ops, max_val):
+        # Перебор в глубину: после '/' перебираются только делители текущего слагаемого
+        evaluate = compile_expression(ops)
+        codes = [_OP_INDEX[op] for op in ops]
+        values = range(1, max_val + 1)
+        num_ops = len(ops)
+        nums = [0] * (num_ops + 1)
+
+        def walk(i, term):
+            if i == num_ops:
+                res = evaluate(nums)
+                if 0 < res <= EquationTable.MAX_RESULT:
+                    table.append(nums, codes, res)
+                return
+            op = ops[i]
+            if op == '/':
+                for n in divisors(term, max_val):
+                    nums[i + 1] = n
+                    walk(i + 1, term // n)
+            elif op == '*':
+                for n in values:
+                    nums[i + 1] = n
+                    walk(i + 1, term * n)
+            else:
+                for n in values:
+                    nums[i + 1] = n
+                    walk(i + 1, n)
+
+        for n in values:
+            nums[0] = n
+            walk(0, n)
+
+    @staticmethod
+    def _sample(table, ops, max_val, count, rng):
+        # Случайная выборка различных уравнений шаблона тем же способом, что и Equation.generate
+        evaluate = compile_expression(ops)
+        codes = [_OP_INDEX[op] for op in ops]
+        draw = rng.random
+        seen = set()
+        for _ in range(count * 3):
+            if len(seen) >= count:
+                break
+            term = int(draw() * max_val) + 1
+            nums = [term]
+            for op in ops:
+                if op == '/':
+                    candidates = divisors(term, max_val)
+                    n = candidates[int(draw() * len(candidates))]
+                    term //= n
+                elif op == '*':
+                    n = int(draw() * max_val) + 1
+                    term *= n
+                else:
+                    n = term = int(draw() * max_val) + 1
+                nums.append(n)
+            key = tuple(nums)
+            if key in seen:
+                continue
+            res = evaluate(nums)
+            if 0 < res <= EquationTable.MAX_RESULT:
+                seen.add(key)
+                table.append(nums, codes, res)
+
+    def __len__(self):
+        return sum(len(table) for table in self.tables.values())
+
+    def sample(self, weights=None, rng=random):
+        # Случайное уравнение за O(1). Без весов число операторов выбирается равновероятно
+        # (как в Equation.generate), weights='uniform' - равномерно по всем уравнениям,
+        # либо словарь {число операторов: вес}.
+        tables = [t for t in self.tables.values() if len(t)]
+        if weights == 'uniform':
+            pick = rng.randrange(sum(len(t) for t in tables))
+            for table in tables:
+                if pick < len(table):
+                    return table.equation(pick)
+                pick -= len(table)
+        if weights is None:
+            table = rng.choice(tables)
+        else:
+            table = rng.choices(tables, [weights.get(t.num_ops, 0) for t in tables])[0]
+        return table.equation(rng.randrange(len(table)))
+
+    def report(self):
+        exhaustive = sum(1 for _, full in self.templates.values() if full)
+        source = "кэш" if self.from_cache else "перечисление"
+        return (f"{len(self)} уравнений, шаблонов {len(self.templates)} "
+                f"(полностью перечислено {exhaustive}), {source} за {self.build_seconds:.2f} с")
+
+
+def profile_key(profile):
+    # Короткий ключ профиля для имён файлов кэша, например '0123-23-40'
+    allowed_ops, op_counts, max_val = profile
+    return f"{''.join(str(_OP_INDEX[op]) for op in allowed_ops)}-{''.join(map(str, op_counts))}-{max_val}"
+
+
+class EquationCatalogue:
+    # Индекс уравнений EquationSpace по (число, позиция в уравнении, длина уравнения).
+    # Позиция (slot) считается по частям уравнения вместе с '=' и результатом,
+    # то есть совпадает со смещением ячейки от начала уравнения на сетке.
+    # Для каждой пары (длина, позиция) хранится перестановка строк таблицы,
+    # отсортированная по значению, и диапазоны [lo, hi) для каждого значения.
+    FORMAT_VERSION = 1
+    _cache = {}
+
+    def __init__(self, space):
+        self.space = space
+        self.tables = {table.length: table for table in space.tables.values()}
+        self.orders = {}    # (позиция, длина) -> array номеров строк, отсортированных по значению
+        self.index = {}     # (значение, позиция, длина) -> (lo, hi) в orders
+        self.by_value = {}  # значение -> список ключей index с этим значением
+        for length, table in self.tables.items():
+            for slot in range(0, length, 2):
+                column = table.column(slot)
+                order = array('I', sorted(range(len(column)), key=column.__getitem__))
+                self.orders[(slot, length)] = order
+                lo = 0
+                for value, count in sorted(Counter(column).items()):
+                    key = (value, slot, length)
+                    self.index[key] = (lo, lo + count)
+                    self.by_value.setdefault(value, []).append(key)
+                    lo += count
+
+    @classmethod
+    def for_difficulty(cls, difficulty):
+        space = EquationSpace.for_difficulty(difficulty)
+        catalogue = cls._cache.get(space.profile)
+        if catalogue is None:
+            # Индекс хранит номера строк пространства, поэтому ключ кэша включает версию
+            # формата EquationSpace и число строк каждой таблицы, а загруженный индекс
+            # дополнительно сверяется с таблицами (matches)
+            rows = '-'.join(str(len(table)) for _, table in sorted(space.tables.items()))
+            name = (f"catalogue-v{cls.FORMAT_VERSION}-s{EquationSpace.FORMAT_VERSION}-"
+                    f"{profile_key(space.profile)}-{rows}.pickle")
+            catalogue, cached = _load_or_build(name, lambda: cls(space))
+            if cached and not catalogue.matches(space):
+                catalogue = cls(space)
+            catalogue.attach(space)
+            cls._cache[space.profile] = catalogue
+        return catalogue
+
+    def __getstate__(self):
+        # Пространство уравнений кэшируется отдельно
+        state = self.__dict__.copy()
+        state['space'] = None
+        state['tables'] = None
+        return state
+
+    def attach(self, space):
+        self.space = space
+        self.tables = {table.length: table for table in space.tables.values()}
+
+    def matches(self, space):
+        # Индекс построен по таблицам этого пространства: те же длины и позиции,
+        # в каждой перестановке все строки таблицы
+        tables = {table.length: table for table in space.tables.values()}
+        expected = set((slot, length) for length in tables for slot in range(0, length, 2))
+        return set(self.orders) == expected and \
+            all(len(order) == len(tables[length]) for (_, length), order in self.orders.items())
+
+    def find(self, value, slot, length):
+        # Номера строк таблицы длины length, у которых на позиции slot стоит value, за O(1)
+        lo, hi = self.index.get((value, slot, length), (0, 0))
+        return memoryview(self.orders[(slot, length)])[lo:hi] if hi > lo else ()
+
+    def equation(self, length, row):
+        return self.tables[length].equation(row)
+
+    def choose(self, value, offset, max_length, rng=random):
+        # Выбрать случайное уравнение, содержащее value, так, чтобы ячейка с value
+        # оказалась на расстоянии offset от края, а всё уравнение уместилось в max_length клеток.
+        # Возвращает (уравнение, позиция value в уравнении) или (None, None).
+        keys = []
+        total = 0
+        for key in self.by_value.get(value, ()):
+            _, slot, length = key
+            if slot <= offset and offset - slot + length <= max_length:
+                lo, hi = self.index[key]
+                keys.append(key)
+                total += hi - lo
+        if not total:
+            return None, None
+
+        # Выбор корзины пропорционально её размеру = равномерный выбор среди подходящих уравнений
+        pick = rng.randrange(total)
+        for key in keys:
+            lo, hi = self.index[key]
+            if pick < hi - lo:
+                _, slot, length = key
+                row = self.orders[(slot, length)][lo + pick]
+                return self.tables[length].equation(row), slot
+            pick -= hi - lo
+        return None, None
+
 
 class CrossMathGrid:
     def __init__(self, size):
@@ -114,27 +575,33 @@ class CrossMathGrid:
 
     def can_place(self, equation, r, c, direction):
         # направление: (dr, dc), например, (0, 1) для горизонтального, (1, 0) для вертикального
+        return self.refusal_reason(equation, r, c, direction) is None
+
+    def refusal_reason(self, equation, r, c, direction):
+        # Почему уравнение нельзя поставить: 'bounds' (выходит за сетку), 'ends' (продолжает
+        # соседнее уравнение), 'conflict' (пересечение не совпадает), 'adjacency' (касается
+        # занятой клетки сбоку) или None, если можно
         dr, dc = direction
         parts = equation.parts + ['=', equation.result]
         length = len(parts)
         
         # Проверка границ
         if not self.is_valid_pos(r, c):
-            return False
+            return 'bounds'
             
         end_r = r + (length - 1) * dr
         end_c = c + (length - 1) * dc
         if not self.is_valid_pos(end_r, end_c):
-            return False
+            return 'bounds'
 
         # Проверка перед началом и после конца (чтобы убедиться, что мы не расширяем существующее уравнение)
         before_r, before_c = r - dr, c - dc
         if self.is_valid_pos(before_r, before_c) and self.grid[before_r][before_c] is not None:
-            return False
+            return 'ends'
             
         after_r, after_c = end_r + dr, end_c + dc
         if self.is_valid_pos(after_r, after_c) and self.grid[after_r][after_c] is not None:
-            return False
+            return 'ends'
 
         # Проверка пересечений и смежности
         for i, part in enumerate(parts):
@@ -144,7 +611,7 @@ class CrossMathGrid:
             if cell is not None:
                 # Если ячейка занята, она должна точно совпадать
                 if cell[0] != part:
-                    return False
+                    return 'conflict'
             else:
                 # Если ячейка пуста, проверяем перпендикулярных соседей
                 # Перпендикулярные векторы: (dc, dr) и (-dc, -dr)
@@ -155,11 +622,11 @@ class CrossMathGrid:
                 p2_r, p2_c = curr_r - dc, curr_c - dr
                 
                 if self.is_valid_pos(p1_r, p1_c) and self.grid[p1_r][p1_c] is not None:
-                    return False
+                    return 'adjacency'
                 if self.is_valid_pos(p2_r, p2_c) and self.grid[p2_r][p2_c] is not None:
-                    return False
+                    return 'adjacency'
         
-        return True
+        return None
 
     def place_equation(self, equation, r, c, direction):
         dr, dc = direction
@@ -179,6 +646,16 @@ class CrossMathGrid:
         
         self.equations.append((equation, r, c, direction))
 
+    def number_cells(self):
+        # Все ячейки с числами (полный обход сетки)
+        cells = []
+        for r in range(self.size):
+            for c in range(self.size):
+                cell = self.grid[r][c]
+                if cell and cell[1] == 'number':
+                    cells.append((r, c))
+        return cells
+
     def print_grid(self):
         for row in self.grid:
             line = ""
@@ -189,28 +666,251 @@ class CrossMathGrid:
                     line += " . "
             print(line)
 
+
+class BitboardGrid(CrossMathGrid):
+    # Та же сетка (атрибуты grid и equations совместимы с CrossMathGrid), но занятость
+    # и запреты смежности дополнительно хранятся битовыми масками
+    # (бит r * size + c), которые обновляются в place_equation. can_place сводится к
+    # нескольким операциям над масками, а список ячеек с числами ведётся инкрементально.
+    # frontier - ячейки с числами, через которые проходит одно уравнение, со свободным
+    # (перпендикулярным) направлением: от них можно строить новое уравнение. Ячейка
+    # выходит из frontier, когда её пересекает второе уравнение: получить соседа сбоку
+    # иначе она не может (это запрещают проверки смежности и концов в can_place).
+    def __init__(self, size):
+        super().__init__(size)
+        self.occupied = 0
+        # Пустые ячейки, в которые нельзя класть горизонтальное уравнение (занят сосед сверху/снизу)
+        # и вертикальное (занят сосед слева/справа)
+        self.blocked_h = 0
+        self.blocked_v = 0
+        self.board_mask = (1 << (size * size)) - 1
+        self.not_first_col = 0
+        self.not_last_col = 0
+        for r in range(size):
+            row_mask = ((1 << size) - 1) << (r * size)
+            self.not_first_col |= row_mask & ~(1 << (r * size))
+            self.not_last_col |= row_mask & ~(1 << (r * size + size - 1))
+        self._column_units = {}
+        self._number_cells = []
+        self.frontier = []          # [(r, c, свободное направление)]
+        self._frontier_index = {}   # (r, c) -> позиция в frontier
+
+    def line_mask(self, r, c, length, direction):
+        if direction == (0, 1):
+            return ((1 << length) - 1) << (r * self.size + c)
+        unit = self._column_units.get(length)
+        if unit is None:
+            unit = 0
+            for i in range(length):
+                unit |= 1 << (i * self.size)
+            self._column_units[length] = unit
+        return unit << (r * self.size + c)
+
+    def can_place(self, equation, r, c, direction):
+        dr, dc = direction
+        size = self.size
+        length = len(equation.parts) + 2
+        
+        # Проверка границ
+        end_r = r + (length - 1) * dr
+        end_c = c + (length - 1) * dc
+        if not (0 <= r < size and 0 <= c < size and end_r < size and end_c < size):
+            return False
+
+        # Проверка перед началом и после конца
+        occupied = self.occupied
+        if (r - dr >= 0 and c - dc >= 0) and occupied >> ((r - dr) * size + c - dc) & 1:
+            return False
+        if (end_r + dr < size and end_c + dc < size) and occupied >> ((end_r + dr) * size + end_c + dc) & 1:
+            return False
+
+        # Смежность: пустые ячейки уравнения не должны касаться занятых перпендикулярно
+        line = self.line_mask(r, c, length, direction)
+        blocked = self.blocked_h if dc else self.blocked_v
+        if line & ~occupied & blocked:
+            return False
+
+        # Пересечения: занятые ячейки должны совпадать с частями уравнения
+        overlap = line & occupied
+        if overlap:
+            parts = equation.parts + ['=', equation.result]
+            start = r * size + c
+            step = size if dr else 1
+            while overlap:
+                low = overlap & -overlap
+                idx = low.bit_length() - 1
+                cell_r, cell_c = divmod(idx, size)
+                if self.grid[cell_r][cell_c][0] != parts[(idx - start) // step]:
+                    return False
+                overlap ^= low
+        return True
+
+    def place_equation(self, equation, r, c, direction):
+        dr, dc = direction
+        size = self.size
+        length = len(equation.parts) + 2
+        new_cells = self.line_mask(r, c, length, direction) & ~self.occupied
+
+        for i, part in enumerate(equation.parts + ['=', equation.result]):
+            if not isinstance(part, int):
+                continue
+            cell = (r + i * dr, c + i * dc)
+            if new_cells >> (cell[0] * size + cell[1]) & 1:
+                self._number_cells.append(cell)
+                self._frontier_index[cell] = len(self.frontier)
+                self.frontier.append((cell[0], cell[1], (dc, dr)))
+            else:
+                self.remove_anchor(*cell)
+        super().place_equation(equation, r, c, direction)
+
+        self.occupied |= new_cells
+        self.blocked_h |= ((new_cells << size) | (new_cells >> size)) & self.board_mask
+        self.blocked_v |= ((new_cells << 1) & self.not_first_col) | ((new_cells >> 1) & self.not_last_col)
+
+    def number_cells(self):
+        # Поддерживается в place_equation, без обхода сетки
+        return self._number_cells
+
+    def remove_anchor(self, r, c):
+        # Убрать ячейку из frontier за O(1): на её место ставится последний элемент
+        i = self._frontier_index.pop((r, c), None)
+        if i is None:
+            return
+        last = self.frontier.pop()
+        if i < len(self.frontier):
+            self.frontier[i] = last
+            self._frontier_index[last[:2]] = i
+
+def board_profile(difficulty):
+    # Размер сетки и желаемое число уравнений для сложности
+    if isinstance(difficulty, BoardProfile):
+        return difficulty.size, difficulty.equations
+    if difficulty == 'easy':
+        return 7, 4
+    elif difficulty == 'medium':
+        return 9, 7
+    elif difficulty == 'hard':
+        return 11, 12
+    else:
+        return 13, 18
+
+
+# Версия генератора: меняется, когда те же зерно и параметры начинают давать другую
+# головоломку (другой порядок обращений к rng, другие каталоги и т.п.), см. puzzle_id
+GENERATOR_VERSION = 3
+
+
+class GenerationStats:
+    # Телеметрия генерации, включается передачей объекта в generate_puzzle /
+    # create_playable_state / generate_playable (по умолчанию stats=None и
+    # генератор только проверяет "is not None"). Счётчики:
+    #   draws            взятые уравнения (из каталога или Equation.generate)
+    #   placements       поставленные уравнения
+    #   reject.<причина> отказы: seed_too_long,
+    #                    no_equation (в каталоге нет уравнения с этим числом на этой позиции),
+    #                    bounds / ends / conflict / adjacency (отказ can_place),
+    #                    invalid_expression / non_positive (Equation.generate)
+    #   unique_checks, restored, solver_nodes, undecided - проверка единственности
+    #                    (undecided - решатель не уложился в бюджет,
+    #                    deadline - проверки прерваны общим сроком generate_playable)
+    #   strategy.<способ>, rounds - generate_within: чья сетка лучшая, повторы круга стратегий
+    # и время по фазам (seed, growth, holes), с. Объекты складываются через merge,
+    # а as_dict даёт структуру для JSON.
+    def __init__(self):
+        self.puzzles = 0
+        self.failed = 0     # генератор не вернул сетку
+        self.sparse = 0     # сетка с меньшим числом уравнений, чем нужно
+        self.counters = Counter()
+        self.seconds = Counter()
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def reject(self, reason):
+        self.counters['reject.' + reason] += 1
+
+    def add_time(self, phase, seconds):
+        self.seconds[phase] += seconds
+
+    def merge(self, other):
+        self.puzzles += other.puzzles
+        self.failed += other.failed
+        self.sparse += other.sparse
+        self.counters.update(other.counters)
+        self.seconds.update(other.seconds)
+        return self
+
+    def as_dict(self):
+        return {
+            'puzzles': self.puzzles,
+            'failed': self.failed,
+            'sparse': self.sparse,
+            'counters': dict(sorted(self.counters.items())),
+            'seconds': dict(sorted(self.seconds.items())),
+        }
+
+    @staticmethod
+    def from_dict(data):
+        stats = GenerationStats()
+        stats.puzzles = data['puzzles']
+        stats.failed = data['failed']
+        stats.sparse = data['sparse']
+        stats.counters.update(data['counters'])
+        stats.seconds.update(data['seconds'])
+        return stats
+
+    def report(self):
+        # Краткая сводка: средние на головоломку
+        n = max(self.puzzles, 1)
+        lines = [f"головоломок {self.puzzles}, без сетки {self.failed}, разреженных {self.sparse}"]
+        for phase, seconds in sorted(self.seconds.items()):
+            lines.append(f"  фаза {phase:8s} {seconds / n * 1000:9.2f} мс")
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"  {name:26s} {value / n:9.2f}")
+        return "\n".join(lines)
+
+
 class PuzzleGenerator:
+    # Доступные способы генерации: 'constructive' (по одному пересекающемуся уравнению),
+    # 'csp' (заполнение плотного шаблона перебором с возвратом, см. csp_generator)
+    # и 'annealing' (локальный поиск по шаблону для больших сеток, см. annealing)
+    METHODS = ('constructive', 'csp', 'annealing')
+    ANCHOR_TRIES = 10  # неудач от одной опорной ячейки до её удаления из frontier
+    GRID_SHARE = 0.6   # доля бюджета generate_playable на сетку, остальное - на единственность
+
     @staticmethod
-    def generate_puzzle(difficulty):
-        if difficulty == 'easy':
-            size = 7
-            num_equations = 4
-        elif difficulty == 'medium':
-            size = 9
-            num_equations = 7
-        elif difficulty == 'hard':
-            size = 11
-            num_equations = 12
-        else:
-            size = 13
-            num_equations = 18
+    def generate_puzzle(difficulty, method='constructive', stats=None, rng=random):
+        # stats - GenerationStats для телеметрии или None;
+        # rng - источник случайности (модуль random, random.Random или зерно)
+        rng = resolve_rng(rng)
+        if method in ('csp', 'annealing'):
+            start = time.perf_counter() if stats is not None else 0
+            if method == 'csp':
+                from csp_generator import CSPGenerator
+                grid = CSPGenerator(difficulty, rng=rng).generate()
+            else:
+                from annealing import AnnealingGenerator
+                grid = AnnealingGenerator(difficulty, board_profile(difficulty)[0], rng=rng).generate()
+            if stats is not None:
+                stats.add_time(method, time.perf_counter() - start)
+                if grid is not None:
+                    stats.count('placements', len(grid.equations))
+            return grid
+        elif method != 'constructive':
+            raise ValueError(f"Неизвестный способ генерации: {method!r}")
+
+        size, num_equations = board_profile(difficulty)
+        start = time.perf_counter() if stats is not None else 0
 
-        grid = CrossMathGrid(size)
+        grid = BitboardGrid(size)
+        catalogue = EquationCatalogue.for_difficulty(difficulty)
         
         # 1. Разместить начальное уравнение в центре (горизонтально)
         attempts = 0
         while attempts < 100:
-            eq = Equation.generate(difficulty)
+            eq = catalogue.space.sample(rng=rng)
+            if stats is not None:
+                stats.count('draws')
             # Рассчитать длину
             length = len(eq.parts) + 2 # +2 для '=' и результата
             
@@ -221,95 +921,155 @@ class PuzzleGenerator:
             if c >= 0:
                 grid.place_equation(eq, r, c, (0, 1))
                 break
+            if stats is not None:
+                stats.reject('seed_too_long')
             attempts += 1
+
+        if stats is not None:
+            now = time.perf_counter()
+            stats.add_time('seed', now - start)
+            start = now
             
         if not grid.equations:
             return None # Не удалось начать
+        if stats is not None:
+            stats.count('placements')
 
-        # 2. Попытаться добавить больше уравнений, пересекающих существующие
-        # Мы ищем числа в сетке и пытаемся строить перпендикулярные уравнения от них
-        
+        # 2. Попытаться добавить больше уравнений, пересекающих существующие.
+        # Опорная ячейка берётся из grid.frontier (ячейки с числом и свободным направлением),
+        # поэтому стоимость шага не зависит от площади сетки. Ячейка, от которой
+        # ANCHOR_TRIES раз не удалось построить уравнение, из frontier убирается.
+        # Допустимое число неудач растёт с числом уравнений (на больших профилях).
         count = 1
         failures = 0
-        while count < num_equations and failures < 50:
-            # Выбрать случайную существующую ячейку с числом
-            candidates = []
-            for r in range(size):
-                for c in range(size):
-                    cell = grid.grid[r][c]
-                    if cell and cell[1] == 'number':
-                        candidates.append((r, c))
-            
-            if not candidates:
+        max_failures = max(50, 2 * num_equations)
+        anchor_failures = Counter()
+        while count < num_equations and failures < max_failures:
+            if not grid.frontier:
                 break
-                
-            r, c = random.choice(candidates)
+            r, c, direction = rng.choice(grid.frontier)
             val = grid.grid[r][c][0]
+            dr, dc = direction
+
+            # Взять из каталога уравнение, в котором 'val' стоит на подходящей позиции,
+            # вместо того чтобы генерировать случайные уравнения и надеяться на совпадение.
+            # offset - расстояние от края сетки до (r, c) вдоль направления.
+            offset = r * dr + c * dc
+            new_eq, idx = catalogue.choose(val, offset, size, rng)
             
-            # Определить направление (перпендикулярно существующему уравнению в этой ячейке? 
-            # На самом деле, ячейка может быть частью H и V. Если так, пропустить.)
-            # Простая проверка: посмотреть на соседей.
-            has_h_neighbor = (grid.is_valid_pos(r, c-1) and grid.grid[r][c-1]) or \
-                             (grid.is_valid_pos(r, c+1) and grid.grid[r][c+1])
-            has_v_neighbor = (grid.is_valid_pos(r-1, c) and grid.grid[r-1][c]) or \
-                             (grid.is_valid_pos(r+1, c) and grid.grid[r+1][c])
-                             
-            if has_h_neighbor and has_v_neighbor:
-                failures += 1
-                continue # Уже пересекается
-            
-            direction = (1, 0) if has_h_neighbor else (0, 1)
-            
-            # Сгенерировать уравнение, содержащее 'val' в какой-то позиции
-            # Это трудно. Вместо этого давайте просто генерируем случайные уравнения и видим, подходят ли они
-            # так, чтобы пересечение выравнивалось.
-            # ИЛИ: Сгенерировать уравнение, найти где 'val' в нём, и выравнять.
-            
-            new_eq = Equation.generate(difficulty)
-            parts = new_eq.parts + ['=', new_eq.result]
-            
-            # Найти индексы, где 'val' появляется в new_eq
-            match_indices = [i for i, x in enumerate(parts) if x == val]
-            
-            if not match_indices:
+            if new_eq is None:
                 failures += 1
+                grid.remove_anchor(r, c)
+                if stats is not None:
+                    stats.reject('no_equation')
                 continue
+            if stats is not None:
+                stats.count('draws')
             
-            placed = False
-            random.shuffle(match_indices)
-            for idx in match_indices:
-                # Рассчитать начальную позицию, если выравнять parts[idx] в (r, c)
-                dr, dc = direction
-                start_r = r - idx * dr
-                start_c = c - idx * dc
-                
-                if grid.can_place(new_eq, start_r, start_c, direction):
-                    grid.place_equation(new_eq, start_r, start_c, direction)
-                    placed = True
-                    count += 1
-                    break
+            # Рассчитать начальную позицию, если выравнять parts[idx] в (r, c)
+            start_r = r - idx * dr
+            start_c = c - idx * dc
             
-            if not placed:
+            if grid.can_place(new_eq, start_r, start_c, direction):
+                grid.place_equation(new_eq, start_r, start_c, direction)
+                count += 1
+                if stats is not None:
+                    stats.count('placements')
+            else:
                 failures += 1
+                anchor_failures[r, c] += 1
+                if anchor_failures[r, c] >= PuzzleGenerator.ANCHOR_TRIES:
+                    grid.remove_anchor(r, c)
+                if stats is not None:
+                    # Причина отказа выясняется отдельно, только при включённой телеметрии
+                    stats.reject(grid.refusal_reason(new_eq, start_r, start_c, direction))
 
+        if stats is not None:
+            stats.add_time('growth', time.perf_counter() - start)
+            if count < num_equations:
+                stats.sparse += 1
         return grid
 
     @staticmethod
-    def create_playable_state(grid, difficulty):
+    def generate_within(difficulty, budget=0.5, min_equations=None, stats=None,
+                        strategies=('constructive', 'csp', 'annealing'), constructive_tries=20, rng=random):
+        # Генерация с ограничением по времени. Стратегии идут по очереди, пока не
+        # набрано min_equations уравнений (по умолчанию - число из board_profile):
+        # быстрые перезапуски конструктивного метода, затем перебор по шаблону (csp),
+        # затем локальный поиск (annealing); время, оставшееся после конструктивного
+        # метода, делится между остальными поровну. Если цель не достигнута, а время
+        # осталось (csp и annealing часто заканчивают раньше своей доли), круг
+        # стратегий повторяется до истечения бюджета. Возвращает (лучшая сетка, цель достигнута).
+        # Сетка - с наибольшим числом уравнений среди найденных; бюджет может быть
+        # превышен на одну конструктивную попытку (единицы миллисекунд).
+        rng = resolve_rng(rng)
+        deadline = time.perf_counter() + budget
+        size, num_equations = board_profile(difficulty)
+        target = min_equations or num_equations
+        best = None
+
+        while time.perf_counter() < deadline:
+            for index, method in enumerate(strategies):
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                if method == 'constructive':
+                    for _ in range(constructive_tries):
+                        grid = PuzzleGenerator.generate_puzzle(difficulty, 'constructive', stats, rng)
+                        if grid is not None and (best is None or len(grid.equations) > len(best.equations)):
+                            best = grid
+                            if stats is not None:
+                                stats.count('strategy.constructive')
+                        if (best is not None and len(best.equations) >= target) or time.perf_counter() > deadline:
+                            break
+                else:
+                    share = remaining / (len(strategies) - index)
+                    start = time.perf_counter() if stats is not None else 0
+                    if method == 'csp':
+                        from csp_generator import CSPGenerator
+                        grid = CSPGenerator(difficulty, num_equations=max(target, num_equations),
+                                            time_budget=share, rng=rng).generate()
+                    elif method == 'annealing':
+                        from annealing import AnnealingGenerator
+                        grid = AnnealingGenerator(difficulty, size, time_budget=share, rng=rng).generate()
+                    else:
+                        raise ValueError(f"Неизвестный способ генерации: {method!r}")
+                    if stats is not None:
+                        stats.add_time(method, time.perf_counter() - start)
+                    if grid is not None and (best is None or len(grid.equations) > len(best.equations)):
+                        best = grid
+                        if stats is not None:
+                            stats.count('strategy.' + method)
+                if best is not None and len(best.equations) >= target:
+                    return best, True
+            if stats is not None:
+                stats.count('rounds')
+
+        # Ни одна попытка не дала сетки: ещё до constructive_tries конструктивных попыток
+        # сверх бюджета. None остаётся, только если профиль не позволяет разместить
+        # даже первое уравнение - вызывающий код должен это обработать
+        for _ in range(constructive_tries if best is None else 0):
+            best = PuzzleGenerator.generate_puzzle(difficulty, 'constructive', stats, rng)
+            if best is not None:
+                break
+        return best, best is not None and len(best.equations) >= target
+
+    @staticmethod
+    def create_playable_state(grid, difficulty, unique=False, incremental=False, stats=None, rng=random,
+                              deadline=None):
         # Удалить числа для создания головоломки
         # Возвращает: 
         # - модифицированная сетка (с None для ячеек)
         # - список удалённых чисел (банк)
+        # unique=True - вернуть часть чисел, чтобы решение было единственным
+        # incremental=True - удалять числа по одному с проверкой единственности (punch_holes)
+        # deadline - момент time.perf_counter(), после которого make_unique прекращает проверки
+        rng = resolve_rng(rng)
+        if incremental:
+            return PuzzleGenerator.punch_holes(grid, difficulty, rng=rng)
         
         # Процент чисел для удаления
-        if difficulty == 'easy':
-            prob = 0.4
-        elif difficulty == 'medium':
-            prob = 0.5
-        elif difficulty == 'hard':
-            prob = 0.6
-        else:
-            prob = 0.7
+        prob = PuzzleGenerator.removal_rate(difficulty)
             
         removed_numbers = []
         playable_grid = [[None for _ in range(grid.size)] for _ in range(grid.size)]
@@ -320,7 +1080,7 @@ class PuzzleGenerator:
                 cell = grid.grid[r][c]
                 if cell:
                     val, type_ = cell
-                    if type_ == 'number' and random.random() < prob:
+                    if type_ == 'number' and rng.random() < prob:
                         # Удалить
                         removed_numbers.append(val)
                         playable_grid[r][c] = (None, 'empty_number') # Заполнитель для перетаскивания
@@ -341,10 +1101,415 @@ class PuzzleGenerator:
                 break # Больше нет чисел для удаления
                 
             # Выбрать одно для удаления
-            r, c = random.choice(candidates)
+            r, c = rng.choice(candidates)
             val = playable_grid[r][c][0]
             removed_numbers.append(val)
             playable_grid[r][c] = (None, 'empty_number')
+
+        if unique:
+            PuzzleGenerator.make_unique(grid, playable_grid, removed_numbers, stats=stats, rng=rng,
+                                        deadline=deadline)
         
         removed_numbers.sort()
         return playable_grid, removed_numbers
+
+    @staticmethod
+    def generate_playable(difficulty, method='constructive', unique=True, stats=None, budget=None, rng=random):
+        # Полный цикл для фоновой и пакетной генерации: сетка и игровое состояние.
+        # Функция уровня модуля без Qt, поэтому её можно выполнять в другом процессе.
+        # budget - ограничение времени на весь цикл: GRID_SHARE бюджета на сетку
+        # (generate_within, method не используется), остаток до общего срока - на
+        # единственность; не успевшая проверка оставляет головоломку как есть
+        # (возможно, с несколькими решениями, stats 'deadline').
+        # Возвращает (сетка, игровая сетка, банк, время генерации в секундах)
+        # rng - источник случайности; с одним и тем же зерном (и без budget)
+        # получается одна и та же головоломка, см. puzzle_id. С budget - нет:
+        # срок по часам обрывает проверки единственности в разных местах
+        start = time.perf_counter()
+        rng = resolve_rng(rng)
+        deadline = None
+        if budget is not None:
+            deadline = start + budget
+            grid, _ = PuzzleGenerator.generate_within(difficulty, budget * PuzzleGenerator.GRID_SHARE,
+                                                      stats=stats, rng=rng)
+        else:
+            grid = PuzzleGenerator.generate_puzzle(difficulty, method, stats, rng)
+        if stats is not None:
+            stats.puzzles += 1
+            if grid is None:
+                stats.failed += 1
+        if grid is None:
+            return None, None, [], time.perf_counter() - start
+        holes_start = time.perf_counter()
+        playable_grid, removed_numbers = PuzzleGenerator.create_playable_state(grid, difficulty, unique=unique,
+                                                                               stats=stats, rng=rng,
+                                                                               deadline=deadline)
+        if stats is not None:
+            stats.add_time('holes', time.perf_counter() - holes_start)
+        return grid, playable_grid, removed_numbers, time.perf_counter() - start
+
+    @staticmethod
+    def stream(difficulty, method='constructive', unique=True, stats=None, rng=random, max_failures=100):
+        # Бесконечный ленивый поток головоломок (сетка, игровая сетка, банк).
+        # Неудачные попытки пропускаются; с одним зерном поток всегда один и тот же.
+        # После max_failures неудач подряд (профиль, на котором генератор не
+        # справляется) - RuntimeError, а не бесконечный цикл; None - без ограничения.
+        # Повторы отсеивает dedup.Deduplicator.filter
+        rng = resolve_rng(rng)
+        failures = 0
+        while True:
+            grid, playable_grid, removed_numbers, _ = PuzzleGenerator.generate_playable(
+                difficulty, method, unique, stats, rng=rng)
+            if grid is not None:
+                failures = 0
+                yield grid, playable_grid, removed_numbers
+                continue
+            failures += 1
+            if max_failures is not None and failures >= max_failures:
+                raise RuntimeError(f"Генератор не дал ни одной сетки за {failures} попыток подряд ({difficulty!r})")
+
+    @staticmethod
+    def removal_rate(difficulty):
+        # Доля чисел, которые удаляются из сетки
+        if isinstance(difficulty, BoardProfile):
+            return difficulty.removal_rate
+        if difficulty == 'easy':
+            return 0.4
+        elif difficulty == 'medium':
+            return 0.5
+        elif difficulty == 'hard':
+            return 0.6
+        else:
+            return 0.7
+
+    @staticmethod
+    def punch_holes(grid, difficulty, target_holes=None, target_score=None, rng=random):
+        # Пошаговое удаление чисел с сохранением единственности решения.
+        # По умолчанию удаляется та же доля чисел, что и в create_playable_state.
+        from solver import HolePuncher
+
+        puncher = HolePuncher(grid, rng)
+        if target_holes is None and target_score is None:
+            target_holes = max(2, round(len(puncher.solution) * PuzzleGenerator.removal_rate(difficulty)))
+        return puncher.punch(target_holes, target_score)
+
+    @staticmethod
+    def make_unique(grid, playable_grid, removed_numbers, node_budget=2000, stats=None, rng=random,
+                    deadline=None):
+        # Пока у головоломки есть второе решение, вернуть на место число
+        # в одной из клеток, где два найденных решения расходятся.
+        # Если решатель не уложился в бюджет (node_budget и работа по умолчанию
+        # PuzzleSolver.solve), результат undecided и возвращается случайное число:
+        # с меньшим числом пустых клеток проверка быстрее. Без deadline бюджеты
+        # не зависят от часов, поэтому с одним rng результат всегда один и тот же.
+        # deadline - момент time.perf_counter(): время каждой проверки не выходит за него,
+        # а после него проверки прекращаются и головоломка остаётся частично
+        # восстановленной (единственность не гарантирована, stats 'deadline').
+        # Изменяет playable_grid и removed_numbers, возвращает итог последней проверки.
+        from solver import PuzzleSolver, SolveResult
+
+        time_budget = None
+        result = SolveResult([], 0, False, undecided=True)
+        while True:
+            if deadline is not None:
+                time_budget = deadline - time.perf_counter()
+                if time_budget <= 0:
+                    if stats is not None:
+                        stats.count('deadline')
+                    return result
+            solver = PuzzleSolver(grid.equations, playable_grid, removed_numbers)
+            result = solver.solve(2, node_budget, time_budget)
+            if stats is not None:
+                stats.count('unique_checks')
+                stats.count('solver_nodes', result.nodes)
+                if result.undecided:
+                    stats.count('undecided')
+            if result.unique or (result.complete and not result.solutions):
+                return result
+            if stats is not None:
+                stats.count('restored')
+            if len(result.solutions) >= 2:
+                first, second = result.solutions[:2]
+                r, c = rng.choice([pos for pos in first if first[pos] != second[pos]])
+            else:
+                r, c = rng.choice(solver.holes)
+            removed_numbers.remove(grid.grid[r][c][0])
+            playable_grid[r][c] = grid.grid[r][c]
+
+
+class SolutionChecker:
+    # Инкрементальная проверка решения игрока. Хранит индекс клетка -> уравнения
+    # и статус каждого уравнения: None - не заполнено, True - верно, False - неверно.
+    # При изменении клетки пересчитываются только уравнения через неё, а возвращаются
+    # только изменяемые клетки, статус которых поменялся. Победа - счётчик верных уравнений.
+    def __init__(self, equations, playable_grid):
+        self.values = {}          # клетка с числом -> значение (None - пусто)
+        self.mutable = set()      # клетки, которые заполняет игрок
+        self.cell_equations = {}  # клетка -> номера уравнений
+        self.equations = []       # (функция левой части, клетки чисел, результат последним)
+        for eq, r, c, (dr, dc) in equations:
+            cells = [(r + i * dr, c + i * dc) for i in range(0, len(eq.parts) + 2, 2)]
+            for cell in cells:
+                self.cell_equations.setdefault(cell, []).append(len(self.equations))
+                val, type_ = playable_grid[cell[0]][cell[1]]
+                if type_ == 'empty_number':
+                    self.mutable.add(cell)
+                    self.values[cell] = None
+                else:
+                    self.values[cell] = val
+            self.equations.append((compile_expression(tuple(eq.parts[1::2])), cells))
+        self.status = [None] * len(self.equations)
+        self.correct = 0
+        for index in range(len(self.equations)):
+            self._update(index)
+        self.cell_status = {cell: self._cell_status(cell) for cell in self.mutable}
+
+    @property
+    def solved(self):
+        return self.correct == len(self.equations)
+
+    def _evaluate(self, index):
+        func, cells = self.equations[index]
+        nums = [self.values[cell] for cell in cells]
+        if None in nums:
+            return None
+        try:
+            return func(nums[:-1]) == nums[-1]
+        except ZeroDivisionError:
+            return False
+
+    def _update(self, index):
+        old = self.status[index]
+        new = self._evaluate(index)
+        if old is not new:
+            self.correct += (new is True) - (old is True)
+            self.status[index] = new
+        return old is not new
+
+    def _cell_status(self, cell):
+        # Как в прежней полной проверке: неверное уравнение важнее верного
+        if self.values[cell] is None:
+            return 'neutral'
+        statuses = [self.status[i] for i in self.cell_equations[cell]]
+        if False in statuses:
+            return 'invalid'
+        if True in statuses:
+            return 'valid'
+        return 'neutral'
+
+    def set_value(self, r, c, value):
+        # Записать значение клетки (None - очистить). Возвращает {клетка: статус}
+        # для самой клетки и изменяемых клеток, чей статус поменялся.
+        cell = (r, c)
+        self.values[cell] = value
+        touched = {cell}
+        for index in self.cell_equations.get(cell, ()):
+            if self._update(index):
+                touched.update(self.equations[index][1])
+        changed = {}
+        for pos in touched:
+            if pos not in self.mutable:
+                continue
+            status = self._cell_status(pos)
+            if pos == cell or status != self.cell_status[pos]:
+                self.cell_status[pos] = status
+                changed[pos] = status
+        return changed
+
+
+class GameSession:
+    # Состояние партии без GUI: игровая сетка, банк (мультимножество) и расстановка чисел.
+    # Каждый ход - список изменений (клетка, было, стало); банк получает назад
+    # прежнее значение клетки и отдаёт новое. Проверка - через SolutionChecker,
+    # поэтому ход стоит O(числа уравнений через изменённые клетки).
+    # Ходы возвращают (статусы, изменения банка): {клетка: статус} для клеток,
+    # у которых поменялись значение или статус, и {значение: +n/-n} для банка.
+    def __init__(self, equations, playable_grid, bank):
+        self.playable_grid = playable_grid
+        self.checker = SolutionChecker(equations, playable_grid)
+        self.bank = Counter(bank)
+        self.undo_stack = []
+        self.redo_stack = []
+
+    @property
+    def solved(self):
+        return self.checker.solved
+
+    @property
+    def can_undo(self):
+        return bool(self.undo_stack)
+
+    @property
+    def can_redo(self):
+        return bool(self.redo_stack)
+
+    def value(self, r, c):
+        return self.checker.values.get((r, c))
+
+    def status(self, r, c):
+        return self.checker.cell_status.get((r, c))
+
+    def bank_numbers(self):
+        return sorted(self.bank.elements())
+
+    def _mutable(self, cell):
+        if cell not in self.checker.mutable:
+            raise ValueError(f"Клетку {cell} нельзя изменять")
+
+    def _apply(self, changes):
+        statuses = {}
+        bank = Counter()
+        for cell, old, new in changes:
+            if old is not None:
+                self.bank[old] += 1
+                bank[old] += 1
+            if new is not None:
+                self.bank[new] -= 1
+                bank[new] -= 1
+                if not self.bank[new]:
+                    del self.bank[new]
+            statuses.update(self.checker.set_value(cell[0], cell[1], new))
+        return statuses, {value: delta for value, delta in bank.items() if delta}
+
+    def _move(self, changes):
+        self.undo_stack.append(changes)
+        self.redo_stack.clear()
+        return self._apply(changes)
+
+    def place(self, r, c, value):
+        # Число из банка в клетку; прежнее число клетки возвращается в банк
+        cell = (r, c)
+        self._mutable(cell)
+        if not self.bank[value]:
+            raise ValueError(f"Числа {value} нет в банке")
+        return self._move([(cell, self.value(r, c), value)])
+
+    def clear(self, r, c):
+        # Число из клетки обратно в банк
+        cell = (r, c)
+        self._mutable(cell)
+        old = self.value(r, c)
+        if old is None:
+            return {}, {}
+        return self._move([(cell, old, None)])
+
+    def move(self, src, dst):
+        # Число из клетки src в клетку dst; прежнее число dst возвращается в банк
+        self._mutable(src)
+        self._mutable(dst)
+        value = self.value(*src)
+        if value is None:
+            raise ValueError(f"Клетка {src} пуста")
+        if src == dst:
+            return {}, {}
+        return self._move([(src, value, None), (dst, self.value(*dst), value)])
+
+    def swap(self, a, b):
+        # Обменять числа двух клеток (любая из них может быть пустой)
+        self._mutable(a)
+        self._mutable(b)
+        va, vb = self.value(*a), self.value(*b)
+        if a == b or va == vb:
+            return {}, {}
+        # Через банк: a освобождается, b получает va, a получает vb; банк в итоге не меняется
+        return self._move([(a, va, None), (b, vb, va), (a, None, vb)])
+
+    def undo(self):
+        if not self.undo_stack:
+            return {}, {}
+        changes = self.undo_stack.pop()
+        self.redo_stack.append(changes)
+        return self._apply([(cell, new, old) for cell, old, new in reversed(changes)])
+
+    def redo(self):
+        if not self.redo_stack:
+            return {}, {}
+        changes = self.redo_stack.pop()
+        self.undo_stack.append(changes)
+        return self._apply(changes)
+
+
+class BatchValidator:
+    # Проверка множества решений одной головоломки за один проход по столбцам.
+    # Значения каждой изменяемой клетки во всех решениях собираются в столбец,
+    # и уравнение вычисляется сразу над столбцами через map с operator.mul/floordiv/
+    # add/sub/eq: цикл по решениям идёт внутри map, а не в байткоде Python.
+    # Вердикты как у SolutionChecker: None - в уравнении есть пустая клетка,
+    # True - верно, False - неверно (в том числе при делении на ноль).
+    def __init__(self, equations, playable_grid):
+        self.cells = []       # изменяемые клетки в порядке столбцов
+        self.cell_index = {}  # клетка -> номер столбца
+        self.constants = {}   # клетка с данным числом -> значение
+        self.equations = []   # (операторы, клетки чисел, результат последним)
+        for eq, r, c, (dr, dc) in equations:
+            cells = [(r + i * dr, c + i * dc) for i in range(0, len(eq.parts) + 2, 2)]
+            for cell in cells:
+                val, type_ = playable_grid[cell[0]][cell[1]]
+                if type_ == 'empty_number':
+                    if cell not in self.cell_index:
+                        self.cell_index[cell] = len(self.cells)
+                        self.cells.append(cell)
+                else:
+                    self.constants[cell] = val
+            self.equations.append((tuple(eq.parts[1::2]), cells))
+
+    def columns(self, submissions):
+        # submissions - словари {(r, c): значение}; клетки, которых нет в словаре, пусты
+        return [[submission.get(cell) for submission in submissions] for cell in self.cells]
+
+    def validate_columns(self, columns, count):
+        # Вердикты по уравнениям: для каждого уравнения список по решениям
+        verdicts = []
+        for ops, cells in self.equations:
+            cols = [columns[self.cell_index[cell]] if cell in self.cell_index
+                    else [self.constants[cell]] * count for cell in cells]
+            verdicts.append(self._evaluate(ops, cols))
+        return verdicts
+
+    def validate(self, submissions):
+        # Вердикты по решениям: для каждого решения список по уравнениям
+        verdicts = self.validate_columns(self.columns(submissions), len(submissions))
+        if not verdicts:
+            return [[] for _ in submissions]
+        return [list(row) for row in zip(*verdicts)]
+
+    def solved(self, submissions):
+        return [all(v is True for v in row) for row in self.validate(submissions)]
+
+    @staticmethod
+    def _accumulate(total, sign, term):
+        if total is None:
+            return term
+        return list(map(operator.add if sign > 0 else operator.sub, total, term))
+
+    @staticmethod
+    def _evaluate(ops, cols):
+        if not any(None in col for col in cols):
+            try:
+                # Слагаемые вычисляются столбцами с учётом приоритета '*' и '/'
+                total = None
+                sign = 1
+                term = cols[0]
+                for op, col in zip(ops, cols[1:-1]):
+                    if op in _TERM_OPS:
+                        term = list(map(_TERM_OPS[op], term, col))
+                        continue
+                    total = BatchValidator._accumulate(total, sign, term)
+                    sign = 1 if op == '+' else -1
+                    term = col
+                total = BatchValidator._accumulate(total, sign, term)
+                return list(map(operator.eq, total, cols[-1]))
+            except ZeroDivisionError:
+                pass
+        # Пустые клетки или деление на ноль хотя бы в одном решении - построчно
+        func = compile_expression(ops)
+        verdicts = []
+        for nums in zip(*cols):
+            if None in nums:
+                verdicts.append(None)
+                continue
+            try:
+                verdicts.append(func(nums[:-1]) == nums[-1])
+            except ZeroDivisionError:
+                verdicts.append(False)
+        return verdicts
@@ -0,0 +1,180 @@
+from collections import Counter
+
+from rating import RatingEngine
+from solver import lhs_interval
+
+# Подсказки в идущей партии: какая пустая клетка сейчас определяется однозначно и почему.
+#
+# Варианты клеток каждого уравнения (по числам банка) хранятся между подсказками.
+# Ход помечает устаревшими только уравнения через изменённую клетку и уравнения,
+# варианты которых используют число, ушедшее из банка; число, вернувшееся в банк, -
+# только уравнения, в пустую клетку которых оно проходит по границам (lhs_interval).
+# В обоих случаях - если остаток числа меньше числа пустых клеток уравнения.
+# Подсказка пересчитывает только устаревшие уравнения, поэтому её время не зависит
+# от числа сделанных ходов и почти не зависит от размера поля.
+
+
+class Hint:
+    # kind: 'mistake' или правило из rating.RULES (single, equation, intersection, bank)
+    def __init__(self, kind, cells, value=None, equations=()):
+        self.kind = kind
+        self.cells = cells            # клетки подсказки; для mistake - все неверные клетки
+        self.value = value            # число, которое определяется в клетке (None для mistake)
+        self.equations = equations    # тексты уравнений, из которых следует вывод
+
+    @property
+    def cell(self):
+        return self.cells[0]
+
+    def message(self):
+        cells = ", ".join(f"({r + 1}, {c + 1})" for r, c in self.cells)
+        if self.kind == 'mistake':
+            return f"Неверные числа в клетках: {cells}"
+        if self.kind == 'single':
+            return f"В уравнении {self.equations[0]} одна пустая клетка {cells}: в ней {self.value}"
+        if self.kind == 'equation':
+            return f"В уравнении {self.equations[0]} в клетку {cells} из банка подходит только {self.value}"
+        if self.kind == 'intersection':
+            return f"Клетка {cells} на пересечении уравнений {' и '.join(self.equations)}: подходит только {self.value}"
+        return f"Число {self.value} из банка подходит только в клетки {cells}"
+
+
+class HintEngine(RatingEngine):
+    # Состояние синхронизируется через set_value после каждого хода (в том числе отмены и повтора).
+    # solution_grid - сетка решения (CrossMathGrid): по ней отмечаются неверные числа.
+    MEMO_LIMIT = 20000  # варианты уравнений в памяти, после которых кэш _supports сбрасывается
+
+    def __init__(self, equations, playable_grid, bank, solution_grid):
+        super().__init__(equations, playable_grid, bank)
+        self.hole_index = self.solver.hole_index
+        self.solution = [solution_grid.grid[r][c][0] for r, c in self.holes]
+        self.assignment = [None] * len(self.holes)
+        self.counts = Counter(bank)
+        self.wrong = set()
+        self.unknown = [len(self._unknown(i, self.assignment)) for i in range(len(self.equations))]
+        self.cached = {}      # уравнение -> (пустые клетки, варианты)
+        self.value_eqs = {}   # число -> уравнения, в вариантах которых оно встречается
+        self.dirty = set(range(len(self.equations)))
+
+    def set_value(self, r, c, value):
+        var = self.hole_index.get((r, c))
+        if var is None:
+            return
+        old = self.assignment[var]
+        if old == value:
+            return
+        for index in self.var_eqs[var]:
+            self.unknown[index] += (old is not None) - (value is not None)
+        self.dirty.update(self.var_eqs[var])
+        # Варианты уравнения с n пустыми клетками зависят от остатка числа в банке
+        # только пока остаток меньше n (см. _supports), поэтому изменение остатка
+        # помечает уравнение, только если остаток до или после хода меньше n
+        if value is not None:
+            self.counts[value] -= 1
+            left = self.counts[value]
+            self.dirty.update(i for i in self.value_eqs.get(value, ()) if left < self.unknown[i])
+        self.assignment[var] = value
+        if old is not None:
+            before = self.counts[old]
+            self.counts[old] += 1
+            values = [v for v, n in self.counts.items() if n > 0]
+            low, high = min(values), max(values)
+            self.dirty.update(i for i, n in enumerate(self.unknown)
+                              if before < n and self._could_take(i, old, low, high))
+        if value is not None and value != self.solution[var]:
+            self.wrong.add(var)
+        else:
+            self.wrong.discard(var)
+
+    def _could_take(self, index, value, low, high):
+        # Может ли число value встать в одну из пустых клеток уравнения: левая часть
+        # при этом числе и остальных пустых клетках в границах банка [low, high] должна
+        # пересекаться с допустимым результатом. Если нет, ни один вариант уравнения
+        # не использует value и от его возврата в банк варианты не меняются
+        _, slots, ops = self.equations[index]
+        lo = []
+        hi = []
+        for var, fixed in slots:
+            if var >= 0 and self.assignment[var] is None:
+                lo.append(low)
+                hi.append(high)
+            else:
+                fixed = fixed if var < 0 else self.assignment[var]
+                lo.append(fixed)
+                hi.append(fixed)
+        if min(lo) < 1:
+            return True
+        for k, (var, _) in enumerate(slots):
+            if var < 0 or self.assignment[var] is not None:
+                continue
+            saved = lo[k], hi[k]
+            lo[k] = hi[k] = value
+            left_lo, left_hi = lhs_interval(ops, lo[:-1], hi[:-1])
+            fits = left_lo <= hi[-1] and lo[-1] <= left_hi
+            lo[k], hi[k] = saved
+            if fits:
+                return True
+        return False
+
+    def _refresh(self):
+        if len(self._memo) > self.MEMO_LIMIT:
+            self._memo.clear()
+        values = set(v for v, n in self.counts.items() if n > 0)
+        domains = [values] * len(self.holes)
+        for index in self.dirty:
+            unknown = self._unknown(index, self.assignment)
+            supports = self._supports(index, unknown, domains, self.assignment, self.counts) if unknown else None
+            if supports is None:
+                self.cached.pop(index, None)
+                continue
+            self.cached[index] = (unknown, supports)
+            for support in supports:
+                for value in support:
+                    self.value_eqs.setdefault(value, set()).add(index)
+        self.dirty.clear()
+
+    def describe(self, index):
+        # Текст уравнения с текущими числами игрока; пустые клетки - '?'
+        _, slots, ops = self.equations[index]
+        nums = []
+        for var, value in slots:
+            if var >= 0:
+                value = self.assignment[var]
+            nums.append('?' if value is None else str(value))
+        parts = [nums[0]]
+        for op, num in zip(ops, nums[1:-1]):
+            parts += [op, num]
+        return f"{' '.join(parts)} = {nums[-1]}"
+
+    def mistakes(self):
+        # Клетки, числа в которых не совпадают с решением
+        return sorted(self.holes[var] for var in self.wrong)
+
+    def hint(self):
+        # Ближайший ход (Hint) или None, если без перебора ход не найти
+        if self.wrong:
+            return Hint('mistake', self.mistakes())
+        self._refresh()
+        for kind in ('single', 'equation'):
+            for index, (unknown, supports) in sorted(self.cached.items()):
+                if kind == 'single' and len(unknown) > 1:
+                    continue
+                for var, support in zip(unknown, supports):
+                    if len(support) == 1:
+                        return Hint(kind, [self.holes[var]], next(iter(support)), [self.describe(index)])
+
+        values = set(v for v, n in self.counts.items() if n > 0)
+        candidates = [None if value is not None else set(values) for value in self.assignment]
+        for unknown, supports in self.cached.values():
+            for var, support in zip(unknown, supports):
+                candidates[var] &= support
+        for var, values in enumerate(candidates):
+            if values is not None and len(values) == 1:
+                equations = [self.describe(i) for i in self.var_eqs[var] if i in self.cached]
+                return Hint('intersection', [self.holes[var]], next(iter(values)), equations)
+        deductions = self._hidden(candidates, self.counts)
+        if deductions:
+            value = min(deductions.values())
+            cells = sorted(self.holes[var] for var, v in deductions.items() if v == value)
+            return Hint('bank', cells, value)
+        return None
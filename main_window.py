@@ -1,8 +1,22 @@
+import time
+
 from PyQt6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
-                             QGridLayout, QPushButton, QComboBox, QMessageBox, QLabel)
+                             QPushButton, QComboBox, QMessageBox, QLabel)
 from PyQt6.QtCore import Qt, QTimer
-from game_logic import PuzzleGenerator
-from widgets import DropCell, NumberBank
+from PyQt6.QtGui import QKeySequence
+from game_logic import PuzzleGenerator, GameSession
+from widgets import CellGrid, BoardWidget, NumberBank
+from puzzle_pool import PuzzlePool
+from hints import HintEngine
+
+# Сетки от этого размера рисуются одним виджетом BoardWidget, меньшие - клетками DropCell
+PAINTED_BOARD_SIZE = 13
+# Наибольшая сторона нарисованного поля в пикселях: на больших сетках клетки уменьшаются
+MAX_BOARD_PIXELS = 880
+# Время на головоломку (сетка и проверка единственности) при генерации в потоке GUI,
+# когда фоновая очередь пуста, с. Сетки может не быть, только если профиль
+# сложности не позволяет поставить ни одного уравнения - тогда показывается ошибка
+GENERATION_BUDGET = 0.5
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -22,11 +36,16 @@ class MainWindow(QMainWindow):
         self.grid_centering_layout = QHBoxLayout()
         self.grid_centering_layout.addStretch()
         
-        self.grid_layout = QGridLayout()
-        self.grid_layout.setSpacing(4)
-        self.grid_layout.setContentsMargins(0, 0, 0, 0)
+        # Два вида поля с общим интерфейсом; показывается одно из них
+        self.cell_grid = CellGrid()
+        self.board_widget = BoardWidget()
+        for board in (self.cell_grid, self.board_widget):
+            board.dropped.connect(self.on_cell_dropped)
+            board.cleared.connect(self.on_cell_cleared)
+            board.hide()
+            self.grid_centering_layout.addWidget(board)
+        self.board = self.cell_grid
         
-        self.grid_centering_layout.addLayout(self.grid_layout)
         self.grid_centering_layout.addStretch()
         
         self.board_layout.addLayout(self.grid_centering_layout)
@@ -68,6 +87,28 @@ class MainWindow(QMainWindow):
         self.new_game_btn.clicked.connect(self.start_new_game)
         self.controls_layout.addWidget(self.new_game_btn)
 
+        # Отмена и повтор ходов
+        self.history_layout = QHBoxLayout()
+        self.undo_btn = QPushButton("Отменить")
+        self.undo_btn.setShortcut(QKeySequence.StandardKey.Undo)
+        self.undo_btn.clicked.connect(self.undo)
+        self.redo_btn = QPushButton("Повторить")
+        self.redo_btn.setShortcut(QKeySequence.StandardKey.Redo)
+        self.redo_btn.clicked.connect(self.redo)
+        self.history_layout.addWidget(self.undo_btn)
+        self.history_layout.addWidget(self.redo_btn)
+        self.controls_layout.addLayout(self.history_layout)
+
+        # Подсказка: какая клетка определяется однозначно и почему
+        self.hint_btn = QPushButton("Подсказка")
+        self.hint_btn.setShortcut("H")
+        self.hint_btn.clicked.connect(self.show_hint)
+        self.controls_layout.addWidget(self.hint_btn)
+        self.hint_label = QLabel()
+        self.hint_label.setWordWrap(True)
+        self.hint_label.setStyleSheet("color: #555;")
+        self.controls_layout.addWidget(self.hint_label)
+
         self.controls_layout.addSpacing(20)
         self.controls_layout.addWidget(QLabel("Доступные числа:"))
         
@@ -79,210 +120,142 @@ class MainWindow(QMainWindow):
         self.main_layout.addWidget(self.board_container, stretch=1)
         self.main_layout.addWidget(self.controls_container)
 
-        self.current_grid_state = None
         self.solution_grid = None
-        self.cells = {} # Карта (r, c) -> DropCell
+        self.session = None  # GameSession: всё состояние партии, окно только отображает его
+        self.hints = None    # HintEngine той же партии, обновляется в show_update
+        self.board_seconds = None  # время от запроса новой игры до показа поля
+        self.win_pending = False   # handle_win уже запланирован
+
+        # Фоновая генерация головоломок; статистика очередей - в строке состояния
+        self.puzzle_pool = PuzzlePool(self)
+        self.puzzle_pool.stats_changed.connect(self.show_pool_stats)
 
         # Запуск начальной игры
         self.start_new_game()
 
     def start_new_game(self):
+        started = time.perf_counter()
         diff_text = self.diff_combo.currentText()
         difficulty = self.diff_map.get(diff_text, "easy")
         
-        # Генерация головоломки
-        # Это может занять некоторое время, (можно вынести в отдельный поток)
-        generated = PuzzleGenerator.generate_puzzle(difficulty)
+        # Готовая головоломка из фоновой очереди; если очередь ещё пуста
+        # (например, при запуске), генерируем на месте с ограничением по времени
+        puzzle = self.puzzle_pool.pop(difficulty)
+        if puzzle is None:
+            generated, playable_grid, removed_numbers, _ = PuzzleGenerator.generate_playable(
+                difficulty, budget=GENERATION_BUDGET)
+        else:
+            generated, playable_grid, removed_numbers = puzzle
         if not generated:
             QMessageBox.warning(self, "Error", "Failed to generate puzzle. Please try again.")
             return
 
         self.solution_grid = generated
-        playable_grid, removed_numbers = PuzzleGenerator.create_playable_state(generated, difficulty)
-        self.current_grid_state = playable_grid
+        self.session = GameSession(generated.equations, playable_grid, removed_numbers)
+        self.hints = HintEngine(generated.equations, playable_grid, removed_numbers, generated)
+        self.hint_label.clear()
 
         # Настройка UI сетки
         self.clear_grid()
-        
         size = len(playable_grid)
-        for r in range(size):
-            for c in range(size):
-                cell_data = playable_grid[r][c]
-                if cell_data:
-                    val, type_ = cell_data
-                    
-                    cell_widget = DropCell(r, c, self)
-                    cell_widget.dropped.connect(self.on_cell_dropped)
-                    cell_widget.cleared.connect(self.on_cell_cleared)
-                    self.cells[(r, c)] = cell_widget
-                    
-                    if type_ == 'empty_number':
-                        cell_widget.setStyleSheet(cell_widget.default_style)
-                    else:
-                        # Это статическая часть (оператор, равно или данное число)
-                        cell_widget.setText(str(val))
-                        cell_widget.current_value = val # Для проверки
-                        cell_widget.is_droppable = False # Нельзя перетаскивать
-                        cell_widget.setAcceptDrops(False) # Сюда нельзя бросать
-                        # Стилизуем иначе для статического контента
-                        cell_widget.setStyleSheet("""
-                            QLabel {
-                                background-color: #ddd;
-                                border: 1px solid #999;
-                                border-radius: 3px;
-                                font-size: 14px;
-                                font-weight: bold;
-                                color: #000;
-                            }
-                        """)
-                    
-                    self.grid_layout.addWidget(cell_widget, r, c)
-                else:
-                    # Пустое пространство, можно добавить разделитель или ничего
-                    pass
+        if size >= PAINTED_BOARD_SIZE:
+            self.board = self.board_widget
+            step = MAX_BOARD_PIXELS // size
+            self.board.set_board(playable_grid, cell_size=max(16, min(40, step - BoardWidget.GAP)))
+        else:
+            self.board = self.cell_grid
+            self.board.set_board(playable_grid)
+        self.board.show()
+        self.update_history_buttons()
+        QTimer.singleShot(0, lambda: self.board_shown(started))
 
         # Настройка банка чисел
         self.number_bank.set_numbers(removed_numbers)
 
+    def show_pool_stats(self, stats):
+        difficulty = self.diff_map.get(self.diff_combo.currentText(), "easy")
+        info = stats[difficulty]
+        latency = f"{info['latency'] * 1000:.0f} мс" if info['latency'] is not None else "-"
+        board = f"{self.board_seconds * 1000:.0f} мс" if self.board_seconds is not None else "-"
+        errors = f" | ошибок генерации: {info['errors']}" if info['errors'] else ""
+        self.statusBar().showMessage(
+            f"Готово головоломок: {info['depth']}/{info['target']} | "
+            f"в работе: {info['pending']} | время генерации: {latency} | показ поля: {board}{errors}")
+
+    def closeEvent(self, event):
+        self.puzzle_pool.shutdown()
+        super().closeEvent(event)
+
     def clear_grid(self):
-        # Удаление всех виджетов из макета сетки
-        while self.grid_layout.count():
-            item = self.grid_layout.takeAt(0)
-            widget = item.widget()
-            if widget:
-                widget.deleteLater()
-        self.cells = {}
-
-    def on_cell_dropped(self, r, c, value, from_bank):
-        if from_bank:
-            self.number_bank.remove_number(value)
-        self.check_solution()
-
-    def on_cell_cleared(self, value):
-        self.number_bank.add_number(value)
-        self.check_solution()
-
-    def evaluate_expression(self, parts):
-        if not parts:
-            return None
-        try:
-            # Преобразуем список частей в строку выражения
-            # Заменяем '/' на '//' для целочисленного деления
-            expr = "".join(str(p) for p in parts).replace('/', '//')
-            return eval(expr)
-        except (ValueError, IndexError, TypeError, ZeroDivisionError, SyntaxError):
-            return None
-
-    def check_solution(self):
-        if not self.solution_grid:
+        # Клетки не удаляются: поле переиспользует их в следующей игре
+        self.board.hide()
+
+    def board_shown(self, started):
+        # Вызывается из цикла событий после отрисовки нового поля
+        self.board_seconds = time.perf_counter() - started
+        self.show_pool_stats(self.puzzle_pool.stats())
+
+    def on_cell_dropped(self, r, c, value, src_r, src_c):
+        if not self.session:
             return
+        if src_r < 0:
+            self.show_update(self.session.place(r, c, value))
+        else:
+            self.show_update(self.session.move((src_r, src_c), (r, c)))
 
-        cell_status = {} # (r,c) -> 'neutral', 'valid', 'invalid'
-        # Инициализация всех изменяемых ячеек как нейтральных
-        for pos, cell in self.cells.items():
-            if cell.acceptDrops():
-                cell_status[pos] = 'neutral'
+    def on_cell_cleared(self, r, c, value):
+        if self.session:
+            self.show_update(self.session.clear(r, c))
 
-        all_equations_correct = True
-        
-        # Итерация по всем уравнениям, определенным в сетке решения
-        for eq_data in self.solution_grid.equations:
-            eq_obj, start_r, start_c, direction = eq_data
-            dr, dc = direction
-            
-            # Длина уравнения в сетке: части + '=' + результат
-            length = len(eq_obj.parts) + 2
-            
-            equation_cells = []
-            lhs_parts = []
-            rhs_val = None
-            is_complete = True
-            
-            for i in range(length):
-                r = start_r + i * dr
-                c = start_c + i * dc
-                
-                if (r, c) not in self.cells:
-                    is_complete = False
-                    break
-                    
-                cell = self.cells[(r, c)]
-                val = cell.current_value
-                
-                if val is None:
-                    is_complete = False
-                    break
-                
-                equation_cells.append((r, c))
-                
-                if i < len(eq_obj.parts):
-                    lhs_parts.append(val)
-                elif i == len(eq_obj.parts):
-                    # Это '='
-                    pass
-                elif i == len(eq_obj.parts) + 1:
-                    rhs_val = val
-            
-            if not is_complete:
-                all_equations_correct = False
-                continue
-                
-            # Вычисление
-            calc_res = self.evaluate_expression(lhs_parts)
-            is_correct = False
-            if calc_res is not None and rhs_val is not None:
-                 if abs(calc_res - float(rhs_val)) < 0.001:
-                     is_correct = True
-            
-            if not is_correct:
-                all_equations_correct = False
-            
-            # Обновление статусов ячеек
-            for r, c in equation_cells:
-                if (r, c) in cell_status: # Обновляем только изменяемые ячейки
-                    if not is_correct:
-                        cell_status[(r, c)] = 'invalid'
-                    else:
-                        # Помечаем как верное, только если оно еще не помечено как неверное (неверное имеет приоритет)
-                        if cell_status[(r, c)] != 'invalid':
-                            cell_status[(r, c)] = 'valid'
-
-        # Применение стилей
-        for (r, c), status in cell_status.items():
-            cell = self.cells[(r, c)]
-            if cell.current_value is None:
-                cell.setStyleSheet(cell.default_style)
-                continue
-                
-            if status == 'invalid':
-                cell.setStyleSheet("""
-                    QLabel {
-                        background-color: #FFB6C1;
-                        border: 2px solid #FF69B4;
-                        border-radius: 5px;
-                        font-size: 18px;
-                        color: #000;
-                        font-weight: bold;
-                    }
-                """)
-            elif status == 'valid':
-                cell.setStyleSheet("""
-                    QLabel {
-                        background-color: #90EE90;
-                        border: 2px solid #228B22;
-                        border-radius: 5px;
-                        font-size: 18px;
-                        color: #000;
-                        font-weight: bold;
-                    }
-                """)
-            else:
-                cell.setStyleSheet(cell.filled_style)
-
-        if all_equations_correct:
+    def undo(self):
+        if self.session:
+            self.show_update(self.session.undo())
+
+    def redo(self):
+        if self.session:
+            self.show_update(self.session.redo())
+
+    def show_update(self, update):
+        # Перенести результат хода GameSession на поле и в банк: меняются только
+        # клетки с новым значением или статусом и фишки затронутых чисел
+        statuses, bank = update
+        for (r, c), status in statuses.items():
+            value = self.session.value(r, c)
+            if self.board.value(r, c) != value:
+                self.board.set_value(r, c, value)
+            self.hints.set_value(r, c, value)
+            self.board.set_status(r, c, status)
+        if statuses:
+            self.hint_label.clear()
+        for value, delta in bank.items():
+            for _ in range(abs(delta)):
+                if delta > 0:
+                    self.number_bank.add_number(value)
+                else:
+                    self.number_bank.remove_number(value)
+        self.update_history_buttons()
+
+        # Один вызов handle_win на победу, даже если поле решено снова (отмена и повтор)
+        # раньше, чем он сработал
+        if statuses and self.session.solved and not self.win_pending:
+            self.win_pending = True
             QTimer.singleShot(500, self.handle_win)
 
+    def show_hint(self):
+        if not self.hints or self.session.solved:
+            return
+        hint = self.hints.hint()
+        self.hint_label.setText(hint.message() if hint else "Очевидного хода нет: попробуйте предположить число")
+
+    def update_history_buttons(self):
+        self.undo_btn.setEnabled(self.session.can_undo)
+        self.redo_btn.setEnabled(self.session.can_redo)
+
     def handle_win(self):
+        # За полсекунды до вызова ход могли отменить
+        self.win_pending = False
+        if not self.session or not self.session.solved:
+            return
         diff_text = self.diff_combo.currentText()
         difficulty = self.diff_map.get(diff_text, "easy")
         points = self.score_coeffs.get(difficulty, 10)
@@ -0,0 +1,183 @@
+import mmap
+import random
+import struct
+
+from game_logic import CrossMathGrid, Equation, OP_CODES
+
+# Компактное двоичное представление головоломки и файл-библиотека с индексом.
+#
+# Запись головоломки:
+#   заголовок      <BBHH  размер сетки, код сложности, число уравнений, байт в маске пустых клеток
+#   уравнения      по записи фиксированной длины на уравнение:
+#                  <BBBB4Hi  строка, столбец, направление (0 - по горизонтали, 1 - по вертикали),
+#                  коды операторов (по 2 бита, число операторов в старших битах),
+#                  до 4 операндов (неиспользуемые = 0) и результат
+#   маска          битовое множество пустых клеток; клетки с числами нумеруются
+#                  в порядке первого появления в уравнениях (операнды, затем результат)
+# Банк не хранится: это отсортированные значения пустых клеток.
+#
+# Библиотека: MAGIC, записи подряд, индекс (по сложностям: смещения <Q, затем длины <I),
+# в конце - FOOTER с положением индекса и числом записей каждой сложности.
+# Файл открывается через mmap, и запись читается по индексу без разбора остального файла.
+
+DIFFICULTIES = ('easy', 'medium', 'hard', 'expert')
+
+HEADER = struct.Struct('<BBHH')
+EQUATION = struct.Struct('<BBBB4Hi')
+MAX_OPERANDS = 4
+
+MAGIC = b'CMLB'
+VERSION = 1
+FOOTER = struct.Struct('<Q4I4sH')
+OFFSET = struct.Struct('<Q')
+LENGTH = struct.Struct('<I')
+
+
+def _number_cells(equations):
+    # Клетки с числами в порядке первого появления в уравнениях
+    cells = {}
+    for eq, r, c, (dr, dc) in equations:
+        for i in range(0, len(eq.parts) + 2, 2):
+            cells.setdefault((r + i * dr, c + i * dc), len(cells))
+    return cells
+
+
+def encode_puzzle(grid, playable_grid, difficulty):
+    # Сетка решения + игровое состояние -> bytes
+    out = bytearray()
+    cells = _number_cells(grid.equations)
+    mask_bytes = (len(cells) + 7) // 8
+    if grid.size > 255 or len(grid.equations) > 0xFFFF or mask_bytes > 0xFFFF:
+        raise ValueError("Сетка слишком велика для формата")
+    out += HEADER.pack(grid.size, DIFFICULTIES.index(difficulty), len(grid.equations), mask_bytes)
+    for eq, r, c, direction in grid.equations:
+        nums = eq.parts[0::2]
+        ops = eq.parts[1::2]
+        if len(nums) > MAX_OPERANDS:
+            raise ValueError("Слишком много операндов в уравнении")
+        code = len(ops) << 6
+        for k, op in enumerate(ops):
+            code |= OP_CODES.index(op) << (2 * k)
+        nums = list(nums) + [0] * (MAX_OPERANDS - len(nums))
+        out += EQUATION.pack(r, c, 0 if direction == (0, 1) else 1, code, *nums, eq.result)
+
+    mask = 0
+    for (r, c), bit in cells.items():
+        cell = playable_grid[r][c]
+        if cell and cell[1] == 'empty_number':
+            mask |= 1 << bit
+    out += mask.to_bytes(mask_bytes, 'little')
+    return bytes(out)
+
+
+def decode_puzzle(data, grid_cls=CrossMathGrid):
+    # bytes -> (сетка решения, игровая сетка, банк, сложность).
+    # Первые три значения - то, что использует MainWindow.start_new_game.
+    size, difficulty, count, mask_bytes = HEADER.unpack_from(data, 0)
+    grid = grid_cls(size)
+    offset = HEADER.size
+    for _ in range(count):
+        r, c, direction, code, *nums, result = EQUATION.unpack_from(data, offset)
+        offset += EQUATION.size
+        num_ops = code >> 6
+        parts = [nums[0]]
+        for k in range(num_ops):
+            parts += [OP_CODES[(code >> (2 * k)) & 3], nums[k + 1]]
+        grid.place_equation(Equation(parts, result), r, c, (0, 1) if direction == 0 else (1, 0))
+
+    mask = int.from_bytes(bytes(data[offset:offset + mask_bytes]), 'little')
+    playable_grid = [list(row) for row in grid.grid]
+    removed_numbers = []
+    for (r, c), bit in _number_cells(grid.equations).items():
+        if mask >> bit & 1:
+            removed_numbers.append(grid.grid[r][c][0])
+            playable_grid[r][c] = (None, 'empty_number')
+    removed_numbers.sort()
+    return grid, playable_grid, removed_numbers, DIFFICULTIES[difficulty]
+
+
+class LibraryWriter:
+    # Потоковая запись библиотеки: записи пишутся сразу, в памяти остаются только смещения
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC)
+        self.offsets = {d: [] for d in DIFFICULTIES}
+        self.lengths = {d: [] for d in DIFFICULTIES}
+
+    def add(self, record, difficulty):
+        # record - результат encode_puzzle
+        self.offsets[difficulty].append(self.file.tell())
+        self.lengths[difficulty].append(len(record))
+        self.file.write(record)
+
+    def add_puzzle(self, grid, playable_grid, difficulty):
+        self.add(encode_puzzle(grid, playable_grid, difficulty), difficulty)
+
+    def close(self):
+        index_offset = self.file.tell()
+        for d in DIFFICULTIES:
+            self.file.write(b''.join(OFFSET.pack(o) for o in self.offsets[d]))
+            self.file.write(b''.join(LENGTH.pack(n) for n in self.lengths[d]))
+        self.file.write(FOOTER.pack(index_offset, *(len(self.offsets[d]) for d in DIFFICULTIES), MAGIC, VERSION))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PuzzleLibrary:
+    # Библиотека, открытая через mmap. Положение записи в индексе вычисляется
+    # по числу записей каждой сложности, поэтому индекс целиком не читается.
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:len(MAGIC)] != MAGIC:
+            raise ValueError("Не файл библиотеки головоломок")
+        index_offset, *counts, magic, version = FOOTER.unpack_from(self.data, len(self.data) - FOOTER.size)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Неподдерживаемая версия библиотеки")
+        self.counts = dict(zip(DIFFICULTIES, counts))
+        # Начало индекса каждой сложности
+        self.index = {}
+        position = index_offset
+        for d in DIFFICULTIES:
+            self.index[d] = position
+            position += self.counts[d] * (OFFSET.size + LENGTH.size)
+
+    def __len__(self):
+        return sum(self.counts.values())
+
+    def count(self, difficulty):
+        return self.counts[difficulty]
+
+    def record(self, difficulty, i):
+        # Двоичная запись i-й головоломки сложности
+        if not 0 <= i < self.counts[difficulty]:
+            raise IndexError(i)
+        base = self.index[difficulty]
+        offset, = OFFSET.unpack_from(self.data, base + i * OFFSET.size)
+        length, = LENGTH.unpack_from(self.data, base + self.counts[difficulty] * OFFSET.size + i * LENGTH.size)
+        return self.data[offset:offset + length]
+
+    def load(self, difficulty, i, grid_cls=CrossMathGrid):
+        # (сетка решения, игровая сетка, банк)
+        grid, playable_grid, removed_numbers, _ = decode_puzzle(self.record(difficulty, i), grid_cls)
+        return grid, playable_grid, removed_numbers
+
+    def random(self, difficulty, rng=random, grid_cls=CrossMathGrid):
+        if not self.counts[difficulty]:
+            return None
+        return self.load(difficulty, rng.randrange(self.counts[difficulty]), grid_cls)
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
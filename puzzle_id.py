@@ -0,0 +1,120 @@
+import zlib
+import random
+import struct
+from collections import OrderedDict
+
+from game_logic import PuzzleGenerator, GENERATOR_VERSION
+
+# Идентификатор головоломки вместо её хранения: по зерну, сложности и версии
+# генератора головоломка генерируется заново и получается той же самой.
+#
+# 16 байт <BBHQI: версия генератора, код сложности, флаги (бит 0 - единственное решение),
+# зерно, CRC32 первых 12 байт (защита от опечаток в id из URL).
+# Генерация идёт конструктивным методом без ограничения по времени: у csp и annealing
+# результат зависит от того, сколько успели перебрать, и не воспроизводится.
+
+DIFFICULTIES = ('easy', 'medium', 'hard', 'expert')
+
+ID = struct.Struct('<BBHQ')
+CHECK = struct.Struct('<I')
+SIZE = ID.size + CHECK.size
+
+UNIQUE = 1
+
+
+class PuzzleId:
+    def __init__(self, difficulty, seed, unique=True, version=GENERATOR_VERSION):
+        if difficulty not in DIFFICULTIES:
+            raise ValueError(f"Неизвестная сложность: {difficulty!r}")
+        self.difficulty = difficulty
+        self.seed = seed & 0xFFFFFFFFFFFFFFFF
+        self.unique = unique
+        self.version = version
+
+    @staticmethod
+    def new(difficulty, rng=random, unique=True):
+        return PuzzleId(difficulty, rng.getrandbits(64), unique)
+
+    def to_bytes(self):
+        head = ID.pack(self.version, DIFFICULTIES.index(self.difficulty), UNIQUE if self.unique else 0, self.seed)
+        return head + CHECK.pack(zlib.crc32(head))
+
+    @staticmethod
+    def from_bytes(data):
+        if len(data) != SIZE:
+            raise ValueError("Неверная длина id головоломки")
+        head = bytes(data[:ID.size])
+        if CHECK.unpack_from(data, ID.size)[0] != zlib.crc32(head):
+            raise ValueError("Неверная контрольная сумма id головоломки")
+        version, difficulty, flags, seed = ID.unpack(head)
+        if difficulty >= len(DIFFICULTIES):
+            raise ValueError("Неверный код сложности в id головоломки")
+        return PuzzleId(DIFFICULTIES[difficulty], seed, bool(flags & UNIQUE), version)
+
+    def hex(self):
+        return self.to_bytes().hex()
+
+    @staticmethod
+    def from_hex(text):
+        return PuzzleId.from_bytes(bytes.fromhex(text))
+
+    def generate(self):
+        # (сетка решения, игровая сетка, банк) - та же головоломка при каждом вызове
+        # и на любой машине: проверки единственности ограничены работой решателя,
+        # а не временем (см. PuzzleSolver), поэтому пустые клетки от загрузки не зависят
+        if self.version != GENERATOR_VERSION:
+            raise ValueError(f"id создан генератором версии {self.version}, текущая версия {GENERATOR_VERSION}")
+        grid, playable_grid, removed_numbers, _ = PuzzleGenerator.generate_playable(
+            self.difficulty, unique=self.unique, rng=random.Random(self.seed))
+        return grid, playable_grid, removed_numbers
+
+    def _key(self):
+        return self.version, self.difficulty, self.unique, self.seed
+
+    def __eq__(self, other):
+        return isinstance(other, PuzzleId) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __repr__(self):
+        return f"PuzzleId({self.hex()})"
+
+
+class PuzzleCache:
+    # LRU горячих головоломок перед повторной генерацией по id
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.puzzles = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, puzzle_id):
+        # Головоломка из кэша или None
+        puzzle = self.puzzles.get(puzzle_id)
+        if puzzle is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.puzzles.move_to_end(puzzle_id)
+        return puzzle
+
+    def put(self, puzzle_id, puzzle):
+        self.puzzles[puzzle_id] = puzzle
+        self.puzzles.move_to_end(puzzle_id)
+        while len(self.puzzles) > self.maxsize:
+            self.puzzles.popitem(last=False)
+
+    def load(self, puzzle_id):
+        # Из кэша, а при промахе - генерация заново
+        puzzle = self.get(puzzle_id)
+        if puzzle is None:
+            puzzle = puzzle_id.generate()
+            self.put(puzzle_id, puzzle)
+        return puzzle
+
+    def __len__(self):
+        return len(self.puzzles)
+
+    def stats(self):
+        return {'size': len(self.puzzles), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,128 @@
+import sys
+import math
+import time
+import traceback
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+
+from game_logic import PuzzleGenerator
+
+
+class PuzzlePool(QObject):
+    # Очереди готовых головоломок по сложностям. Генерация идёт в пуле процессов,
+    # поэтому "Новая игра" только забирает готовую головоломку и не блокирует GUI.
+    # Глубина очереди подстраивается под темп игры: если головоломки забирают
+    # быстрее, чем они генерируются, очередь становится длиннее.
+    stats_changed = pyqtSignal(dict)  # сложность -> статистика (см. stats)
+
+    DIFFICULTIES = ('easy', 'medium', 'hard', 'expert')
+
+    def __init__(self, parent=None, workers=None, min_depth=2, max_depth=8, poll_ms=100):
+        super().__init__(parent)
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        # spawn: рабочие процессы не наследуют состояние Qt родителя
+        self.executor = ProcessPoolExecutor(max_workers=workers or max(1, (multiprocessing.cpu_count() or 2) - 1),
+                                            mp_context=multiprocessing.get_context('spawn'))
+        self.ready = {d: deque() for d in self.DIFFICULTIES}
+        self.pending = {d: [] for d in self.DIFFICULTIES}
+        self.latency = {d: None for d in self.DIFFICULTIES}       # среднее время генерации, с
+        self.last_latency = {d: None for d in self.DIFFICULTIES}
+        self.interval = {d: None for d in self.DIFFICULTIES}      # среднее время между запросами, с
+        self.last_pop = {d: None for d in self.DIFFICULTIES}
+        self.generated = {d: 0 for d in self.DIFFICULTIES}
+        self.misses = {d: 0 for d in self.DIFFICULTIES}          # запросы при пустой очереди
+        self.errors = {d: 0 for d in self.DIFFICULTIES}          # исключения в рабочих процессах
+        self.failed = {d: 0 for d in self.DIFFICULTIES}          # генератор не вернул сетку
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.poll)
+        self.timer.start(poll_ms)
+        for difficulty in self.DIFFICULTIES:
+            self.refill(difficulty)
+
+    def target_depth(self, difficulty):
+        # Сколько головоломок держать готовыми: столько, сколько успеют забрать,
+        # пока генерируется одна новая, плюс запас
+        latency = self.latency[difficulty]
+        interval = self.interval[difficulty]
+        if latency is None or interval is None:
+            return self.min_depth
+        depth = math.ceil(latency / max(interval, 1e-3)) + 1
+        return max(self.min_depth, min(self.max_depth, depth))
+
+    def refill(self, difficulty):
+        missing = self.target_depth(difficulty) - len(self.ready[difficulty]) - len(self.pending[difficulty])
+        for _ in range(missing):
+            self.pending[difficulty].append(self.executor.submit(PuzzleGenerator.generate_playable, difficulty))
+
+    def pop(self, difficulty):
+        # Готовая головоломка (сетка, игровая сетка, банк) или None, если очередь пуста
+        now = time.perf_counter()
+        last = self.last_pop[difficulty]
+        if last is not None:
+            # Экспоненциальное среднее интервала между запросами
+            self.interval[difficulty] = self._average(self.interval[difficulty], now - last)
+        self.last_pop[difficulty] = now
+
+        puzzle = self.ready[difficulty].popleft() if self.ready[difficulty] else None
+        if puzzle is None:
+            self.misses[difficulty] += 1
+        self.refill(difficulty)
+        self.stats_changed.emit(self.stats())
+        return puzzle
+
+    def poll(self):
+        # Забрать готовые результаты рабочих процессов (вызывается таймером в потоке GUI)
+        changed = False
+        for difficulty, futures in self.pending.items():
+            done = [f for f in futures if f.done()]
+            for future in done:
+                futures.remove(future)
+                if future.cancelled():
+                    continue
+                error = future.exception()
+                if error is not None:
+                    # Ошибка генерации не должна теряться: в stderr и в статистику
+                    self.errors[difficulty] += 1
+                    print(f"Ошибка генерации головоломки ({difficulty}):", file=sys.stderr)
+                    traceback.print_exception(error, file=sys.stderr)
+                    continue
+                grid, playable_grid, removed_numbers, seconds = future.result()
+                if grid is None:
+                    self.failed[difficulty] += 1
+                    continue
+                self.ready[difficulty].append((grid, playable_grid, removed_numbers))
+                self.generated[difficulty] += 1
+                self.last_latency[difficulty] = seconds
+                self.latency[difficulty] = self._average(self.latency[difficulty], seconds)
+            if done:
+                changed = True
+                self.refill(difficulty)
+        if changed:
+            self.stats_changed.emit(self.stats())
+
+    def stats(self):
+        return {d: {
+            'depth': len(self.ready[d]),
+            'target': self.target_depth(d),
+            'pending': len(self.pending[d]),
+            'latency': self.latency[d],
+            'last_latency': self.last_latency[d],
+            'interval': self.interval[d],
+            'generated': self.generated[d],
+            'misses': self.misses[d],
+            'errors': self.errors[d],
+            'failed': self.failed[d],
+        } for d in self.DIFFICULTIES}
+
+    def shutdown(self):
+        self.timer.stop()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def _average(current, value, alpha=0.3):
+        return value if current is None else current + alpha * (value - current)
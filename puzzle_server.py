@@ -0,0 +1,465 @@
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import traceback
+import multiprocessing
+from bisect import bisect_left
+from collections import deque, Counter
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+from game_logic import SolutionChecker, BatchValidator, EquationCatalogue
+from puzzle_id import PuzzleId, PuzzleCache
+
+# Локальный HTTP/JSON сервер головоломок на asyncio (только стандартная библиотека).
+#
+#   GET  /puzzle?difficulty=easy   головоломка из готовой очереди: id, размер, игровая сетка, банк
+#   POST /solution                 {"id": ..., "values": [[r, c, значение], ...]} -> вердикт
+#   POST /solutions                {"id": ..., "submissions": [values, ...]} -> вердикты пачки (BatchValidator)
+#   GET  /stats                    очереди по сложностям и гистограммы задержек по адресам
+#
+# Генерация идёт в пуле процессов и только наполняет очереди, поэтому в задержку
+# запроса она не входит. Если очередь сложности пуста, сервер сразу отвечает 503
+# с Retry-After, а не ждёт генерации.
+# id головоломки - PuzzleId (16 байт в hex): сервер не хранит выданные головоломки,
+# а для проверки решения берёт их из LRU-кэша или генерирует заново по id.
+
+DIFFICULTIES = ('easy', 'medium', 'hard', 'expert')
+
+# Границы корзин гистограммы задержек, мс (последняя корзина - всё, что больше)
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+MAX_BODY = 1 << 20
+
+
+class HttpError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0
+        self.seconds = 0.0
+        self.statuses = Counter()
+
+    def add(self, seconds, status):
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds * 1000)] += 1
+        self.total += 1
+        self.seconds += seconds
+        self.statuses[status] += 1
+
+    def percentile(self, q):
+        # Верхняя граница корзины, в которую попадает q-я доля запросов
+        if not self.total:
+            return None
+        rank = q * self.total
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS + (None,), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+    def stats(self):
+        return {
+            'count': self.total,
+            'mean_ms': self.seconds / self.total * 1000 if self.total else None,
+            'p50_ms': self.percentile(0.5),
+            'p99_ms': self.percentile(0.99),
+            'buckets_ms': [[bound, count] for bound, count in zip(LATENCY_BUCKETS + ('inf',), self.counts)],
+            'statuses': {str(status): count for status, count in sorted(self.statuses.items())},
+        }
+
+
+def generate_by_id(puzzle_id):
+    # Выполняется в рабочем процессе: (id, головоломка, время генерации)
+    start = time.perf_counter()
+    puzzle = puzzle_id.generate()
+    return puzzle_id, puzzle, time.perf_counter() - start
+
+
+class WarmPool:
+    # Очереди готовых головоломок по сложностям, которые наполняет пул процессов.
+    # Очередь держится на уровне depth: каждая выданная головоломка заказывает новую.
+    def __init__(self, executor, depth=8, difficulties=DIFFICULTIES):
+        self.executor = executor
+        self.depth = depth
+        self.ready = {d: deque() for d in difficulties}
+        self.pending = {d: 0 for d in difficulties}
+        self.generated = {d: 0 for d in difficulties}
+        self.failed = {d: 0 for d in difficulties}
+        self.misses = {d: 0 for d in difficulties}   # запросы при пустой очереди
+        self.latency = {d: None for d in difficulties}  # среднее время генерации, с
+
+    def start(self):
+        for difficulty in self.ready:
+            self.refill(difficulty)
+
+    def refill(self, difficulty):
+        loop = asyncio.get_running_loop()
+        while len(self.ready[difficulty]) + self.pending[difficulty] < self.depth:
+            self.pending[difficulty] += 1
+            future = loop.run_in_executor(self.executor, generate_by_id, PuzzleId.new(difficulty))
+            future.add_done_callback(lambda f, d=difficulty: self.finished(d, f))
+
+    def finished(self, difficulty, future):
+        self.pending[difficulty] -= 1
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            self.failed[difficulty] += 1
+        else:
+            puzzle_id, puzzle, seconds = future.result()
+            if puzzle[0] is None:
+                self.failed[difficulty] += 1
+            else:
+                self.ready[difficulty].append((puzzle_id, puzzle))
+                self.generated[difficulty] += 1
+                current = self.latency[difficulty]
+                self.latency[difficulty] = seconds if current is None else current + 0.3 * (seconds - current)
+        try:
+            self.refill(difficulty)
+        except RuntimeError:
+            # Цикл событий уже остановлен
+            pass
+
+    def pop(self, difficulty):
+        queue = self.ready[difficulty]
+        puzzle = queue.popleft() if queue else None
+        if puzzle is None:
+            self.misses[difficulty] += 1
+        self.refill(difficulty)
+        return puzzle
+
+    def retry_after(self, difficulty):
+        # Через сколько секунд ждать головоломку: среднее время генерации, минимум 1
+        latency = self.latency[difficulty]
+        return max(1, round(latency)) if latency is not None else 1
+
+    def stats(self):
+        return {d: {
+            'ready': len(self.ready[d]),
+            'depth': self.depth,
+            'pending': self.pending[d],
+            'generated': self.generated[d],
+            'failed': self.failed[d],
+            'misses': self.misses[d],
+            'generation_ms': self.latency[d] * 1000 if self.latency[d] is not None else None,
+        } for d in self.ready}
+
+
+class PuzzleServer:
+    def __init__(self, executor, depth=8, cache_size=1024):
+        self.executor = executor
+        self.pool = WarmPool(executor, depth)
+        # Выданные головоломки не хранятся: id (PuzzleId) задаёт головоломку, а при
+        # проверке решения она берётся из LRU-кэша или генерируется заново в пуле процессов
+        self.cache = PuzzleCache(cache_size)
+        self.histograms = {}
+        self.routes = {
+            ('GET', '/puzzle'): self.get_puzzle,
+            ('POST', '/solution'): self.post_solution,
+            ('POST', '/solutions'): self.post_solutions,
+            ('GET', '/stats'): self.get_stats,
+        }
+        self.paths = {path for _, path in self.routes}
+
+    def get_puzzle(self, query, body):
+        difficulty = query.get('difficulty', ['easy'])[0]
+        if difficulty not in self.pool.ready:
+            raise HttpError(400, f"Неизвестная сложность: {difficulty}")
+        puzzle = self.pool.pop(difficulty)
+        if puzzle is None:
+            # Очередь пуста: клиент повторит запрос позже, генерация в запрос не попадает
+            raise HttpError(503, "Нет готовых головоломок",
+                            {'Retry-After': str(self.pool.retry_after(difficulty))})
+        puzzle_id, puzzle = puzzle
+        self.cache.put(puzzle_id, puzzle)
+        grid, playable_grid, removed_numbers = puzzle
+        # Игровая сетка без значений пустых клеток: [значение, тип] или null
+        return {
+            'id': puzzle_id.hex(),
+            'difficulty': difficulty,
+            'size': grid.size,
+            'grid': [[list(cell) if cell else None for cell in row] for row in playable_grid],
+            'bank': removed_numbers,
+        }
+
+    async def load_puzzle(self, puzzle_id):
+        try:
+            puzzle_id = PuzzleId.from_hex(puzzle_id)
+        except (ValueError, TypeError):
+            raise HttpError(404, "Головоломка не найдена")
+        puzzle = self.cache.get(puzzle_id)
+        if puzzle is None:
+            try:
+                _, puzzle, _ = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, generate_by_id, puzzle_id)
+            except ValueError:
+                # id другой версии генератора
+                raise HttpError(404, "Головоломка не найдена")
+            self.cache.put(puzzle_id, puzzle)
+        return puzzle
+
+    async def post_solution(self, query, body):
+        try:
+            data = json.loads(body)
+            puzzle_id = data['id']
+            values = [(int(r), int(c), int(v)) for r, c, v in data['values']]
+        except (ValueError, KeyError, TypeError):
+            raise HttpError(400, "Ожидается {\"id\": ..., \"values\": [[r, c, значение], ...]}")
+        grid, playable_grid, removed_numbers = await self.load_puzzle(puzzle_id)
+
+        checker = SolutionChecker(grid.equations, playable_grid)
+        for r, c, value in values:
+            if (r, c) not in checker.mutable:
+                raise HttpError(400, f"Клетку ({r}, {c}) нельзя заполнять")
+            checker.set_value(r, c, value)
+        # Решение засчитывается, если верны все уравнения и использованы ровно числа банка
+        used = Counter(value for cell, value in checker.values.items() if cell in checker.mutable)
+        bank_ok = used == Counter(removed_numbers)
+        return {
+            'id': puzzle_id,
+            'solved': checker.solved and bank_ok,
+            'bank_ok': bank_ok,
+            'correct': checker.correct,
+            'equations': len(checker.equations),
+            'invalid': sorted([r, c] for (r, c), status in checker.cell_status.items() if status == 'invalid'),
+            'empty': sorted([r, c] for (r, c) in checker.mutable if checker.values[(r, c)] is None),
+        }
+
+    async def post_solutions(self, query, body):
+        # Пачка решений одной головоломки: {"id": ..., "submissions": [[[r, c, значение], ...], ...]}
+        try:
+            data = json.loads(body)
+            puzzle_id = data['id']
+            submissions = [{(int(r), int(c)): int(v) for r, c, v in values} for values in data['submissions']]
+        except (ValueError, KeyError, TypeError):
+            raise HttpError(400, "Ожидается {\"id\": ..., \"submissions\": [[[r, c, значение], ...], ...]}")
+        grid, playable_grid, removed_numbers = await self.load_puzzle(puzzle_id)
+
+        validator = BatchValidator(grid.equations, playable_grid)
+        for submission in submissions:
+            for cell in submission:
+                if cell not in validator.cell_index:
+                    raise HttpError(400, f"Клетку {cell} нельзя заполнять")
+        bank = Counter(removed_numbers)
+        bank_ok = [Counter(submission.values()) == bank for submission in submissions]
+        verdicts = validator.validate(submissions)
+        return {
+            'id': puzzle_id,
+            'solved': [ok and all(v is True for v in row) for ok, row in zip(bank_ok, verdicts)],
+            'bank_ok': bank_ok,
+            'correct': [row.count(True) for row in verdicts],
+            'equations': len(validator.equations),
+        }
+
+    def get_stats(self, query, body):
+        return {
+            'pools': self.pool.stats(),
+            'cache': self.cache.stats(),
+            'latency': {path: histogram.stats() for path, histogram in sorted(self.histograms.items())},
+        }
+
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        handler = self.routes.get((method, url.path))
+        if handler is None:
+            if url.path in self.paths:
+                raise HttpError(405, "Метод не поддерживается")
+            raise HttpError(404, "Адрес не найден")
+        result = handler(parse_qs(url.query), body)
+        if asyncio.iscoroutine(result):
+            result = await result
+        return result
+
+    async def handle_connection(self, reader, writer):
+        # HTTP/1.1 с keep-alive: запросы одного соединения обрабатываются по очереди
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                start = time.perf_counter()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                path = '?'
+                extra = {}
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                try:
+                    try:
+                        method, target, _ = request_line.decode('latin-1').split()
+                    except ValueError:
+                        raise HttpError(400, "Неверная строка запроса")
+                    path = urlsplit(target).path
+                    try:
+                        length = int(headers.get('content-length', 0) or 0)
+                    except ValueError:
+                        length = -1
+                    if length < 0:
+                        # Граница тела неизвестна: соединение дальше не читается
+                        keep_alive = False
+                        raise HttpError(400, "Неверный Content-Length")
+                    if length > MAX_BODY:
+                        keep_alive = False
+                        raise HttpError(413, "Слишком большой запрос")
+                    body = await reader.readexactly(length) if length else b''
+                    status, payload = 200, await self.dispatch(method, target, body)
+                except HttpError as e:
+                    status, payload, extra = e.status, {'error': str(e)}, e.headers
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    raise
+                except Exception:
+                    # Ошибка обработчика не должна обрывать соединение без ответа
+                    traceback.print_exc(file=sys.stderr)
+                    status, payload = 500, {'error': "Внутренняя ошибка сервера"}
+
+                data = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode()
+                head = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}",
+                        "Content-Type: application/json; charset=utf-8",
+                        f"Content-Length: {len(data)}",
+                        f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+                head += [f"{name}: {value}" for name, value in extra.items()]
+                writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + data)
+                await writer.drain()
+
+                if path not in self.paths:
+                    path = 'other'
+                self.histograms.setdefault(path, LatencyHistogram()).add(time.perf_counter() - start, status)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(args):
+    for difficulty in DIFFICULTIES:
+        EquationCatalogue.for_difficulty(difficulty)
+    executor = ProcessPoolExecutor(max_workers=args.workers,
+                                   mp_context=multiprocessing.get_context('spawn'))
+    server = PuzzleServer(executor, depth=args.depth, cache_size=args.cache)
+    server.pool.start()
+    listener = await asyncio.start_server(server.handle_connection, args.host, args.port)
+    print(f"Сервер головоломок: http://{args.host}:{args.port}", file=sys.stderr)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def request(reader, writer, method, target, payload=None):
+    # Клиентский запрос по открытому keep-alive соединению -> (статус, JSON)
+    body = json.dumps(payload).encode() if payload is not None else b''
+    writer.write((f"{method} {target} HTTP/1.1\r\nHost: localhost\r\n"
+                  f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n").encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def load(args):
+    # Нагрузочный клиент: args.clients соединений запрашивают головоломки
+    # и отправляют решения, собранные из банка (в случайном порядке - не всегда верные)
+    rng = random.Random(args.seed)
+    statuses = Counter()
+    solved = 0
+    latencies = []
+
+    async def client(n):
+        nonlocal solved
+        reader, writer = await asyncio.open_connection(args.host, args.port)
+        try:
+            for _ in range(n):
+                difficulty = rng.choice(args.difficulty)
+                start = time.perf_counter()
+                status, puzzle = await request(reader, writer, 'GET', f"/puzzle?difficulty={difficulty}")
+                latencies.append(time.perf_counter() - start)
+                statuses[status] += 1
+                if status != 200:
+                    await asyncio.sleep(0.05)
+                    continue
+                holes = [[r, c] for r, row in enumerate(puzzle['grid']) for c, cell in enumerate(row)
+                         if cell and cell[1] == 'empty_number']
+                bank = list(puzzle['bank'])
+                rng.shuffle(bank)
+                values = [[r, c, v] for (r, c), v in zip(holes, bank)]
+                status, verdict = await request(reader, writer, 'POST', '/solution',
+                                                {'id': puzzle['id'], 'values': values})
+                statuses[status] += 1
+                solved += verdict.get('solved', False)
+        finally:
+            writer.close()
+
+    started = time.perf_counter()
+    per_client = max(1, args.requests // args.clients)
+    await asyncio.gather(*(client(per_client) for _ in range(args.clients)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    _, stats = await request(reader, writer, 'GET', '/stats')
+    writer.close()
+    print(f"{per_client * args.clients} запросов головоломок за {elapsed:.2f} с, "
+          f"статусы {dict(sorted(statuses.items()))}, решено {solved}")
+    if latencies:
+        print(f"GET /puzzle на клиенте: p50 {latencies[len(latencies) // 2] * 1000:.2f} мс, "
+              f"p99 {latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000:.2f} мс")
+    print(json.dumps(stats, ensure_ascii=False, indent=1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный сервер головоломок CrossMath")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("serve", help="запустить сервер")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--workers", type=int, default=max(1, (multiprocessing.cpu_count() or 2) - 1))
+    p.add_argument("--depth", type=int, default=8, help="готовых головоломок на сложность")
+    p.add_argument("--cache", type=int, default=1024, help="головоломок в LRU-кэше для проверки решений")
+    p.set_defaults(func=serve)
+
+    p = sub.add_parser("load", help="нагрузочный клиент для запущенного сервера")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--clients", type=int, default=10)
+    p.add_argument("--requests", type=int, default=200)
+    p.add_argument("--difficulty", nargs="+", default=list(DIFFICULTIES), choices=DIFFICULTIES)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=load)
+
+    args = parser.parse_args()
+    try:
+        asyncio.run(args.func(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,377 @@
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from solver import PuzzleSolver
+
+# Оценка сложности по тому, как головоломку решал бы человек.
+#
+# Игровое состояние решается лестницей правил от простых к сложным. На каждом шаге
+# применяется самое простое правило, которое что-то даёт, после чего проверка снова
+# начинается с первого правила. Сложность - самое сложное понадобившееся правило,
+# число шагов и взвешенная сумма шагов.
+#
+#   single        в уравнении одна пустая клетка
+#   equation      в уравнении несколько пустых клеток, но значение клетки одно
+#                 при любом подходящем наборе чисел из банка
+#   intersection  пересечение вариантов клетки по горизонтальному и вертикальному уравнению
+#   bank          число из банка (с остатком n) подходит ровно в n клеток
+#   chain         варианты клеток сужаются по цепочке пересекающихся уравнений
+#   search        перебор: ни одно правило не помогает, значение берётся из решения
+
+RULES = ('single', 'equation', 'intersection', 'bank', 'chain', 'search')
+WEIGHTS = {'single': 1, 'equation': 2, 'intersection': 3, 'bank': 4, 'chain': 6, 'search': 15}
+
+# Сложность по самому сложному правилу
+LEVELS = {'single': 'easy', 'equation': 'medium', 'intersection': 'medium',
+          'bank': 'hard', 'chain': 'hard', 'search': 'expert'}
+
+DIFFICULTIES = ('easy', 'medium', 'hard', 'expert')
+
+
+class Rating:
+    def __init__(self, steps, solved, unique, nodes, unrated=False):
+        self.steps = steps      # [(правило, (r, c), число)] в порядке решения
+        self.solved = solved    # все пустые клетки заполнены
+        self.unique = unique    # решение единственное
+        self.nodes = nodes      # узлы перебора PuzzleSolver (0, если search не понадобился)
+        self.unrated = unrated  # решатель для search не уложился в бюджет: оценка не закончена
+
+    @property
+    def rules(self):
+        return Counter(rule for rule, _, _ in self.steps)
+
+    @property
+    def hardest(self):
+        if not self.steps:
+            return None
+        return max((rule for rule, _, _ in self.steps), key=RULES.index)
+
+    @property
+    def score(self):
+        return sum(WEIGHTS[rule] for rule, _, _ in self.steps)
+
+    @property
+    def difficulty(self):
+        # Измеренная сложность (одна из DIFFICULTIES); неоценённая головоломка - expert:
+        # правил не хватило, а перебор не уложился в бюджет
+        if self.unrated:
+            return 'expert'
+        return LEVELS[self.hardest] if self.hardest else 'easy'
+
+    def as_dict(self):
+        rules = self.rules
+        return {'difficulty': self.difficulty, 'hardest': self.hardest, 'score': self.score,
+                'steps': len(self.steps), 'rules': {rule: rules[rule] for rule in RULES if rules[rule]},
+                'solved': self.solved, 'unique': self.unique, 'unrated': self.unrated}
+
+
+class RatingEngine:
+    # Уравнения и пустые клетки берутся из PuzzleSolver; он же находит решение
+    # для шагов search. Набор вариантов уравнения перебирается, только если он
+    # не больше SUPPORT_LIMIT, иначе уравнение в этом шаге не используется
+    # (как человек не перебирает уравнение с пятью пустыми клетками).
+    # Решатель ограничен WORK_BUDGET (см. PuzzleSolver.solve): если он не
+    # уложился, оценка прекращается и головоломка помечается unrated (сложность expert).
+    SUPPORT_LIMIT = 2000
+    WORK_BUDGET = PuzzleSolver.WORK_BUDGET
+    MAX_UNKNOWN = 3  # правило equation - до трёх пустых клеток в уравнении
+
+    def __init__(self, equations, playable_grid, bank):
+        self.solver = PuzzleSolver(equations, playable_grid, bank)
+        self.holes = self.solver.holes
+        self.equations = self.solver.equations
+        self.var_eqs = self.solver.var_eqs
+        self._memo = {}
+        self._cached = None  # (число пустых клеток, варианты) - варианты текущего состояния
+
+    def rate(self):
+        # Правила выводят только значения, общие для всех решений, поэтому решение без
+        # search само доказывает единственность. Решатель запускается лишь для первого search
+        result = None
+        assignment = [None] * len(self.holes)
+        counts = Counter(self.solver.bank)
+        steps = []
+        left = len(self.holes)
+        while left:
+            for rule in RULES:
+                if rule == 'search':
+                    if result is None:
+                        result = self.solver.solve(2, work_budget=self.WORK_BUDGET)
+                    if result.undecided:
+                        return Rating(steps, False, False, result.nodes, unrated=True)
+                    if not result.solutions:
+                        return Rating(steps, False, False, result.nodes)
+                    deductions = self.search(assignment, counts, result.solutions[0])
+                else:
+                    deductions = getattr(self, rule)(assignment, counts)
+                if deductions:
+                    break
+            placed = 0
+            for var, value in deductions.items():
+                if assignment[var] is not None or counts[value] <= 0:
+                    continue
+                assignment[var] = value
+                counts[value] -= 1
+                placed += 1
+                steps.append((rule, self.holes[var], value))
+            if not placed:
+                # Выводы противоречат банку: состояние без решения
+                return Rating(steps, False, False, result.nodes if result else 0)
+            left -= placed
+        if result is None:
+            return Rating(steps, True, True, 0)
+        return Rating(steps, True, result.unique, result.nodes)
+
+    def _unknown(self, index, assignment):
+        return [var for var, _ in self.equations[index][1] if var >= 0 and assignment[var] is None]
+
+    def _supports(self, index, unknown, domains, assignment, counts):
+        # Варианты каждой пустой клетки уравнения по всем верным наборам из банка
+        # (с учётом числа одинаковых чисел) или None, если наборов слишком много
+        options = tuple(tuple(sorted(v for v in domains[var] if counts[v] > 0)) for var in unknown)
+        func, slots, _ = self.equations[index]
+        solve_result = slots[-1][0] == unknown[-1]
+        enumerated = options[:-1] if solve_result else options
+        size = 1
+        for values in enumerated:
+            size *= len(values)
+        if size > self.SUPPORT_LIMIT:
+            return None
+        nums = [assignment[var] if var >= 0 else value for var, value in slots]
+        # Наборы проверяются по остатку чисел в банке, но набор из n чисел не может
+        # упереться в остаток больше n: в ключе остатки ограничены сверху числом клеток
+        key = (index, tuple(nums), options,
+               tuple((v, min(counts[v], len(unknown))) for v in sorted(set().union(*options)))
+               if len(unknown) > 1 else None)
+        supports = self._memo.get(key)
+        if supports is not None:
+            return supports
+        positions = [k for k, (var, _) in enumerate(slots) if var >= 0 and assignment[var] is None]
+        result_values = set(options[-1]) if solve_result else None
+        supports = [set() for _ in unknown]
+        for combo in itertools.product(*enumerated):
+            for k, value in zip(positions, combo):
+                nums[k] = value
+            try:
+                lhs = func(nums[:-1])
+            except ZeroDivisionError:
+                continue
+            if solve_result:
+                if lhs not in result_values:
+                    continue
+                combo = combo + (lhs,)
+            elif lhs != nums[-1]:
+                continue
+            if len(combo) > 1 and any(combo.count(v) > counts[v] for v in set(combo)):
+                continue
+            for support, value in zip(supports, combo):
+                support.add(value)
+        self._memo[key] = supports
+        return supports
+
+    def _bank_supports(self, assignment, counts, max_unknown):
+        # {уравнение: (пустые клетки, варианты)} для уравнений с 1..max_unknown пустыми клетками,
+        # когда вариантами клетки считается весь банк
+        values = set(v for v, n in counts.items() if n > 0)
+        domains = [values] * len(self.holes)
+        found = {}
+        for index in range(len(self.equations)):
+            unknown = self._unknown(index, assignment)
+            if not unknown or len(unknown) > max_unknown:
+                continue
+            supports = self._supports(index, unknown, domains, assignment, counts)
+            if supports is not None:
+                found[index] = (unknown, supports)
+        return found
+
+    def single(self, assignment, counts):
+        deductions = {}
+        for unknown, supports in self._bank_supports(assignment, counts, 1).values():
+            if len(supports[0]) == 1:
+                deductions[unknown[0]] = next(iter(supports[0]))
+        return deductions
+
+    def equation(self, assignment, counts):
+        deductions = {}
+        for unknown, supports in self._bank_supports(assignment, counts, self.MAX_UNKNOWN).values():
+            for var, support in zip(unknown, supports):
+                if len(support) == 1:
+                    deductions[var] = next(iter(support))
+        return deductions
+
+    def _candidates(self, assignment, counts):
+        # Варианты клеток: пересечение вариантов по всем их уравнениям.
+        # Клетки только заполняются, поэтому состояние определяется числом пустых клеток
+        left = assignment.count(None)
+        if self._cached is not None and self._cached[0] == left:
+            return self._cached[1]
+        values = set(v for v, n in counts.items() if n > 0)
+        candidates = [None if value is not None else set(values) for value in assignment]
+        for unknown, supports in self._bank_supports(assignment, counts, len(self.holes)).values():
+            for var, support in zip(unknown, supports):
+                candidates[var] &= support
+        self._cached = left, candidates
+        return candidates
+
+    def intersection(self, assignment, counts):
+        return self._singles(self._candidates(assignment, counts))
+
+    def bank(self, assignment, counts):
+        return self._hidden(self._candidates(assignment, counts), counts)
+
+    def chain(self, assignment, counts):
+        # Сужение вариантов до неподвижной точки: варианты одной клетки уточняют
+        # перебор в её втором уравнении, и так по цепочке
+        candidates = [None if values is None else set(values) for values in self._candidates(assignment, counts)]
+        queue = set(range(len(self.equations)))
+        while queue:
+            index = queue.pop()
+            unknown = self._unknown(index, assignment)
+            if not unknown:
+                continue
+            supports = self._supports(index, unknown, candidates, assignment, counts)
+            if supports is None:
+                continue
+            for var, support in zip(unknown, supports):
+                narrowed = candidates[var] & support
+                if narrowed != candidates[var]:
+                    candidates[var] = narrowed
+                    queue.update(i for i in self.var_eqs[var] if i != index)
+        return self._singles(candidates) or self._hidden(candidates, counts)
+
+    def search(self, assignment, counts, solution):
+        # Одна клетка с наименьшим числом вариантов получает значение из решения
+        candidates = self._candidates(assignment, counts)
+        var = min((var for var, value in enumerate(assignment) if value is None),
+                  key=lambda var: len(candidates[var]))
+        return {var: solution[self.holes[var]]}
+
+    @staticmethod
+    def _singles(candidates):
+        return {var: next(iter(values)) for var, values in enumerate(candidates)
+                if values is not None and len(values) == 1}
+
+    @staticmethod
+    def _hidden(candidates, counts):
+        # Число с остатком n, которое подходит ровно в n клеток, ставится во все эти клетки
+        cells = {}
+        for var, values in enumerate(candidates):
+            for value in values or ():
+                cells.setdefault(value, []).append(var)
+        deductions = {}
+        for value, count in counts.items():
+            if count > 0 and len(cells.get(value, ())) == count:
+                for var in cells[value]:
+                    deductions[var] = value
+        return deductions
+
+
+def rate_puzzle(equations, playable_grid, bank):
+    return RatingEngine(equations, playable_grid, bank).rate()
+
+
+def rate_chunk(path, items):
+    # Выполняется в рабочем процессе: items - строки JSONL или пары (сложность, номер) библиотеки.
+    # Возвращает (список (номинальная сложность, id или номер, Rating.as_dict(), время оценки в с),
+    # процессорное время порции в с - для "на ядро")
+    start = time.process_time()
+    rated = []
+    if path.endswith('.jsonl'):
+        from batch_generate import grid_from_record
+        for line in items:
+            record = json.loads(line)
+            grid, playable_grid, bank = grid_from_record(record)
+            begin = time.perf_counter()
+            rating = rate_puzzle(grid.equations, playable_grid, bank)
+            rated.append((record['difficulty'], record.get('id'), rating.as_dict(), time.perf_counter() - begin))
+    else:
+        from puzzle_format import PuzzleLibrary
+        with PuzzleLibrary(path) as library:
+            for difficulty, i in items:
+                grid, playable_grid, bank = library.load(difficulty, i)
+                begin = time.perf_counter()
+                rating = rate_puzzle(grid.equations, playable_grid, bank)
+                rated.append((difficulty, i, rating.as_dict(), time.perf_counter() - begin))
+    return rated, time.process_time() - start
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Оценка сложности библиотеки головоломок по правилам решения")
+    parser.add_argument("path", help="JSONL из batch_generate или библиотека puzzle_format (.cml)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk", type=int, default=50, help="головоломок в порции")
+    parser.add_argument("--out", default=None, metavar="PATH", help="записать оценки в JSONL")
+    args = parser.parse_args()
+
+    if args.path.endswith('.jsonl'):
+        with open(args.path, encoding="utf-8") as f:
+            items = [line for line in f if line.strip()]
+    else:
+        from puzzle_format import PuzzleLibrary
+        with PuzzleLibrary(args.path) as library:
+            items = [(d, i) for d in DIFFICULTIES for i in range(library.count(d))]
+    chunks = [items[i:i + args.chunk] for i in range(0, len(items), args.chunk)]
+
+    table = Counter()   # (номинальная, измеренная) -> число головоломок
+    rules = Counter()
+    times = {}          # номинальная сложность -> время оценки головоломок, с
+    unrated = Counter()
+    worker_seconds = 0.0  # процессорное время рабочих процессов
+    rated = 0
+    started = time.perf_counter()
+    out = open(args.out, "w", encoding="utf-8") if args.out else None
+    with ProcessPoolExecutor(args.workers) as executor:
+        for results, chunk_seconds in executor.map(rate_chunk, itertools.repeat(args.path), chunks):
+            for nominal, key, rating, rating_seconds in results:
+                table[nominal, rating['difficulty']] += 1
+                rules.update(rating['rules'])
+                times.setdefault(nominal, []).append(rating_seconds)
+                unrated[nominal] += rating['unrated']
+                if out is not None:
+                    out.write(json.dumps({'difficulty': nominal, 'key': key, 'rating': rating},
+                                         separators=(',', ':')) + "\n")
+            rated += len(results)
+            worker_seconds += chunk_seconds
+            elapsed = time.perf_counter() - started
+            print(f"\r{rated}/{len(items)} головоломок | {rated / elapsed:8.1f} гол/с", end="",
+                  file=sys.stderr, flush=True)
+    if out is not None:
+        out.close()
+
+    elapsed = time.perf_counter() - started
+    per_core = rated / max(worker_seconds, 1e-9)
+    print(file=sys.stderr)
+    print(f"Оценено {rated} головоломок за {elapsed:.1f} с ({rated / elapsed:.1f} гол/с, "
+          f"{per_core:.1f} гол/с на ядро)")
+    # Процессорное время рабочих не больше workers * время работы, поэтому скорость
+    # на ядро, умноженная на число процессов, не может быть меньше общей
+    if per_core * args.workers < rated / elapsed * 0.99:
+        print(f"Внимание: {per_core:.1f} гол/с на ядро x {args.workers} процессов меньше общей "
+              f"скорости {rated / elapsed:.1f} гол/с - неверный учёт времени рабочих", file=sys.stderr)
+    print("номинальная -> измеренная: " + " ".join(f"{d:>7}" for d in DIFFICULTIES))
+    for nominal in DIFFICULTIES:
+        row = [table[nominal, measured] for measured in DIFFICULTIES]
+        if any(row):
+            print(f"{nominal:>26}: " + " ".join(f"{n:7d}" for n in row))
+    print("шагов по правилам: " + ", ".join(f"{rule} {rules[rule]}" for rule in RULES))
+    print("время оценки (unrated - решатель не уложился в бюджет, считаются expert):")
+    for nominal in DIFFICULTIES:
+        if nominal in times:
+            values = sorted(times[nominal])
+            print(f"{nominal:>7}: p50 {percentile(values, 0.5) * 1000:8.2f} мс | "
+                  f"p90 {percentile(values, 0.9) * 1000:8.2f} мс | p99 {percentile(values, 0.99) * 1000:8.2f} мс | "
+                  f"max {values[-1] * 1000:8.2f} мс | unrated {unrated[nominal]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,587 @@
+import bisect
+import itertools
+import random
+import time
+from collections import Counter
+
+from game_logic import compile_expression
+
+
+class SolveResult:
+    def __init__(self, solutions, nodes, complete, undecided=False):
+        self.solutions = solutions  # список словарей (r, c) -> число
+        self.nodes = nodes          # число узлов перебора
+        self.complete = complete    # перебор завершён (не остановлен по лимиту решений или бюджету)
+        self.undecided = undecided  # бюджет кончился раньше, чем найдено limit решений:
+                                    # ни решаемость, ни единственность не известны
+
+    @property
+    def solvable(self):
+        return bool(self.solutions)
+
+    @property
+    def unique(self):
+        return len(self.solutions) == 1 and self.complete
+
+
+class Contradiction(Exception):
+    pass
+
+
+class SolutionLimitReached(Exception):
+    pass
+
+
+class BudgetExceeded(Exception):
+    # Исчерпан бюджет времени или перебора наборов в распространении
+    pass
+
+
+class NodeBudgetExceeded(BudgetExceeded):
+    pass
+
+
+def lhs_interval(ops, lo, hi):
+    # Границы левой части при операндах из [lo[i], hi[i]] (все операнды >= 1)
+    total_lo = total_hi = 0
+    sign = 1
+    term_lo, term_hi = lo[0], hi[0]
+    for op, a, b in zip(ops, lo[1:], hi[1:]):
+        if op == '*':
+            term_lo *= a
+            term_hi *= b
+        elif op == '/':
+            term_lo //= b
+            term_hi //= a
+        else:
+            if sign > 0:
+                total_lo += term_lo
+                total_hi += term_hi
+            else:
+                total_lo -= term_hi
+                total_hi -= term_lo
+            sign = 1 if op == '+' else -1
+            term_lo, term_hi = a, b
+    if sign > 0:
+        return total_lo + term_lo, total_hi + term_hi
+    return total_lo - term_hi, total_hi - term_lo
+
+
+class PuzzleSolver:
+    # Решатель игрового состояния: сетка с пустыми клетками (None, 'empty_number')
+    # и банк чисел. Уравнения берутся из CrossMathGrid.equations, проверка уравнения
+    # совпадает с MainWindow.check_solution (целочисленное деление, приоритет '*'/'/').
+    # Распространение ограничений: в домене пустой клетки остаются только значения,
+    # входящие хотя бы в один верный набор значений каждого её уравнения. Банк
+    # учитывается как мультимножество и расходуется целиком. Перебор включается,
+    # только когда распространение ничего не даёт: ветвление по клетке с наименьшим
+    # числом вариантов на вес её уравнений (вес растёт, когда уравнение даёт
+    # противоречие) или по числу банка, если для него подходящих клеток меньше.
+    # Бюджет одного вызова solve/solve_from - работа (work): перебранные наборы значений
+    # уравнений, просмотры очереди распространения и узлы перебора (по числу клеток).
+    # Работа не зависит от скорости и загрузки машины, поэтому итог с одним бюджетом
+    # всегда один и тот же; time_budget (с) - только для вызовов с общим сроком по часам
+    # (generate_playable с budget). При исчерпании результат помечается undecided.
+    # None - без ограничения.
+    SUPPORT_LIMIT = 2000   # максимум перебираемых наборов при проверке одного уравнения
+    WORK_BUDGET = 100_000  # около 0.2-0.4 с на expert
+    MEMO_LIMIT = 50000     # записей в _memo, после которых кэш сбрасывается
+
+    def __init__(self, equations, playable_grid, bank):
+        self.holes = []       # позиции пустых клеток, номер в списке = номер переменной
+        self.hole_index = {}
+        for r, row in enumerate(playable_grid):
+            for c, cell in enumerate(row):
+                if cell and cell[1] == 'empty_number':
+                    self.hole_index[(r, c)] = len(self.holes)
+                    self.holes.append((r, c))
+        self.bank = Counter(bank)
+
+        # Уравнение: (функция левой части, [(переменная или -1, известное число), ...]),
+        # числа по порядку, результат последним
+        self.equations = []
+        self.var_eqs = [[] for _ in self.holes]
+        for eq_obj, start_r, start_c, (dr, dc) in equations:
+            slots = []
+            for i in range(0, len(eq_obj.parts) + 2, 2):
+                r, c = start_r + i * dr, start_c + i * dc
+                var = self.hole_index.get((r, c), -1)
+                slots.append((var, None if var >= 0 else playable_grid[r][c][0]))
+            for var, _ in slots:
+                if var >= 0:
+                    self.var_eqs[var].append(len(self.equations))
+            ops = tuple(eq_obj.parts[1::2])
+            self.equations.append((compile_expression(ops), slots, ops))
+        self.nodes = 0
+        # Верные наборы значений уравнений (см. _combos). Зависят только от уравнения,
+        # известных чисел и доменов, поэтому переиспользуются между вызовами solve_from.
+        self._memo = {}
+        self._plans = {}
+        self._weights = [1] * len(self.equations)
+
+    def solve(self, limit=2, node_budget=None, time_budget=None, work_budget=WORK_BUDGET):
+        # Найти до limit решений (limit=2 достаточно для проверки единственности).
+        # node_budget, time_budget (с) и work_budget ограничивают перебор; при их
+        # исчерпании результат неполный и undecided, если решений меньше limit.
+        return self.solve_from({}, self.bank, {}, range(len(self.equations)), limit, node_budget,
+                               time_budget, work_budget)
+
+    def solve_from(self, fixed, bank, banned, queue, limit=2, node_budget=None,
+                   time_budget=None, work_budget=WORK_BUDGET):
+        # Общий вход для перебора: fixed - переменные с известными значениями (не из банка),
+        # banned - запрещённые значения переменных, queue - уравнения, с которых
+        # начинается распространение. Уравнения вне очереди проверяются, когда
+        # присваиваются их клетки, поэтому найденные решения всегда верны.
+        self.nodes = 0
+        self.work = 0
+        self._node_budget = node_budget
+        self._work_budget = work_budget
+        self._deadline = time.perf_counter() + time_budget if time_budget is not None else None
+        if len(self._memo) > self.MEMO_LIMIT:
+            self._memo.clear()
+        self._solutions = []
+        self._limit = limit
+        counts = Counter(bank)
+        values = set(counts)
+        domains = []
+        assignment = [None] * len(self.holes)
+        for var in range(len(self.holes)):
+            if var in fixed:
+                assignment[var] = fixed[var]
+                domains.append({fixed[var]})
+            elif var in banned:
+                domains.append(values - {banned[var]})
+            else:
+                domains.append(set(values))
+        try:
+            self._search(domains, assignment, counts, set(queue))
+        except SolutionLimitReached:
+            return SolveResult(self._solutions, self.nodes, False)
+        except BudgetExceeded:
+            return SolveResult(self._solutions, self.nodes, False, undecided=True)
+        return SolveResult(self._solutions, self.nodes, True)
+
+    def is_unique(self):
+        return self.solve(2).unique
+
+    def _assign(self, var, value, domains, assignment, counts, queue):
+        if counts[value] <= 0:
+            raise Contradiction()
+        counts[value] -= 1
+        assignment[var] = value
+        domains[var] = {value}
+        queue.update(self.var_eqs[var])
+
+    def _unknown(self, index, assignment):
+        return [var for var, _ in self.equations[index][1] if var >= 0 and assignment[var] is None]
+
+    def _cost(self, index, unknown, domains):
+        # Число наборов, которые придётся перебрать (одна клетка вычисляется, см. _plan)
+        if not unknown:
+            return 0
+        _, solved = self._plan(index, unknown)
+        cost = 1
+        for i, var in enumerate(unknown):
+            if i != solved:
+                cost *= len(domains[var])
+        return cost
+
+    def _plan(self, index, unknown):
+        # Какую неизвестную клетку уравнения не перебирать, а вычислять: результат,
+        # а если он известен - отдельное слагаемое (без '*'/'/' рядом), которое
+        # однозначно выражается через результат и остальные слагаемые.
+        # Возвращает (позиции неизвестных в slots, номер вычисляемой в unknown или None)
+        key = (index, tuple(unknown))
+        plan = self._plans.get(key)
+        if plan is not None:
+            return plan
+        _, slots, ops = self.equations[index]
+        positions = [k for k, (var, _) in enumerate(slots) if var >= 0 and var in unknown]
+        solved = None
+        if unknown and slots[-1][0] == unknown[-1]:
+            solved = len(unknown) - 1
+        else:
+            for i, k in enumerate(positions):
+                before = ops[k - 1] if k > 0 else '+'
+                after = ops[k] if k < len(ops) else '+'
+                if before in '+-' and after in '+-':
+                    solved = i
+                    break
+        plan = positions, solved
+        self._plans[key] = plan
+        return plan
+
+    def _spend(self, work):
+        # Учесть перебор наборов и проверить бюджет
+        self.work += work
+        if self._work_budget is not None and self.work > self._work_budget:
+            raise BudgetExceeded()
+        if self._deadline is not None and time.perf_counter() > self._deadline:
+            raise BudgetExceeded()
+
+    def _propagate(self, domains, assignment, counts, queue):
+        # Сначала дешёвые уравнения: они сужают домены перед дорогими.
+        # Уравнения, перебор которых больше SUPPORT_LIMIT, проверяются по границам.
+        while queue:
+            index = None
+            best = None
+            for i in queue:
+                unknown = self._unknown(i, assignment)
+                cost = self._cost(i, unknown, domains)
+                if best is None or cost < best:
+                    index, best, best_unknown = i, cost, unknown
+            queue.discard(index)
+            unknown = best_unknown
+            self._spend(len(queue) + 1)
+
+            options = tuple(frozenset(v for v in domains[var] if counts[v] > 0) for var in unknown)
+            if best > self.SUPPORT_LIMIT:
+                supports = self._bounds(index, unknown, options, assignment)
+            else:
+                supports = [set() for _ in unknown]
+                found = False
+                for combo in self._combos(index, unknown, options, assignment):
+                    if len(set(combo)) < len(combo) and any(combo.count(v) > counts[v] for v in combo):
+                        continue
+                    found = True
+                    for support, value in zip(supports, combo):
+                        support.add(value)
+                if not found:
+                    self._weights[index] += 1
+                    raise Contradiction()
+            if not all(supports):
+                self._weights[index] += 1
+                raise Contradiction()
+            for var, support in zip(unknown, supports):
+                if assignment[var] is not None or support == domains[var]:
+                    continue
+                if len(support) == 1:
+                    self._assign(var, next(iter(support)), domains, assignment, counts, queue)
+                else:
+                    domains[var] = support
+                    queue.update(i for i in self.var_eqs[var] if i != index)
+
+    def _combos(self, index, unknown, options, assignment):
+        # Верные наборы значений неизвестных клеток уравнения при данных доменах.
+        # Одна клетка не перебирается, а вычисляется (_plan); остальные перебираются
+        # по очереди, и ветка отсекается, как только интервал левой части при уже
+        # выбранных числах (lhs_interval) не пересекается с допустимым результатом.
+        # Одинаковые состояния уравнения повторяются в разных ветвях перебора,
+        # поэтому результат запоминается.
+        func, slots, ops = self.equations[index]
+        nums = [assignment[var] if var >= 0 else value for var, value in slots]
+        key = (index, tuple(nums), options)
+        combos = self._memo.get(key)
+        if combos is not None:
+            return combos
+        if not all(options):
+            self._memo[key] = []
+            return []
+        positions, solved = self._plan(index, unknown)
+        result_unknown = bool(unknown) and slots[-1][0] == unknown[-1]
+        if result_unknown:
+            target_lo, target_hi = min(options[-1]), max(options[-1])
+        else:
+            target_lo = target_hi = nums[-1]
+        order = [(i, k) for i, k in enumerate(positions) if i != solved]
+        lo = nums[:-1]
+        hi = nums[:-1]
+        for i, k in enumerate(positions):
+            if k < len(lo):
+                lo[k], hi[k] = min(options[i]), max(options[i])
+        # Интервалы верны только для положительных чисел
+        prune = len(order) > 1 and min(lo) >= 1 and target_lo >= 1
+        combo = [None] * len(unknown)
+        combos = []
+        visited = 0
+
+        def leaf():
+            if solved is None:
+                try:
+                    if func(nums[:-1]) == nums[-1]:
+                        combos.append(tuple(combo))
+                except ZeroDivisionError:
+                    pass
+                return
+            k = positions[solved]
+            if result_unknown:
+                try:
+                    value = func(nums[:-1])
+                except ZeroDivisionError:
+                    return
+            else:
+                # Отдельное слагаемое: левая часть = остальное + знак * значение
+                nums[k] = 0
+                try:
+                    rest = func(nums[:-1])
+                except ZeroDivisionError:
+                    return
+                value = nums[-1] - rest if k == 0 or ops[k - 1] == '+' else rest - nums[-1]
+            if value in options[solved]:
+                combo[solved] = value
+                combos.append(tuple(combo))
+
+        def walk(level):
+            nonlocal visited
+            if level == len(order):
+                leaf()
+                return
+            i, k = order[level]
+            check = prune and level < len(order) - 1 + (solved is not None)
+            saved = lo[k], hi[k]
+            for value in options[i]:
+                visited += 1
+                nums[k] = value
+                combo[i] = value
+                lo[k] = hi[k] = value
+                if check:
+                    low, high = lhs_interval(ops, lo, hi)
+                    if high < target_lo or low > target_hi:
+                        continue
+                walk(level + 1)
+            lo[k], hi[k] = saved
+
+        walk(0)
+        self._spend(visited + 1)
+        self._memo[key] = combos
+        return combos
+
+    def _bounds(self, index, unknown, options, assignment):
+        # Проверка по границам для уравнений, которые слишком дорого перебирать.
+        # Все числа положительны, поэтому каждое слагаемое монотонно по своим
+        # операндам и левая часть лежит в [lo, hi], посчитанных по границам доменов.
+        # Значение клетки остаётся, если при нём интервал левой части содержит
+        # допустимый результат.
+        # Пустой набор вариантов у клетки - противоречие (а не ValueError в min).
+        if not all(options):
+            raise Contradiction()
+        self._spend(sum(len(values) for values in options))
+        _, slots, ops = self.equations[index]
+        lo = []
+        hi = []
+        for var, value in slots[:-1]:
+            if var < 0 or assignment[var] is not None:
+                value = value if var < 0 else assignment[var]
+                lo.append(value)
+                hi.append(value)
+            else:
+                values = options[unknown.index(var)]
+                lo.append(min(values))
+                hi.append(max(values))
+        if min(lo) < 1:
+            return [set(values) for values in options]
+
+        result_var, result_value = slots[-1]
+        if result_var >= 0 and assignment[result_var] is None:
+            results = sorted(options[-1])
+        else:
+            results = [result_value if result_var < 0 else assignment[result_var]]
+
+        def fits(low, high):
+            k = bisect.bisect_left(results, low)
+            return k < len(results) and results[k] <= high
+
+        supports = []
+        for var, values in zip(unknown, options):
+            if var == result_var:
+                low, high = lhs_interval(ops, lo, hi)
+                supports.append({r for r in values if low <= r <= high})
+                continue
+            k = [i for i, (v, _) in enumerate(slots) if v == var][0]
+            saved = lo[k], hi[k]
+            support = set()
+            for value in values:
+                lo[k] = hi[k] = value
+                if fits(*lhs_interval(ops, lo, hi)):
+                    support.add(value)
+            lo[k], hi[k] = saved
+            supports.append(support)
+        return supports
+
+    def _cardinality(self, domains, assignment, counts):
+        # Значение с остатком count в банке должно попасть хотя бы в count пустых клеток.
+        # Если подходящих клеток ровно count, все они получают это значение.
+        support = {}
+        for var, value in enumerate(assignment):
+            if value is not None:
+                continue
+            available = [v for v in domains[var] if counts[v] > 0]
+            if not available:
+                raise Contradiction()
+            for v in available:
+                support.setdefault(v, []).append(var)
+        queue = set()
+        for value, count in list(counts.items()):
+            if count <= 0:
+                continue
+            cells = support.get(value, ())
+            if len(cells) < count:
+                raise Contradiction()
+            if len(cells) == count:
+                for var in cells:
+                    if assignment[var] is None:
+                        self._assign(var, value, domains, assignment, counts, queue)
+                    elif assignment[var] != value:
+                        raise Contradiction()
+        return queue
+
+    def _search(self, domains, assignment, counts, queue):
+        self.nodes += 1
+        if self._node_budget is not None and self.nodes > self._node_budget:
+            raise NodeBudgetExceeded()
+        self._spend(0)
+        try:
+            while queue:
+                self._propagate(domains, assignment, counts, queue)
+                queue = self._cardinality(domains, assignment, counts)
+        except Contradiction:
+            return
+
+        # Ветвление по клетке с наименьшим числом доступных значений или по числу
+        # банка с наименьшим числом подходящих клеток - где ветвей меньше. Ветви числа:
+        # оно в i-й подходящей клетке и не в предыдущих, поэтому решения не повторяются
+        best = None
+        best_values = None
+        cells = {}
+        for var, value in enumerate(assignment):
+            if value is not None:
+                continue
+            available = [v for v in domains[var] if counts[v] > 0]
+            for v in available:
+                cells.setdefault(v, []).append(var)
+            weight = sum(self._weights[i] for i in self.var_eqs[var])
+            if best is None or len(available) * best_weight < len(best_values) * weight:
+                best, best_values, best_weight = var, available, weight
+        if best is None:
+            self._solutions.append({pos: assignment[i] for i, pos in enumerate(self.holes)})
+            if len(self._solutions) >= self._limit:
+                raise SolutionLimitReached()
+            return
+        self._spend(len(self.holes))
+
+        value = min(cells, key=lambda v: (len(cells[v]), v)) if cells else None
+        if value is not None and len(cells[value]) < len(best_values):
+            candidates = cells[value]
+            for i, var in enumerate(candidates):
+                branch_domains = [set(d) for d in domains]
+                branch_assignment = list(assignment)
+                branch_counts = counts.copy()
+                branch_queue = set()
+                try:
+                    for other in candidates[:i]:
+                        branch_domains[other].discard(value)
+                        if not branch_domains[other]:
+                            raise Contradiction()
+                        branch_queue.update(self.var_eqs[other])
+                    self._assign(var, value, branch_domains, branch_assignment, branch_counts, branch_queue)
+                except Contradiction:
+                    continue
+                self._search(branch_domains, branch_assignment, branch_counts, branch_queue)
+            return
+
+        for value in sorted(best_values):
+            branch_domains = [set(d) for d in domains]
+            branch_assignment = list(assignment)
+            branch_counts = counts.copy()
+            branch_queue = set()
+            try:
+                self._assign(best, value, branch_domains, branch_assignment, branch_counts, branch_queue)
+            except Contradiction:
+                continue
+            self._search(branch_domains, branch_assignment, branch_counts, branch_queue)
+
+
+class HolePuncher:
+    # Пошаговое удаление чисел из решённой сетки с сохранением единственности решения.
+    # Решатель строится один раз: его переменные - все клетки с числами, оставленные
+    # числа передаются как известные. Если до удаления клетки x решение S было
+    # единственным, то другое решение после удаления обязано отличаться в x, поэтому
+    # проверка ищет одно решение с x != S[x] вместо полного подсчёта решений.
+    # Повторного распространения только по уравнениям клетки x здесь нет: каждая
+    # проверка - новый поиск от текущего набора пустых клеток (solve_from с запретом
+    # S[x]) с распространением по всем уравнениям. Домены принятого состояния после
+    # удаления x неверны (удаление расширяет домены, в банке появляется S[x]).
+    # Верная замена - домены, суженные один раз при всех пустых клетках, и очередь
+    # из var_eqs[x] - на expert давала около 25 узлов на проверку против 5-6 и вдвое
+    # большее время: банк связывает все пустые клетки, и без сужения доменов вдали
+    # от x перебор дольше.
+    # Между проверками хранятся только найденные другие решения (witnesses - клетки,
+    # где они отличаются от S): такое решение остаётся решением при любом наборе
+    # пустых клеток, который содержит его клетки, поэтому в следующих вариантах
+    # (variants) удаление отклоняется без поиска.
+    def __init__(self, grid, rng=random, node_budget=2000):
+        self.grid = grid
+        self.rng = rng
+        self.node_budget = node_budget
+        full = [[(None, 'empty_number') if cell and cell[1] == 'number' else cell for cell in row]
+                for row in grid.grid]
+        cells = [grid.grid[r][c][0] for r, row in enumerate(full) for c, cell in enumerate(row)
+                 if cell and cell[1] == 'empty_number']
+        self.solver = PuzzleSolver(grid.equations, full, cells)
+        self.solution = [grid.grid[r][c][0] for r, c in self.solver.holes]
+        self.witnesses = []   # множества клеток (переменных), где другие решения отличаются от S
+        self.checks = 0       # число проверок единственности (поисков)
+        self.reused = 0       # проверок, решённых по witnesses без поиска
+        self.nodes = 0        # суммарное число узлов перебора в проверках
+
+    def can_remove(self, holes, var):
+        # Останется ли решение единственным, если к пустым клеткам holes добавить var
+        for witness in self.witnesses:
+            if var in witness and all(v == var or v in holes for v in witness):
+                self.reused += 1
+                return False
+        fixed = {v: value for v, value in enumerate(self.solution) if v != var and v not in holes}
+        bank = [self.solution[v] for v in holes] + [self.solution[var]]
+        result = self.solver.solve_from(fixed, bank, {var: self.solution[var]}, range(len(self.solver.equations)),
+                                        limit=1, node_budget=self.node_budget)
+        self.checks += 1
+        self.nodes += result.nodes
+        if result.solutions:
+            other = result.solutions[0]
+            hole_index = self.solver.hole_index
+            self.witnesses.append(frozenset(hole_index[pos] for pos, value in other.items()
+                                            if value != self.solution[hole_index[pos]]))
+        return result.complete and not result.solutions
+
+    def punch(self, target_holes=None, target_score=None, score_fn=None):
+        # Удалять числа в случайном порядке, пропуская те, без которых решение
+        # перестаёт быть единственным. Остановка по числу пустых клеток или
+        # по оценке сложности score_fn(playable_grid, bank, equations) >= target_score.
+        # difficulty_score решает с бюджетом PuzzleSolver.solve по умолчанию и для
+        # неразрешённой в бюджет проверки даёт inf - удаление на этом останавливается.
+        # Возвращает (playable_grid, bank) как create_playable_state.
+        score_fn = score_fn or difficulty_score
+        order = list(range(len(self.solution)))
+        self.rng.shuffle(order)
+        holes = set()
+        for var in order:
+            if target_holes is not None and len(holes) >= target_holes:
+                break
+            if not self.can_remove(holes, var):
+                continue
+            holes.add(var)
+            if target_score is not None and score_fn(*self.playable(holes), self.grid.equations) >= target_score:
+                break
+        return self.playable(holes)
+
+    def playable(self, holes):
+        playable_grid = [list(row) for row in self.grid.grid]
+        for var in holes:
+            r, c = self.solver.holes[var]
+            playable_grid[r][c] = (None, 'empty_number')
+        return playable_grid, sorted(self.solution[var] for var in holes)
+
+    def variants(self, count, **kwargs):
+        # Несколько разных игровых состояний из одной решённой сетки
+        for _ in range(count):
+            yield self.punch(**kwargs)
+
+
+def difficulty_score(playable_grid, bank, equations):
+    # Оценка сложности: число пустых клеток плюс узлы перебора сверх первого,
+    # которые нужны решателю (головоломки, решаемые одним распространением, проще).
+    # Если решатель не уложился в бюджет, состояние сложнее любой цели: float('inf')
+    result = PuzzleSolver(equations, playable_grid, bank).solve(2)
+    if result.undecided:
+        return float('inf')
+    return len(bank) + result.nodes - 1
@@ -0,0 +1,14 @@
+from game_logic import BoardProfile, Equation, EquationSpace, EquationTable
+
+
+def test_large_products_fit_results():
+    # Произведения четырёх операндов до MAX_VALUE не помещаются в array('q'):
+    # такие уравнения отбрасываются при построении, а не ломают его
+    for ops in (('*',), ('+', '*')):
+        space = EquationSpace((ops, (4,), BoardProfile.MAX_VALUE), max_rows=2000)
+        table = space.tables[4]
+        assert len(table)
+        for row in range(len(table)):
+            equation = table.equation(row)
+            assert 0 < equation.result <= EquationTable.MAX_RESULT
+            assert Equation.evaluate_parts(equation.parts) == equation.result
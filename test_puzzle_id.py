@@ -0,0 +1,28 @@
+import random
+import time
+
+import pytest
+
+from puzzle_id import PuzzleId
+
+
+def snapshot(puzzle_id):
+    grid, playable_grid, bank = puzzle_id.generate()
+    holes = sorted((r, c) for r, row in enumerate(playable_grid) for c, cell in enumerate(row)
+                   if cell and cell[1] == 'empty_number')
+    return grid.grid, holes, bank
+
+
+@pytest.mark.parametrize('difficulty', ['hard', 'expert'])
+def test_regenerate_independent_of_clock(monkeypatch, difficulty):
+    # Головоломка по id не зависит от скорости машины: часы, идущие в 10^3 и 10^6
+    # раз быстрее (медленный или занятый процесс), дают те же сетку и пустые клетки
+    rng = random.Random(7)
+    ids = [PuzzleId.new(difficulty, rng) for _ in range(4)]
+    expected = [snapshot(puzzle_id) for puzzle_id in ids]
+    real = time.perf_counter
+    for speed in (1e3, 1e6):
+        start = real()
+        monkeypatch.setattr(time, 'perf_counter', lambda: start + (real() - start) * speed)
+        assert [snapshot(PuzzleId.from_hex(puzzle_id.hex())) for puzzle_id in ids] == expected
+        monkeypatch.setattr(time, 'perf_counter', real)
@@ -0,0 +1,45 @@
+import pytest
+
+from game_logic import CrossMathGrid, Equation
+from solver import PuzzleSolver, Contradiction
+
+
+def make_solver():
+    # 3 + 4 = 7, все числа убраны в банк
+    grid = CrossMathGrid(5)
+    grid.place_equation(Equation([3, '+', 4], 7), 0, 0, (0, 1))
+    playable = [[(None, 'empty_number') if cell and cell[1] == 'number' else cell for cell in row]
+                for row in grid.grid]
+    return PuzzleSolver(grid.equations, playable, [3, 4, 7])
+
+
+def test_bounds_empty_options_is_contradiction():
+    solver = make_solver()
+    unknown = [0, 1, 2]
+    options = (frozenset(), frozenset({4}), frozenset({7}))
+    with pytest.raises(Contradiction):
+        solver._bounds(0, unknown, options, [None, None, None])
+
+
+def test_solve_budget_returns_undecided():
+    result = make_solver().solve(2, work_budget=0)
+    assert result.undecided
+    assert not result.complete
+    assert not result.unique
+
+
+def test_solve_within_budget():
+    result = make_solver().solve(2)
+    assert not result.undecided
+    assert len(result.solutions) == 2  # 3 + 4 = 7 и 4 + 3 = 7
+
+
+def test_solve_known_result():
+    # Результат известен: одно слагаемое вычисляется, а не перебирается
+    grid = CrossMathGrid(5)
+    grid.place_equation(Equation([3, '+', 4], 7), 0, 0, (0, 1))
+    playable = [list(row) for row in grid.grid]
+    playable[0][0] = playable[0][2] = (None, 'empty_number')
+    result = PuzzleSolver(grid.equations, playable, [3, 4]).solve(3)
+    assert sorted(s[(0, 0)] for s in result.solutions) == [3, 4]
+    assert result.complete
@@ -1,6 +1,42 @@
+from bisect import bisect_left
+from collections import Counter
+
 from PyQt6.QtWidgets import QLabel, QFrame, QHBoxLayout, QWidget, QScrollArea, QGridLayout
-from PyQt6.QtCore import Qt, QMimeData, pyqtSignal, QTimer
-from PyQt6.QtGui import QDrag, QPixmap, QPainter, QColor, QFont
+from PyQt6.QtCore import Qt, QMimeData, pyqtSignal, QTimer, QRect, QSize
+from PyQt6.QtGui import QDrag, QPixmap, QPainter, QColor, QFont, QPen, QBrush
+
+STATIC_STYLE = """
+    QLabel {
+        background-color: #ddd;
+        border: 1px solid #999;
+        border-radius: 3px;
+        font-size: 14px;
+        font-weight: bold;
+        color: #000;
+    }
+"""
+
+INVALID_STYLE = """
+    QLabel {
+        background-color: #FFB6C1;
+        border: 2px solid #FF69B4;
+        border-radius: 5px;
+        font-size: 18px;
+        color: #000;
+        font-weight: bold;
+    }
+"""
+
+VALID_STYLE = """
+    QLabel {
+        background-color: #90EE90;
+        border: 2px solid #228B22;
+        border-radius: 5px;
+        font-size: 18px;
+        color: #000;
+        font-weight: bold;
+    }
+"""
 
 class DraggableLabel(QLabel):
     def __init__(self, text, parent=None):
@@ -19,9 +55,30 @@ class DraggableLabel(QLabel):
                 background-color: #45a049;
             }
         """)
+        # Бейдж с количеством одинаковых чисел в банке (виден при количестве > 1)
+        self.badge = QLabel(self)
+        self.badge.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.badge.setStyleSheet("""
+            QLabel {
+                background-color: #FF9800;
+                color: white;
+                border-radius: 7px;
+                font-weight: bold;
+                font-size: 10px;
+            }
+        """)
+        self.badge.setGeometry(24, 0, 16, 14)
+        self.badge.hide()
         self.show()
         self.drag_start_position = None
 
+    def set_count(self, count):
+        if count > 1:
+            self.badge.setText(str(count))
+            self.badge.show()
+        else:
+            self.badge.hide()
+
     def mousePressEvent(self, e):
         if e.button() == Qt.MouseButton.LeftButton:
             self.drag_start_position = e.position().toPoint()
@@ -49,8 +106,10 @@ class DraggableLabel(QLabel):
         drag.exec(Qt.DropAction.CopyAction)
 
 class DropCell(QLabel):
-    dropped = pyqtSignal(int, int, int, bool)
-    cleared = pyqtSignal(int)
+    # dropped(r, c, значение, r источника, c источника); источник (-1, -1) - банк чисел
+    dropped = pyqtSignal(int, int, int, int, int)
+    # cleared(r, c, значение) - значение ушло из клетки в банк
+    cleared = pyqtSignal(int, int, int)
 
     def __init__(self, r, c, parent=None):
         super().__init__(parent)
@@ -89,14 +148,30 @@ class DropCell(QLabel):
                 font-weight: bold;
             }
         """
-        self.setStyleSheet(self.default_style)
+        self.current_style = None
+        self.apply_style(self.default_style)
         self.current_value = None
         self.is_droppable = True
 
+    def apply_style(self, style):
+        # setStyleSheet заново разбирает стиль и перерисовывает клетку - только при смене
+        if style is not self.current_style:
+            self.current_style = style
+            self.setStyleSheet(style)
+
+    def setup(self, value=None):
+        # Подготовка клетки из пула к новой игре: value - статическое содержимое
+        # (оператор, равно или данное число) или None для пустой клетки
+        self.current_value = value
+        self.is_droppable = value is None
+        self.setAcceptDrops(value is None)
+        self.setText("" if value is None else str(value))
+        self.apply_style(self.default_style if value is None else STATIC_STYLE)
+
     def dragEnterEvent(self, e):
         if e.mimeData().hasText() and self.current_value is None:
             e.accept()
-            self.setStyleSheet(self.hover_style)
+            self.apply_style(self.hover_style)
         else:
             e.ignore()
 
@@ -109,9 +184,9 @@ class DropCell(QLabel):
 
     def dragLeaveEvent(self, e):
         if self.current_value is None:
-            self.setStyleSheet(self.default_style)
+            self.apply_style(self.default_style)
         else:
-            self.setStyleSheet(self.filled_style)
+            self.apply_style(self.filled_style)
 
     def mouseMoveEvent(self, e):
         if e.buttons() == Qt.MouseButton.LeftButton and self.current_value is not None and self.is_droppable:
@@ -125,16 +200,22 @@ class DropCell(QLabel):
             drag.setPixmap(pixmap)
             drag.setHotSpot(e.position().toPoint())
             
+            value = self.current_value
             action = drag.exec(Qt.DropAction.CopyAction)
             
             if action == Qt.DropAction.CopyAction:
                 self.reset()
+                # При переносе в другую клетку она сама сообщает об источнике,
+                # иначе число ушло в банк
+                if not isinstance(drag.target(), DropCell):
+                    self.cleared.emit(self.r, self.c, value)
 
     def mousePressEvent(self, e):
         if e.button() == Qt.MouseButton.RightButton:
             if self.current_value is not None and self.acceptDrops():
-                self.cleared.emit(self.current_value)
+                value = self.current_value
                 self.reset()
+                self.cleared.emit(self.r, self.c, value)
 
     def dropEvent(self, e):
         text = e.mimeData().text()
@@ -144,25 +225,336 @@ class DropCell(QLabel):
             e.ignore()
             return
 
-        # Если у нас уже есть значение, возвращаем его в банк
-        if self.current_value is not None:
-            old_val = self.current_value
-            QTimer.singleShot(0, lambda v=old_val: self.cleared.emit(v))
-            
+        # Прежнее значение клетки (если было) возвращает в банк GameSession
         self.setText(text)
         self.current_value = int(text)
-        self.setStyleSheet(self.filled_style)
+        self.apply_style(self.filled_style)
         e.setDropAction(Qt.DropAction.CopyAction)
         e.accept()
         
         val = self.current_value
-        from_bank = isinstance(e.source(), DraggableLabel)
-        QTimer.singleShot(0, lambda r=self.r, c=self.c, v=val, fb=from_bank: self.dropped.emit(r, c, v, fb))
+        source = e.source()
+        src_r, src_c = (source.r, source.c) if isinstance(source, DropCell) else (-1, -1)
+        QTimer.singleShot(0, lambda r=self.r, c=self.c, v=val, sr=src_r, sc=src_c: self.dropped.emit(r, c, v, sr, sc))
 
     def reset(self):
         self.setText("")
         self.current_value = None
-        self.setStyleSheet(self.default_style)
+        self.apply_style(self.default_style)
+
+class CellGrid(QWidget):
+    # Поле из отдельных DropCell - для небольших сеток.
+    # Интерфейс общий с BoardWidget: set_board, clear, value, set_status и сигналы клеток.
+    # Клетки не удаляются между играми: пул хранит клетку для каждой позиции,
+    # в новой игре она сбрасывается и подписывается заново, сигналы подключаются один раз.
+    dropped = pyqtSignal(int, int, int, int, int)
+    cleared = pyqtSignal(int, int, int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.grid_layout = QGridLayout(self)
+        self.grid_layout.setSpacing(4)
+        self.grid_layout.setContentsMargins(0, 0, 0, 0)
+        self.pool = {}   # Пул клеток: (r, c) -> DropCell
+        self.cells = {}  # Клетки текущей игры: (r, c) -> DropCell
+
+    def cell(self, r, c):
+        cell_widget = self.pool.get((r, c))
+        if cell_widget is None:
+            cell_widget = DropCell(r, c, self)
+            cell_widget.dropped.connect(self.dropped)
+            cell_widget.cleared.connect(self.cleared)
+            self.grid_layout.addWidget(cell_widget, r, c)
+            self.pool[(r, c)] = cell_widget
+        return cell_widget
+
+    def set_board(self, playable_grid):
+        old = self.cells
+        self.cells = {}
+        for r, row in enumerate(playable_grid):
+            for c, cell_data in enumerate(row):
+                if not cell_data:
+                    continue
+                val, type_ = cell_data
+                cell_widget = self.cell(r, c)
+                # Статическая часть (оператор, равно или данное число) или пустая клетка
+                cell_widget.setup(None if type_ == 'empty_number' else val)
+                self.cells[(r, c)] = cell_widget
+        # Клетки прошлой игры, которых нет в новой, прячутся; видимые не мигают
+        for pos, cell_widget in old.items():
+            if pos not in self.cells:
+                cell_widget.hide()
+        for cell_widget in self.cells.values():
+            if cell_widget.isHidden():
+                cell_widget.show()
+
+    def clear(self):
+        for cell_widget in self.cells.values():
+            cell_widget.hide()
+        self.cells = {}
+
+    def value(self, r, c):
+        return self.cells[(r, c)].current_value
+
+    def set_value(self, r, c, value):
+        # Значение из GameSession (отмена, повтор); стиль задаёт set_status
+        cell = self.cells[(r, c)]
+        cell.current_value = value
+        cell.setText("" if value is None else str(value))
+
+    def set_status(self, r, c, status):
+        cell = self.cells[(r, c)]
+        if cell.current_value is None:
+            cell.apply_style(cell.default_style)
+        elif status == 'invalid':
+            cell.apply_style(INVALID_STYLE)
+        elif status == 'valid':
+            cell.apply_style(VALID_STYLE)
+        else:
+            cell.apply_style(cell.filled_style)
+
+
+class BoardWidget(QWidget):
+    # Всё поле - один виджет, клетки рисуются в paintEvent.
+    # Для больших сеток (31x31 и больше) это тысячи QLabel со своими стилями меньше:
+    # клетка - это значение и состояние в словаре, кисти и перья создаются один раз
+    # на состояние, перерисовывается только прямоугольник изменившейся клетки,
+    # а клетка под курсором находится делением координаты на шаг сетки.
+    dropped = pyqtSignal(int, int, int, int, int)
+    cleared = pyqtSignal(int, int, int)
+
+    GAP = 4
+    # Состояние -> (фон, рамка, толщина рамки, пунктир, цвет текста)
+    STATES = {
+        'static': ('#ddd', '#999', 1, False, '#000'),
+        'empty': ('#f0f0f0', '#aaa', 2, True, '#333'),
+        'hover': ('#e0e0e0', '#4CAF50', 2, False, '#333'),
+        'filled': ('#fff', '#4CAF50', 2, False, '#333'),
+        'valid': ('#90EE90', '#228B22', 2, False, '#000'),
+        'invalid': ('#FFB6C1', '#FF69B4', 2, False, '#000'),
+    }
+
+    def __init__(self, parent=None, cell_size=40):
+        super().__init__(parent)
+        self.setAcceptDrops(True)
+        self.board_size = 0
+        self.cell_size = cell_size
+        self.values = {}     # (r, c) -> значение или None
+        self.static = set()  # клетки, которые нельзя менять
+        self.status = {}     # (r, c) -> None / 'valid' / 'invalid'
+        self.hover = None
+        self.drag_origin = None
+        self.drag_start_position = None
+        self.pens = {}
+        self.brushes = {}
+        for state, (background, border, width, dashed, _) in self.STATES.items():
+            pen = QPen(QColor(border), width)
+            if dashed:
+                pen.setStyle(Qt.PenStyle.DashLine)
+            self.pens[state] = pen
+            self.brushes[state] = QBrush(QColor(background))
+        self.text_pens = {state: QPen(QColor(colors[4])) for state, colors in self.STATES.items()}
+        self.cell_font = QFont()
+        self.cell_font.setBold(True)
+
+    def set_board(self, playable_grid, cell_size=None):
+        if cell_size is not None:
+            self.cell_size = cell_size
+        self.board_size = len(playable_grid)
+        self.values = {}
+        self.static = set()
+        self.status = {}
+        self.hover = None
+        for r, row in enumerate(playable_grid):
+            for c, cell_data in enumerate(row):
+                if not cell_data:
+                    continue
+                val, type_ = cell_data
+                if type_ == 'empty_number':
+                    self.values[(r, c)] = None
+                else:
+                    self.values[(r, c)] = val
+                    self.static.add((r, c))
+        self.cell_font.setPixelSize(max(8, self.cell_size * 7 // 20))
+        self.setFixedSize(self.sizeHint())
+        self.update()
+
+    def clear(self):
+        self.set_board([])
+
+    def sizeHint(self):
+        side = self.board_size * (self.cell_size + self.GAP) - self.GAP if self.board_size else 0
+        return QSize(side, side)
+
+    def value(self, r, c):
+        return self.values[(r, c)]
+
+    def set_value(self, r, c, value):
+        self.values[(r, c)] = value
+        self.update(self.cell_rect(r, c))
+
+    def set_status(self, r, c, status):
+        self.status[(r, c)] = status
+        self.update(self.cell_rect(r, c))
+
+    def cell_rect(self, r, c):
+        step = self.cell_size + self.GAP
+        return QRect(c * step, r * step, self.cell_size, self.cell_size)
+
+    def cell_at(self, pos):
+        # Клетка под точкой или None (промежутки между клетками и пустые места - None)
+        step = self.cell_size + self.GAP
+        x, y = int(pos.x()), int(pos.y())
+        if x < 0 or y < 0 or x % step >= self.cell_size or y % step >= self.cell_size:
+            return None
+        cell = (y // step, x // step)
+        return cell if cell in self.values else None
+
+    def cell_state(self, cell):
+        if cell in self.static:
+            return 'static'
+        if self.values[cell] is None:
+            return 'hover' if cell == self.hover else 'empty'
+        return self.status.get(cell) or 'filled'
+
+    def paint_cell(self, painter, cell, rect):
+        state = self.cell_state(cell)
+        painter.setPen(self.pens[state])
+        painter.setBrush(self.brushes[state])
+        painter.drawRoundedRect(rect.adjusted(1, 1, -1, -1), 3, 3)
+        value = self.values[cell]
+        if value is not None:
+            painter.setPen(self.text_pens[state])
+            painter.drawText(rect, Qt.AlignmentFlag.AlignCenter, str(value))
+
+    def paintEvent(self, e):
+        # Рисуются только клетки, попавшие в перерисовываемую область
+        if not self.board_size:
+            return
+        step = self.cell_size + self.GAP
+        area = e.rect()
+        r0, r1 = max(0, area.top() // step), min(self.board_size - 1, area.bottom() // step)
+        c0, c1 = max(0, area.left() // step), min(self.board_size - 1, area.right() // step)
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        painter.setFont(self.cell_font)
+        values = self.values
+        for r in range(r0, r1 + 1):
+            for c in range(c0, c1 + 1):
+                if (r, c) in values:
+                    self.paint_cell(painter, (r, c), self.cell_rect(r, c))
+        painter.end()
+
+    def set_hover(self, cell):
+        if cell == self.hover:
+            return
+        for old in (self.hover, cell):
+            if old is not None:
+                self.update(self.cell_rect(*old))
+        self.hover = cell
+
+    def can_drop(self, cell):
+        return cell is not None and cell not in self.static and self.values[cell] is None
+
+    def dragEnterEvent(self, e):
+        # Принимаем вход на всё поле, конкретная клетка проверяется в dragMoveEvent
+        if e.mimeData().hasText():
+            e.accept()
+        else:
+            e.ignore()
+
+    def dragMoveEvent(self, e):
+        cell = self.cell_at(e.position())
+        if e.mimeData().hasText() and self.can_drop(cell):
+            self.set_hover(cell)
+            e.setDropAction(Qt.DropAction.CopyAction)
+            e.accept()
+        else:
+            self.set_hover(None)
+            e.ignore()
+
+    def dragLeaveEvent(self, e):
+        self.set_hover(None)
+
+    def dropEvent(self, e):
+        self.set_hover(None)
+        cell = self.cell_at(e.position())
+        if not self.can_drop(cell):
+            e.ignore()
+            return
+        try:
+            val = int(e.mimeData().text())
+        except ValueError:
+            e.ignore()
+            return
+
+        if e.source() is self and self.drag_origin is not None:
+            # Перенос внутри поля: исходная клетка освобождается здесь
+            src_r, src_c = self.drag_origin
+            self.values[self.drag_origin] = None
+            self.status.pop(self.drag_origin, None)
+            self.update(self.cell_rect(src_r, src_c))
+        else:
+            src_r, src_c = -1, -1
+        self.values[cell] = val
+        self.status.pop(cell, None)
+        self.update(self.cell_rect(*cell))
+        e.setDropAction(Qt.DropAction.CopyAction)
+        e.accept()
+
+        r, c = cell
+        QTimer.singleShot(0, lambda: self.dropped.emit(r, c, val, src_r, src_c))
+
+    def mousePressEvent(self, e):
+        cell = self.cell_at(e.position())
+        if cell is None or cell in self.static or self.values[cell] is None:
+            self.drag_start_position = None
+            return
+        if e.button() == Qt.MouseButton.RightButton:
+            value = self.values[cell]
+            self.values[cell] = None
+            self.status.pop(cell, None)
+            self.update(self.cell_rect(*cell))
+            self.cleared.emit(cell[0], cell[1], value)
+        elif e.button() == Qt.MouseButton.LeftButton:
+            self.drag_start_position = e.position().toPoint()
+
+    def mouseMoveEvent(self, e):
+        if not (e.buttons() & Qt.MouseButton.LeftButton) or self.drag_start_position is None:
+            return
+        if (e.position().toPoint() - self.drag_start_position).manhattanLength() < 5:
+            return
+        cell = self.cell_at(self.drag_start_position)
+        self.drag_start_position = None
+        if cell is None or cell in self.static or self.values[cell] is None:
+            return
+
+        value = self.values[cell]
+        drag = QDrag(self)
+        mime = QMimeData()
+        mime.setText(str(value))
+        drag.setMimeData(mime)
+
+        rect = self.cell_rect(*cell)
+        pixmap = QPixmap(rect.size())
+        pixmap.fill(Qt.GlobalColor.transparent)
+        painter = QPainter(pixmap)
+        painter.setFont(self.cell_font)
+        self.paint_cell(painter, cell, QRect(0, 0, rect.width(), rect.height()))
+        painter.end()
+        drag.setPixmap(pixmap)
+        drag.setHotSpot(e.position().toPoint() - rect.topLeft())
+
+        self.drag_origin = cell
+        action = drag.exec(Qt.DropAction.CopyAction)
+        self.drag_origin = None
+        # Перенос в другую клетку поля уже обработан в dropEvent, иначе число ушло в банк
+        if action == Qt.DropAction.CopyAction and drag.target() is not self:
+            self.values[cell] = None
+            self.status.pop(cell, None)
+            self.update(rect)
+            self.cleared.emit(cell[0], cell[1], value)
+
 
 class NumberBank(QFrame):
     def __init__(self, parent=None):
@@ -171,7 +563,10 @@ class NumberBank(QFrame):
         self.layout = QGridLayout(self)
         self.layout.setAlignment(Qt.AlignmentFlag.AlignTop | Qt.AlignmentFlag.AlignLeft)
         self.layout.setSpacing(5)
-        self.numbers = []
+        # Мультимножество чисел: по одной фишке на значение, количество - на бейдже
+        self.counts = Counter()
+        self.values = []       # различные значения по возрастанию
+        self.chips = {}        # значение -> DraggableLabel
         self.widget_pool = []  # Пул переиспользуемых виджетов
         self.cols = 4  # Количество столбцов для сетки
         self.setAcceptDrops(True)
@@ -204,48 +599,76 @@ class NumberBank(QFrame):
             e.ignore()
 
     def dropEvent(self, e):
+        # Число из клетки возвращается в банк через сигнал cleared клетки-источника
         text = e.mimeData().text()
         try:
-            val = int(text)
-            self.add_number(val)
+            int(text)
             e.setDropAction(Qt.DropAction.CopyAction)
             e.accept()
         except ValueError:
             e.ignore()
 
+    @property
+    def numbers(self):
+        # Все числа банка с повторами, по возрастанию
+        return [value for value in self.values for _ in range(self.counts[value])]
+
     def set_numbers(self, numbers):
-        self.numbers = sorted(numbers)
+        self.counts = Counter(numbers)
+        self.values = sorted(self.counts)
         self.update_display()
 
     def update_display(self):
-        # Очистка макета (удаляем элементы, но не удаляем виджеты)
-        while self.layout.count():
-            self.layout.takeAt(0)
-        
-        # Убеждаемся, что пул достаточно велик
-        while len(self.widget_pool) < len(self.numbers):
-            self.widget_pool.append(DraggableLabel("", self))
-            
-        # Скрываем все виджеты в пуле изначально
-        for w in self.widget_pool:
-            w.hide()
-            
-        # Обновляем и размещаем необходимые виджеты
-        for i, num in enumerate(self.numbers):
-            w = self.widget_pool[i]
-            w.setText(str(num))
-            w.show()
-            
-            row = i // self.cols
-            col = i % self.cols
-            self.layout.addWidget(w, row, col)
+        # Полная перестройка - только при новой игре
+        for chip in self.chips.values():
+            self.layout.removeWidget(chip)
+            chip.hide()
+            self.widget_pool.append(chip)
+        self.chips = {}
+        for value in self.values:
+            self.chips[value] = self.take_chip(value)
+        self.place_chips(0)
+
+    def take_chip(self, value):
+        # Фишка из пула переиспользуемых виджетов
+        chip = self.widget_pool.pop() if self.widget_pool else DraggableLabel("", self)
+        chip.setText(str(value))
+        chip.set_count(self.counts[value])
+        chip.show()
+        return chip
+
+    def place_chips(self, start):
+        # Переставить фишки, начиная с позиции start; предыдущие остаются на местах
+        for i in range(start, len(self.values)):
+            chip = self.chips[self.values[i]]
+            self.layout.removeWidget(chip)
+            self.layout.addWidget(chip, i // self.cols, i % self.cols)
 
     def remove_number(self, val):
-        if val in self.numbers:
-            self.numbers.remove(val)
-            self.update_display()
-    
+        count = self.counts.get(val, 0)
+        if not count:
+            return
+        if count > 1:
+            # Меняется только бейдж фишки
+            self.counts[val] = count - 1
+            self.chips[val].set_count(count - 1)
+            return
+        del self.counts[val]
+        i = bisect_left(self.values, val)
+        del self.values[i]
+        chip = self.chips.pop(val)
+        self.layout.removeWidget(chip)
+        chip.hide()
+        self.widget_pool.append(chip)
+        self.place_chips(i)
+
     def add_number(self, val):
-        self.numbers.append(val)
-        self.numbers.sort()
-        self.update_display()
+        count = self.counts.get(val, 0)
+        self.counts[val] = count + 1
+        if count:
+            self.chips[val].set_count(count + 1)
+            return
+        i = bisect_left(self.values, val)
+        self.values.insert(i, val)
+        self.chips[val] = self.take_chip(val)
+        self.place_chips(i)